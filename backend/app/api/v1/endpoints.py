@@ -1,8 +1,9 @@
 from fastapi import APIRouter
-from . import speech, transactions, reports
+from . import speech, transactions, reports, system
 
 router = APIRouter()
 
 router.include_router(speech.router, prefix="/speech", tags=["speech"])
 router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
 router.include_router(reports.router, prefix="/reports", tags=["reports"])
+router.include_router(system.router, prefix="/system", tags=["system"])
\ No newline at end of file
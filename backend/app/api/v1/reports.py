@@ -1,175 +1,456 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
 from sqlalchemy import text
-from db.db import get_db
-from schemas.schemas import TransactionRequest, MonthlyTransaction
-from datetime import datetime
-from collections import defaultdict
+from db.db import get_db, SessionLocal
+from core.executor import run_blocking
+from core.config import settings
+from core.admission import admission
+from core.versioning import sales_version
+from services.catalog import catalog_fingerprint
+from services.transcript import get_catalog
+from services.events import broker, dashboard_channel
+from services.archive import lookup_transcript
+from services.export import EXPORTS, MEDIA_TYPES, export_stream, parquet_available
+from schemas.schemas import (
+    MonthlyTransactionResponse, TransactionSummaryResponse, SaleOut, TransactionHistoryResponse,
+)
+from datetime import datetime, date, timedelta
+from typing import List, Optional
+from functools import lru_cache
+import base64
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def _report_lane(umkm_id: str = Query(..., description="ID UMKM")):
+    # Priority lane: reports never wait behind audio uploads, they only
+    # have a per-UMKM rate (429 with Retry-After when it is exceeded)
+    await admission.check("reports", umkm_id)
+
 
 router = APIRouter()
 
-@router.get("/monthly_transaction")
-async def get_monthly_transaction(
-    umkm_id: str = Query(..., description="ID UMKM"),
-    db: Session = Depends(get_db)):
+def _month_bounds(day: date):
+    """
+    [first day of the month, first day of next month) for range predicates.
+    """
+    start = day.replace(day=1)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+_LAST_SALE_ID = text("SELECT MAX(sale_id) FROM sales WHERE umkm_id = :umkm_id")
+
+
+def _data_version(db: Session, umkm_id) -> str:
+    """
+    What a UMKM's reports are computed from, read from the database so
+    every worker agrees on it, before and after a restart: the newest sale
+    id (sale ids only grow, backdated imports included) and the catalog
+    the item names come from.
     """
-    API to get monthly transaction based on the umkm id
+    last_sale_id = db.execute(_LAST_SALE_ID, {"umkm_id": umkm_id}).scalar() or 0
+    return f"{last_sale_id}.{catalog_fingerprint(get_catalog(int(umkm_id), db))}"
+
+
+def _report_etag(request: Request, db: Session, umkm_id) -> str:
     """
-    print(umkm_id)
-    now = datetime.utcnow()
-    year = now.year
-    month = now.month
+    A report only changes with its data version or when the day rolls over
+    for the "today" and "this month" defaults. Weak, since compression
+    changes the bytes.
+    """
+    raw = "|".join((
+        request.url.path,
+        request.url.query,
+        _data_version(db, umkm_id),
+        datetime.utcnow().date().isoformat(),
+    ))
+    return 'W/"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def _report_response(request: Request, db: Session, umkm_id, model, build):
+    """
+    build() validated against `model` (the route's response_model, which
+    FastAPI doesn't apply to a returned Response) and serialized by
+    pydantic-core under an ETag. A client that already holds this version
+    gets a 304 without the query or the serialization. The version is read
+    before build() runs, so a sale landing in between only makes the tag
+    older than the body, never newer.
+    """
+    etag = _report_etag(request, db, umkm_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    adapter = _adapter(model)
+    return Response(adapter.dump_json(adapter.validate_python(build())), media_type="application/json", headers=headers)
+
+
+def _monthly_transaction(db: Session, umkm_id, year: Optional[int] = None, month: Optional[int] = None) -> dict:
+    today = datetime.utcnow().date()
+    month_start, next_month = _month_bounds(date(year or today.year, month or today.month, 1))
     try:
         result = db.execute(
             text("""
-                SELECT CAST(sale_date AS DATE) AS day,
-                       SUM(total_amount) AS total_amount
-                FROM sales
+                SELECT day AS date, CAST(total_amount AS DOUBLE PRECISION) AS total_amount
+                FROM daily_sales_rollup
                 WHERE umkm_id = :umkm_id
-                AND EXTRACT(YEAR FROM sale_date) = :year
-                AND EXTRACT(MONTH FROM sale_date) = :month
-                GROUP BY day
+                AND day >= :month_start
+                AND day < :next_month
                 ORDER BY day DESC
             """),
             {
                 "umkm_id": umkm_id,
-                "year": year,
-                "month": month
+                "month_start": month_start,
+                "next_month": next_month
             }
-        ).fetchall()
+        ).mappings().all()
     except Exception as e:
-        print(f"DB ERROR: {e}")
+        logger.error("DB ERROR: %s", e)
         raise
-    
-    
-    rows = [{"date": str(r[0]), "total_amount": float(r[1])} for r in result]
-    
+
     return {
         "umkm_id": umkm_id,
-        "data": rows
+        "data": [dict(row) for row in result]
     }
 
-@router.get("/transaction_summary")
-async def get_dashboard_summary(
+@router.get("/monthly_transaction", response_model=MonthlyTransactionResponse, dependencies=[Depends(_report_lane)])
+def get_monthly_transaction(
+    request: Request,
     umkm_id: str = Query(..., description="ID UMKM"),
+    year: Optional[int] = Query(None, ge=2000, le=9999, description="default: bulan ini"),
+    month: Optional[int] = Query(None, ge=1, le=12),
     db: Session = Depends(get_db)):
     """
-    Endopoint to get daily and monthly transaction summary
+    API to get monthly transaction based on the umkm id, for the current
+    month unless year/month are given
     """
+    return _report_response(request, db, umkm_id, MonthlyTransactionResponse,
+                            lambda: _monthly_transaction(db, umkm_id, year, month))
 
-    now = datetime.utcnow()
-    current_date = now.date()
-    current_year = now.year
-    current_month = now.month
 
-    try:
-        # Query 1: total penjualan & jumlah transaksi hari ini
-        daily_result = db.execute(
-            text("""
-                SELECT 
-                    COALESCE(SUM(total_amount), 0) AS total_sales,
-                    COUNT(*) AS total_transactions
-                FROM sales
-                WHERE umkm_id = :umkm_id
-                AND CAST(sale_date AS DATE) = :current_date
-            """),
-            {
-                "umkm_id": umkm_id,
-                "current_date": current_date
-            }
-        ).fetchone()
+def _dashboard_summary(db: Session, umkm_id) -> dict:
+    current_date = datetime.utcnow().date()
+    month_start, next_month = _month_bounds(current_date)
 
-        # Query 2: total penjualan & jumlah transaksi bulan ini
-        monthly_result = db.execute(
+    try:
+        # Penjualan & jumlah transaksi hari ini dan bulan ini, dari rollup harian
+        result = db.execute(
             text("""
                 SELECT 
-                    COALESCE(SUM(total_amount), 0) AS total_sales,
-                    COUNT(*) AS total_transactions
-                FROM sales
+                    COALESCE(SUM(total_amount) FILTER (WHERE day = :current_date), 0) AS daily_sales,
+                    COALESCE(SUM(transaction_count) FILTER (WHERE day = :current_date), 0) AS daily_transactions,
+                    COALESCE(SUM(total_amount), 0) AS monthly_sales,
+                    COALESCE(SUM(transaction_count), 0) AS monthly_transactions
+                FROM daily_sales_rollup
                 WHERE umkm_id = :umkm_id
-                AND EXTRACT(YEAR FROM sale_date) = :year
-                AND EXTRACT(MONTH FROM sale_date) = :month
+                AND day >= :month_start
+                AND day < :next_month
             """),
             {
                 "umkm_id": umkm_id,
-                "year": current_year,
-                "month": current_month
+                "current_date": current_date,
+                "month_start": month_start,
+                "next_month": next_month
             }
         ).fetchone()
 
     except Exception as e:
-        print(f"DB ERROR: {e}")
+        logger.error("DB ERROR: %s", e)
         raise
 
     return {
         "umkm_id": umkm_id,
         "daily": {
-            "total_sales": float(daily_result.total_sales),
-            "total_transactions": daily_result.total_transactions,
+            "total_sales": float(result.daily_sales),
+            "total_transactions": int(result.daily_transactions),
         },
         "monthly": {
-            "total_sales": float(monthly_result.total_sales),
-            "total_transactions": monthly_result.total_transactions,
+            "total_sales": float(result.monthly_sales),
+            "total_transactions": int(result.monthly_transactions),
         }
     }
 
-@router.get("/last_transaction")
-async def get_last_transaction(
+@router.get("/transaction_summary", response_model=TransactionSummaryResponse, dependencies=[Depends(_report_lane)])
+def get_dashboard_summary(
+    request: Request,
+    umkm_id: str = Query(..., description="ID UMKM"),
+    db: Session = Depends(get_db)):
+    """
+    Endopoint to get daily and monthly transaction summary
+    """
+    return _report_response(request, db, umkm_id, TransactionSummaryResponse, lambda: _dashboard_summary(db, umkm_id))
+
+def _encode_cursor(sale_date: datetime, sale_id: int) -> str:
+    raw = json.dumps([sale_date.isoformat(), sale_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sale_date, sale_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sale_date), int(sale_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _fetch_sales_page(
+    db: Session,
+    umkm_id,
+    limit: int,
+    cursor: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product_id: Optional[int] = None,
+):
+    """
+    One page of sales, newest first, each with its items aggregated in SQL.
+
+    Keyset pagination on (sale_date, sale_id) walks the
+    ix_sales_umkm_date_id index from the cursor, so a deep page costs the
+    same as the first one, and the LATERAL json_agg only runs for the rows
+    on the page.
+    """
+    conditions = ["s.umkm_id = :umkm_id"]
+    params = {"umkm_id": umkm_id, "limit": limit + 1}
+    if cursor:
+        params["cursor_date"], params["cursor_id"] = _decode_cursor(cursor)
+        conditions.append("(s.sale_date, s.sale_id) < (:cursor_date, :cursor_id)")
+    if start_date:
+        params["start_date"] = start_date
+        conditions.append("s.sale_date >= :start_date")
+    if end_date:
+        params["end_before"] = end_date + timedelta(days=1)
+        conditions.append("s.sale_date < :end_before")
+    if product_id is not None:
+        params["product_id"] = product_id
+        conditions.append("""EXISTS (
+            SELECT 1 FROM sales_items f
+            WHERE f.sale_id = s.sale_id AND f.product_id = :product_id
+        )""")
+
+    rows = db.execute(
+        text(f"""
+            SELECT s.sale_id, s.sale_date, s.status,
+                   CAST(s.total_amount AS DOUBLE PRECISION) AS total_amount,
+                   COALESCE(i.items, '[]'::json) AS items
+            FROM sales s
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object(
+                    'product_id', si.product_id,
+                    'name', p.name,
+                    'quantity', si.quantity,
+                    'unit_price', si.unit_price
+                ) ORDER BY si.sale_item_id) AS items
+                FROM sales_items si
+                LEFT JOIN products p ON p.product_id = si.product_id
+                WHERE si.sale_id = s.sale_id
+            ) i ON TRUE
+            WHERE {" AND ".join(conditions)}
+            ORDER BY s.sale_date DESC, s.sale_id DESC
+            LIMIT :limit
+        """),
+        params
+    ).mappings().all()
+
+    page = rows[:limit]
+    transactions = [dict(row) for row in page]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_cursor(last["sale_date"], last["sale_id"])
+    return transactions, next_cursor
+
+
+@router.get("/last_transaction", response_model=List[SaleOut], dependencies=[Depends(_report_lane)])
+def get_last_transaction(
+    request: Request,
     umkm_id: str = Query(..., description="ID UMKM"),
     db: Session = Depends(get_db)):
     """
     API to get top 5 transaction based on the umkm id
     """
     try:
-        result = db.execute(
-            text("""
-                SELECT 
-                    s.sale_id, s.sale_date, s.status, s.total_amount,
-                    p.product_id, p.name as product_name, p.category,
-                    si.quantity, si.unit_price
-                FROM sales s
-                LEFT JOIN sales_items si ON s.sale_id = si.sale_id
-                LEFT JOIN products p ON si.product_id = p.product_id
-                WHERE s.umkm_id = :umkm_id
-                ORDER BY s.sale_date DESC, s.sale_id DESC
-
-                LIMIT 5
-            """),
-            {"umkm_id": umkm_id}
-        ).mappings().all()
-        print(result)
-        # Organize data per sale_id
-
-        transactions = defaultdict(lambda: {
-            "sale_id": None,
-            "sale_date": None,
-            "status": None,
-            "total_amount": None,
-            "items": []
-        })
-        
-        for row in result:
-            sale_id = row["sale_id"]
-            if transactions[sale_id]["sale_id"] is None:
-                transactions[sale_id].update({
-                    "sale_id": sale_id,
-                    "sale_date": row["sale_date"],
-                    "status": row["status"],
-                    "total_amount": float(row["total_amount"]),
-                    "items": []
-                })
-
-            if row["product_id"] is not None:
-                transactions[sale_id]["items"].append({
-                    "product_id": row["product_id"],
-                    "name": row["product_name"],
-                    "quantity": row["quantity"],
-                    "unit_price": float(row["unit_price"])
-                })
-        
-        print(f"Transactions: {list(transactions.values())}")
-
-        return list(transactions.values())
+        return _report_response(request, db, umkm_id, List[SaleOut],
+                                lambda: _fetch_sales_page(db, umkm_id, limit=5)[0])
 
     except Exception as e:
-        return {"error": str(e)}
+        return ORJSONResponse({"error": str(e)})
+
+
+@router.get("/transactions", response_model=TransactionHistoryResponse, dependencies=[Depends(_report_lane)])
+def get_transaction_history(
+    request: Request,
+    umkm_id: str = Query(..., description="ID UMKM"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor dari halaman sebelumnya"),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    product_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db)):
+    """
+    Transaction history, newest first, with cursor pagination.
+    Pass `next_cursor` back as `cursor` to get the next page.
+    """
+    def build():
+        try:
+            transactions, next_cursor = _fetch_sales_page(
+                db, umkm_id, limit, cursor, start_date, end_date, product_id
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("DB ERROR: %s", e)
+            raise
+
+        return {
+            "umkm_id": umkm_id,
+            "data": transactions,
+            "next_cursor": next_cursor
+        }
+
+    return _report_response(request, db, umkm_id, TransactionHistoryResponse, build)
+
+
+@router.get("/transactions/{sale_id}/transcript", dependencies=[Depends(_report_lane)])
+def get_sale_transcript(
+    sale_id: int,
+    umkm_id: int = Query(..., description="ID UMKM"),
+    db: Session = Depends(get_db)):
+    """
+    The voice note transcript of one sale. Transcripts of old sales are
+    read from the compressed archive (`archived: true`).
+    """
+    found = lookup_transcript(db, "sale", umkm_id, sale_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return {"sale_id": sale_id, **found}
+
+
+@router.get("/export", dependencies=[Depends(_report_lane)])
+def export_report(
+    request: Request,
+    umkm_id: int = Query(..., description="ID UMKM"),
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    group_by: str = Query("day", description="day, week, month, product atau sale"),
+    format: str = Query("csv", description="csv atau parquet"),
+    gzip: bool = Query(False),
+    db: Session = Depends(get_db)):
+    """
+    Download sales for any date range (both ends inclusive) as CSV or
+    Parquet, optionally gzipped. The file is streamed while it is read from
+    the database; identical exports are served from cache, or answered with
+    304 Not Modified for a matching If-None-Match, until the next
+    transaction is recorded.
+    """
+    if group_by not in EXPORTS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(EXPORTS)}")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(MEDIA_TYPES)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+
+    etag = _report_etag(request, db, umkm_id)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    filename = f"sales_{umkm_id}_{group_by}_{start_date}_{end_date}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stream(umkm_id, group_by, start_date, end_date, format, gzip, etag),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "ETag": etag},
+    )
+
+
+def _live_snapshot(umkm_id: int) -> dict:
+    with SessionLocal() as db:
+        # Version first: an event with a higher version may or may not be in
+        # the numbers below, one with this version or lower certainly is
+        version = sales_version(umkm_id)
+        summary = _dashboard_summary(db, umkm_id)
+        daily_sales = _monthly_transaction(db, umkm_id)["data"]
+        recent, _ = _fetch_sales_page(db, umkm_id, limit=5)
+    return {
+        "type": "snapshot",
+        "version": version,
+        "summary": summary,
+        "daily_sales": daily_sales,
+        "last_transactions": recent,
+    }
+
+
+async def _live_events(umkm_id: int):
+    """
+    A snapshot, then the deltas committed after it. Yields None when there
+    was nothing to send for LIVE_KEEPALIVE_SECONDS.
+    """
+    with broker.subscribe(dashboard_channel(umkm_id)) as subscription:
+        # Subscribed before the snapshot, so nothing committed in between is lost
+        snapshot = await run_blocking(_live_snapshot, umkm_id)
+        yield snapshot
+        while True:
+            event = await subscription.next(timeout=settings.LIVE_KEEPALIVE_SECONDS)
+            if event is None:
+                yield None
+                continue
+            if event.get("version") is not None and event["version"] <= snapshot["version"]:
+                continue
+            if event["type"] == "resync":
+                snapshot = await run_blocking(_live_snapshot, umkm_id)
+                yield snapshot
+                continue
+            yield event
+
+
+@router.get("/live", dependencies=[Depends(_report_lane)])
+async def live_dashboard(umkm_id: int = Query(..., description="ID UMKM")):
+    """
+    Server-sent events for the dashboard, replacing polling of
+    transaction_summary, monthly_transaction and last_transaction: one
+    "snapshot" event, then a "sale" event (totals delta + the new row) or
+    "purchase" event per committed transaction. On "snapshot" the client
+    replaces its state.
+    """
+    async def stream():
+        async for event in _live_events(umkm_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/ws/live")
+async def websocket_live_dashboard(websocket: WebSocket, umkm_id: int):
+    """
+    Same events as /live over a WebSocket.
+    """
+    await websocket.accept()
+    try:
+        async for event in _live_events(umkm_id):
+            # keepalives also surface a closed socket, which only a send notices
+            await websocket.send_text(json.dumps(event or {"type": "keepalive"}, default=str))
+    except WebSocketDisconnect:
+        pass
@@ -1,38 +1,84 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket
-from services.speech import speech_to_text 
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from services.speech import speech_to_text_async, stream_speech_to_text, build_streaming_config
+from services.audio import AudioRejected
+from core.resilience import CircuitOpen
+from core.admission import admission, AdmissionRejected
+from core.config import settings
 import asyncio
+import math
 
 router = APIRouter()
 
 @router.post("/speech-to-text")
-async def transcribe_audio(audio: UploadFile = File(...)):
+async def transcribe_audio(audio: UploadFile = File(...), umkm_id: int = 1):
     """
     Endpoint to handle speech-to-text conversion.
     """
     if not audio:
         raise HTTPException(status_code=400, detail="No audio file uploaded")
 
-    audio_bytes = await audio.read()
     try:
-        transcript = speech_to_text(audio_bytes)
+        async with admission.slot("heavy", umkm_id):
+            audio_bytes = await audio.read()
+            async with admission.slot("speech", umkm_id):
+                transcript = await speech_to_text_async(audio_bytes)
         return {"transcript": transcript}
+    except AdmissionRejected:
+        raise
+    except AudioRejected as e:
+        raise HTTPException(status_code=422, detail=f"Audio preprocessing failed: {str(e)}")
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=f"Speech-to-text failed: {str(e)}",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Speech-to-text failed: {str(e)}")
 
 @router.websocket("/ws/speech-to-text")
-async def websocket_speech_to_text(websocket: WebSocket):
+async def websocket_speech_to_text(
+    websocket: WebSocket,
+    encoding: str = "WEBM_OPUS",
+    sample_rate_hertz: int = 48000):
     """
     WebSocket endpoint to handle real-time speech-to-text conversion.
+
+    Binary frames are audio chunks of one continuous stream; an empty frame
+    or the text frame "EOS" ends it. Interim and final results are pushed
+    back as JSON as soon as Google returns them.
     """
     await websocket.accept()
     try:
-        while True:
-            data = await websocket.receive_bytes()
-            if not data:
-                break
-            transcript = speech_to_text(data)
-            await websocket.send_text(transcript)
+        streaming_config = build_streaming_config(encoding, sample_rate_hertz)
+    except KeyError:
+        await websocket.close(code=1003, reason=f"Unsupported encoding: {encoding}")
+        return
+
+    # Bounded queue: when recognition falls behind, put() waits and we stop
+    # reading the socket, which pushes back on the client through TCP.
+    audio_queue = asyncio.Queue(maxsize=settings.STREAMING_QUEUE_SIZE)
+
+    async def pump_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data:
+                    # empty binary frame or a text frame ("EOS")
+                    break
+                await audio_queue.put(data)
+        finally:
+            await audio_queue.put(None)
+
+    pump_task = asyncio.create_task(pump_audio())
+    try:
+        async for result in stream_speech_to_text(audio_queue, streaming_config):
+            await websocket.send_json(result)
+        await websocket.send_json({"type": "end"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        await websocket.close(code=1000, reason=f"Error: {str(e)}")
+        await websocket.close(code=1011, reason=f"Error: {str(e)}")
     finally:
-        await websocket.close()
\ No newline at end of file
+        pump_task.cancel()
@@ -0,0 +1,47 @@
+from fastapi import APIRouter
+from services.catalog import catalog_cache
+from services.idempotency import draft_deduplicator, transcript_cache
+from services.export import export_cache
+from services.draft_store import draft_store
+from db.db import get_pool_stats
+from core.resilience import breaker_stats
+from core.admission import admission
+
+router = APIRouter()
+
+@router.get("/cache")
+def get_cache_stats():
+    """
+    Hit/miss counters of the in-process caches, for monitoring.
+    """
+    return {
+        "catalog": catalog_cache.stats(),
+        "draft_dedup": draft_deduplicator.stats(),
+        "transcript_results": transcript_cache.stats(),
+        "exports": export_cache.stats(),
+        "drafts": draft_store.stats(),
+    }
+
+@router.get("/db-pool")
+def get_db_pool_stats():
+    """
+    Connection pool usage: checked-out connections, overflow and how long
+    requests waited for a connection.
+    """
+    return get_pool_stats()
+
+@router.get("/upstreams")
+def get_upstream_stats():
+    """
+    Circuit breaker state per upstream (Speech, OpenAI): "closed" is
+    healthy, "open" means calls currently fail fast for `retry_after` seconds.
+    """
+    return breaker_stats()
+
+@router.get("/admission")
+def get_admission_stats():
+    """
+    Fair queue usage per lane: slots in use out of `capacity`, calls
+    waiting and how many UMKMs they belong to.
+    """
+    return admission.stats()
@@ -1,77 +1,234 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from typing import List, Optional
+import json
+import math
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from db.db import get_db
-from schemas.schemas import TransactionFromLLM, TransactionRequest, PrepareTranscriptRequest, ParseTranscriptRequest
-from services.transaction import create_transaction_from_llm
-from services.transcript import prepare_transcript_service
-from services.llm import parse_transcript_with_llm
-from sqlalchemy import text
-from services.speech import speech_to_text
+from schemas.schemas import TransactionFromLLM, DraftConfirmRequest
+from services.transaction import create_transaction_from_llm, IdempotencyConflict
+from services.draft import generate_draft_from_audio, DraftPipelineError
+from services.draft_store import draft_store, check_against_catalog, DraftNotFound, DraftInvalid
+from services.idempotency import draft_deduplicator, request_key
+from services.jobs import job_runner, JobQueueFull
+from services.bulk import import_audio, import_csv, BulkImportError
+from core.executor import run_blocking
+from core.admission import admission
+from core.metrics import stage_timer
+from core.config import settings
 
 router = APIRouter( tags=["transactions"])
 
+
+async def _generate_and_store(audio_bytes: bytes, umkm_id: int) -> dict:
+    result = await generate_draft_from_audio(audio_bytes, umkm_id)
+    return {**result, "draft": await draft_store.save(umkm_id, result)}
+
 @router.post("/generate-draft", summary="generate draft transaction from audio")
 async def generate_draft(
     audio: UploadFile = File(...), 
-    db: Session = Depends(get_db),
-    umkm_id: int = 1):
+    umkm_id: int = 1,
+    idempotency_key: Optional[str] = Header(None)):
     """
     Endpoint to process audio file and create transaction.
+
+    The draft is also kept on the server, resolved against the catalog:
+    confirm it with POST /drafts/{draft_id}/confirm.
+
+    Retries (same Idempotency-Key header, or byte-identical audio) join the
+    request already in flight or get its cached result instead of paying
+    for Speech-to-Text and the LLM again. Busy UMKMs get 429 with
+    Retry-After (see core/admission.py).
     """
     if not audio:
         raise HTTPException(status_code=400, detail="No audio file uploaded")
 
-    audio_bytes = await audio.read()
-    # Step 1: Speech to text
     try:
-        transcript = speech_to_text(audio_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Speech-to-text failed: {str(e)}")
+        async with admission.slot("heavy", umkm_id):
+            with stage_timer("upload_read"):
+                audio_bytes = await audio.read()
+            result, deduplicated = await draft_deduplicator.run(
+                request_key(umkm_id, idempotency_key, audio_bytes),
+                lambda: _generate_and_store(audio_bytes, umkm_id),
+            )
+    except DraftPipelineError as e:
+        retry_after = getattr(e.error, "retry_after", None)
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+        raise HTTPException(status_code=e.status_code, detail=f"{e.stage} failed: {str(e.error)}", headers=headers)
+
+    return {
+        "message": "Draft transaction generated successfully",
+        "draft_id": result["draft"]["draft_id"],
+        "draft": result["draft"],
+        "draft_transaction": result["draft_transaction"],
+        "transcript": result["transcript"],
+        "parsed_by": result["parsed_by"],
+        "deduplicated": deduplicated
+    }
+    
+
+
+@router.post("/jobs", status_code=202, summary="queue draft generation from audio")
+async def submit_draft_job(
+    audio: UploadFile = File(...),
+    umkm_id: int = 1):
+    """
+    Queue the audio for draft generation and return a job id right away.
+    Poll GET /jobs/{job_id}, or follow /jobs/{job_id}/events (SSE) or the
+    /ws/jobs/{job_id} WebSocket for the result. A full queue answers 429
+    with a Retry-After.
+    """
+    if not audio:
+        raise HTTPException(status_code=400, detail="No audio file uploaded")
 
-    # Step 2: Prepare transcript
+    with stage_timer("upload_read"):
+        audio_bytes = await audio.read()
     try:
-        prep_req = PrepareTranscriptRequest(umkm_id=umkm_id, transcript=transcript)
-        print(f"Prepare request: {prep_req}")
-        prep_result = prepare_transcript_service(prep_req, db)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prepare transcript failed: {str(e)}")
+        job = await job_runner.submit(umkm_id, audio_bytes)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    return {
+        **job,
+        "status_url": f"jobs/{job['job_id']}",
+        "events_url": f"jobs/{job['job_id']}/events",
+    }
+
+
+@router.post("/bulk-import", summary="import a batch of voice notes or a CSV of transactions")
+async def bulk_import(
+    audio: List[UploadFile] = File(None),
+    csv_file: UploadFile = File(None),
+    umkm_id: int = 1,
+    confirm: bool = False):
+    """
+    Offline sync: upload many audio clips (drafted concurrently, and written
+    right away with confirm=true) or one CSV of transactions (always
+    written). Progress is streamed back as NDJSON, one event per line, with
+    a final {"type": "summary"} line.
+    """
+    if not audio and not csv_file:
+        raise HTTPException(status_code=400, detail="Upload audio clips or a CSV file")
+    if audio and len(audio) > settings.BULK_IMPORT_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_IMPORT_MAX_FILES} clips per import")
+
+    if csv_file:
+        with stage_timer("upload_read", pipeline="bulk"):
+            data = await csv_file.read()
+        events = import_csv(umkm_id, data)
+    else:
+        clips = [(clip.filename or f"clip-{n}", clip) for n, clip in enumerate(audio)]
+        events = import_audio(umkm_id, clips, confirm=confirm, limits=job_runner.limits)
+
+    async def ndjson():
+        try:
+            async for event in events:
+                yield json.dumps(event, default=str) + "\n"
+        except BulkImportError as e:
+            yield json.dumps({"type": "error", "stage": "import", "detail": str(e)}) + "\n"
 
-    # Step 3: Parse transcript with LLM
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/{job_id}", summary="draft job status and result")
+async def get_draft_job(job_id: str):
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events", summary="stream draft job updates (SSE)")
+async def stream_draft_job(job_id: str):
+    if await job_runner.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for job in job_runner.watch(job_id):
+            yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/ws/jobs/{job_id}")
+async def websocket_draft_job(websocket: WebSocket, job_id: str):
+    """
+    Push every status change of the job, then close when it finishes.
+    """
+    await websocket.accept()
     try:
-        parse_req = ParseTranscriptRequest(
-            umkm_id=prep_result["umkm_id"],
-            transcript=prep_result["transcript"],
-            product_list=prep_result["product_list"]
-        )
-        print(f"Parse request: {parse_req}")
-        parse_result = parse_transcript_with_llm(parse_req)  # Pastikan fungsi ini import dan tersedia
+        if await job_runner.get(job_id) is None:
+            await websocket.close(code=1008, reason="Job not found")
+            return
+        async for job in job_runner.watch(job_id):
+            await websocket.send_json(job)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.get("/drafts/{draft_id}", summary="stored draft transaction")
+def get_draft(draft_id: str, umkm_id: int):
+    try:
+        return draft_store.get(draft_id, umkm_id)
+    except DraftNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/drafts/{draft_id}/confirm", summary="confirm a stored draft")
+async def confirm_draft(
+    draft_id: str,
+    payload: DraftConfirmRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Write a draft kept by generate-draft, with optional item edits
+    ({"product_id", "quantity"}, plus "unit_price" on purchases; quantity 0
+    removes the product). Items are priced from the stored draft and the
+    catalog, not from the client. Confirming the same draft again returns
+    the first result with "replayed": true.
+    """
+    try:
+        return await run_blocking(draft_store.confirm, draft_id, payload.umkm_id, payload.edits, db)
+    except DraftNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DraftInvalid as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail=f"Draft {draft_id} was already confirmed with different edits")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Parse transcript failed: {str(e)}")
-    print(f"Draft transaction: {parse_result}")
+        raise HTTPException(status_code=500, detail=f"Transaction creation failed: {str(e)}")
 
-    # Step 4: Create transaction from parsed data
-    return {
-        "message": "Draft transaction generated successfully",
-        "draft_transaction": parse_result,
-        "transcript": transcript
-    }
-    
 
+def _confirm_checked(payload: TransactionFromLLM, db: Session, key: Optional[str]):
+    return create_transaction_from_llm(check_against_catalog(payload, db), db, key)
 
-@router.post("/confirm", summary="confirm transaction from LLM")
+
+@router.post("/confirm", summary="confirm transaction from LLM", deprecated=True)
 async def confirm_transaction(
     payload: TransactionFromLLM,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
-    Endpoint to confirm transaction from LLM.
+    Endpoint to confirm transaction from LLM. Deprecated in favour of
+    POST /drafts/{draft_id}/confirm, which sends no items back; the items
+    sent here are checked against the catalog (422 for unknown products)
+    and sales are priced from it, whatever unit_price says.
+
+    Send an Idempotency-Key header to make retries safe: a repeated key
+    returns the original result without inserting the sale again.
     """
     if not payload or not payload.items:
         raise HTTPException(status_code=400, detail="Invalid transaction data")
 
     try:
-        print(f"Creating transaction from payload: {payload}")
-        result = create_transaction_from_llm(payload, db)
+        key = f"{payload.umkm_id}:{idempotency_key}" if idempotency_key else None
+        result = await run_blocking(_confirm_checked, payload, db, key)
         return result
+    except DraftInvalid as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transaction creation failed: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""
+Per-UMKM admission control, so one tenant bulk-uploading voice notes
+can't take the Speech and OpenAI quota (or the worker) from everyone else.
+
+  * token buckets per (upstream, umkm_id) cap how fast one tenant may call
+    Speech-to-Text and the LLM. Interactive requests over their rate get
+    429 with Retry-After; bulk imports are paced instead (they sleep until
+    their tokens are there) and draft jobs are put back on the queue
+  * a global cap per upstream (FairLimiter) bounds concurrent calls; when
+    it is full, waiting calls are served by weighted fair queuing across
+    tenants, so a tenant with a hundred queued clips gets a slot in turn
+    with a tenant that has one, not after all hundred
+  * lanes for whole requests: "heavy" (generate-draft, speech-to-text) is
+    capped and fair queued per process as well, "reports" never queues and
+    only has a generous per-tenant rate, so dashboards stay responsive
+    while uploads wait
+
+Token buckets live in this process, or in Redis with ADMISSION_BACKEND_URL
+so every uvicorn worker draws from the same per-tenant rate. Concurrency
+caps are always per process; size them as the upstream quota divided by
+the number of workers.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+from core.config import settings
+from core.metrics import registry
+from core.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+admission_wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time spent waiting for rate limit tokens and fair queue slots", ("lane",),
+)
+admission_rejected_total = registry.counter(
+    "admission_rejected_total", "Requests and upstream calls turned away by admission control", ("lane", "reason"),
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    Over the tenant's rate or the queue is full; answer 429 and come back
+    after `retry_after` seconds.
+    """
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"{lane} is busy for this UMKM ({reason}), retry in {retry_after:.0f}s")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 429
+
+
+class InMemoryRateLimitBackend:
+    """
+    Token buckets inside this process; each uvicorn worker enforces the
+    rate on its own.
+    """
+    def __init__(self, max_keys: int = 10000, idle_ttl: float = 3600):
+        self._buckets = TTLCache(maxsize=max_keys, ttl=idle_ttl)
+
+    async def try_acquire(self, key: str, rate: float, capacity: float, amount: float = 1) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket.try_acquire(amount)
+
+
+# Same refill as TokenBucket, on Redis' clock so workers agree on time
+_TOKEN_BUCKET_LUA = """
+local rate, capacity, amount = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+local needed = math.min(amount, capacity)
+if tokens >= needed then tokens = tokens - amount else wait = (needed - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets in Redis, shared by every worker: one hash per bucket,
+    refilled and drawn from atomically in a Lua script.
+    """
+    def __init__(self, url: str, prefix: str = "ucap:ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("ADMISSION_BACKEND_URL is set but the `redis` package is not installed") from e
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_TOKEN_BUCKET_LUA)
+        self._prefix = prefix
+
+    async def try_acquire(self, key: str, rate: float, capacity: float, amount: float = 1) -> float:
+        wait = await self._script(keys=[self._prefix + key], args=[rate, capacity, amount])
+        return float(wait)
+
+
+def create_rate_limit_backend():
+    if settings.ADMISSION_BACKEND_URL:
+        return RedisRateLimitBackend(settings.ADMISSION_BACKEND_URL)
+    return InMemoryRateLimitBackend()
+
+
+class FairLimiter:
+    """
+    At most `capacity` holders at once. While it is full, waiters queue per
+    tenant and a freed slot goes to the tenant whose queue has the smallest
+    virtual finish tag; a tenant's tag advances by 1/weight per slot it
+    gets, so tenants share the slots in proportion to their weights no
+    matter how much each has queued. A tenant that was idle starts at the
+    current virtual time instead of cashing in its idle period.
+
+    Used from the event loop only, so no locking.
+    """
+    def __init__(self, lane: str, capacity: int, max_queue_per_tenant: int, max_wait: float, weights: dict):
+        self.lane = lane
+        self.capacity = capacity
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.max_wait = max_wait
+        self.weights = weights
+        self.active = 0
+        self._queues = {}
+        self._finish = {}
+        self._virtual = 0.0
+
+    def _weight(self, umkm_id) -> float:
+        return float(self.weights.get(str(umkm_id), self.weights.get(umkm_id, 1.0)))
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, umkm_id, patient: bool = False):
+        """
+        Wait for a slot. Interactive callers are turned away when their
+        tenant already has max_queue_per_tenant waiting, or after max_wait;
+        `patient` (batch) callers wait as long as it takes.
+        """
+        if self.active < self.capacity and not self._queues:
+            self.active += 1
+            return
+        queue = self._queues.get(umkm_id)
+        if not patient and queue is not None and len(queue) >= self.max_queue_per_tenant:
+            admission_rejected_total.inc(lane=self.lane, reason="queue_full")
+            raise AdmissionRejected(self.lane, "queue full", self.max_wait)
+        if queue is None:
+            queue = self._queues[umkm_id] = deque()
+            self._finish[umkm_id] = max(self._finish.get(umkm_id, 0.0), self._virtual) + 1 / self._weight(umkm_id)
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            await asyncio.wait_for(future, None if patient else self.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                admission_rejected_total.inc(lane=self.lane, reason="queue_timeout")
+                raise AdmissionRejected(self.lane, "queue timeout", self.max_wait) from None
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._grant()
+
+    def _grant(self):
+        while self.active < self.capacity and self._queues:
+            umkm_id = min(self._queues, key=self._finish.__getitem__)
+            queue = self._queues[umkm_id]
+            future = queue.popleft()
+            tag = self._finish[umkm_id]
+            if queue:
+                self._finish[umkm_id] = tag + 1 / self._weight(umkm_id)
+            else:
+                del self._queues[umkm_id]
+            # Waiters that timed out or were cancelled are still queued
+            if future.done():
+                continue
+            self._virtual = tag
+            self.active += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": self.queued(),
+            "queued_tenants": len(self._queues),
+        }
+
+
+class AdmissionController:
+    def __init__(self, backend, rates: dict, limiters: dict, enabled: bool = True):
+        self.backend = backend
+        # lane -> (tokens per second, burst)
+        self.rates = rates
+        self.limiters = limiters
+        self.enabled = enabled
+
+    async def _take_tokens(self, lane: str, umkm_id, cost: float, patient: bool):
+        if lane not in self.rates:
+            return
+        rate, burst = self.rates[lane]
+        while True:
+            wait = await self.backend.try_acquire(f"{lane}:{umkm_id}", rate, burst, cost)
+            if wait <= 0:
+                return
+            if not patient:
+                admission_rejected_total.inc(lane=lane, reason="rate_limited")
+                raise AdmissionRejected(lane, "rate limited", wait)
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self, lane: str, umkm_id, cost: float = 1, patient: bool = False, take_tokens: bool = True):
+        """
+        Hold one of `lane`'s slots for `umkm_id` while the block runs, after
+        taking `cost` tokens from the tenant's bucket for that lane (unless
+        the caller already did with check() or pace()). Raises
+        AdmissionRejected for interactive (not `patient`) callers that
+        would have to wait too long.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        if take_tokens:
+            await self._take_tokens(lane, umkm_id, cost, patient)
+        limiter = self.limiters.get(lane)
+        if limiter is not None:
+            await limiter.acquire(umkm_id, patient)
+        admission_wait_seconds.observe(time.perf_counter() - start, lane=lane)
+        try:
+            yield
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+    async def check(self, lane: str, umkm_id, cost: float = 1):
+        """
+        Take `cost` tokens or raise AdmissionRejected; no queueing.
+        """
+        if self.enabled:
+            await self._take_tokens(lane, umkm_id, cost, patient=False)
+
+    async def pace(self, lane: str, umkm_id, cost: float = 1):
+        """
+        Sleep until the tenant's bucket has `cost` tokens, then take them.
+        """
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        await self._take_tokens(lane, umkm_id, cost, patient=True)
+        admission_wait_seconds.observe(time.perf_counter() - start, lane=lane)
+
+    def stats(self) -> dict:
+        return {lane: limiter.stats() for lane, limiter in self.limiters.items()}
+
+
+def _limiter(lane: str, capacity: int) -> FairLimiter:
+    return FairLimiter(
+        lane, capacity,
+        max_queue_per_tenant=settings.ADMISSION_MAX_QUEUE_PER_UMKM,
+        max_wait=settings.ADMISSION_MAX_WAIT_SECONDS,
+        weights=settings.ADMISSION_WEIGHTS,
+    )
+
+
+admission = AdmissionController(
+    create_rate_limit_backend(),
+    rates={
+        "speech": (settings.ADMISSION_SPEECH_PER_MINUTE / 60, settings.ADMISSION_SPEECH_BURST),
+        "openai": (settings.ADMISSION_LLM_PER_MINUTE / 60, settings.ADMISSION_LLM_BURST),
+        "reports": (settings.ADMISSION_REPORTS_PER_MINUTE / 60, settings.ADMISSION_REPORTS_BURST),
+    },
+    limiters={
+        "speech": _limiter("speech", settings.ADMISSION_SPEECH_CONCURRENCY),
+        "openai": _limiter("openai", settings.ADMISSION_LLM_CONCURRENCY),
+        "heavy": _limiter("heavy", settings.ADMISSION_HEAVY_CONCURRENCY),
+    },
+    enabled=settings.ADMISSION_ENABLED,
+)
+
+registry.gauge(
+    "admission_slots", "Fair queue slots in use and waiters per lane", ("lane", "state"),
+    callback=lambda: {
+        key: value
+        for lane, limiter in admission.limiters.items()
+        for key, value in (((lane, "active"), limiter.active), ((lane, "queued"), limiter.queued()))
+    },
+)
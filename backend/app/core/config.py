@@ -1,24 +1,215 @@
 from pydantic import Field
 from pathlib import Path
+from typing import Dict
 from pydantic_settings import BaseSettings
-import os 
+import logging
 class Settings(BaseSettings):
     # General
     PROJECT_NAME: str = "UMKM AI App"
     API_V1_STR: str = "/api/v1"
 
     # Database
-    POSTGRES_USER: str
-    POSTGRES_PASSWORD: str
-    POSTGRES_DB: str
+    POSTGRES_USER: str = ""
+    POSTGRES_PASSWORD: str = ""
+    POSTGRES_DB: str = ""
     POSTGRES_SERVER: str = "localhost"
     POSTGRES_PORT: str = "5432"
 
-    # Google Cloud
-    GOOGLE_APPLICATION_CREDENTIALS: str = Field(..., env="GOOGLE_APPLICATION_CREDENTIALS")
+    # Connection pool
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 15000
+    # Needs asyncpg; catalog fetches from async code (services/transcript.py)
+    # then use AsyncSessionLocal instead of a thread
+    DB_ASYNC_ENABLED: bool = False
+
+    # Credentials are only needed once a client is first used (see
+    # helper/gcp.py and services/llm.py), so report-only workers and tests
+    # can start without them.
+    # Google Cloud; empty = application default credentials
+    GOOGLE_APPLICATION_CREDENTIALS: str = Field("", env="GOOGLE_APPLICATION_CREDENTIALS")
 
     # OpenAI
-    OPENAI_API_KEY: str = Field(..., env="OPENAI_API_KEY")
+    OPENAI_API_KEY: str = Field("", env="OPENAI_API_KEY")
+
+    # Startup
+    # Build the Speech/OpenAI clients and open a DB connection during
+    # startup instead of on the first request
+    STARTUP_WARMUP: bool = False
+
+    # Concurrency
+    BLOCKING_POOL_SIZE: int = 16
+
+    # Streaming speech
+    # Google closes a streaming session after ~305s of audio, reconnect a bit earlier
+    STREAMING_SESSION_LIMIT_SECONDS: float = 280
+    # Past the limit a WebM/Ogg session runs on until a cluster/page starts;
+    # limit + grace stays under Google's ~305 s cap
+    STREAMING_SESSION_GRACE_SECONDS: float = 20
+    STREAMING_QUEUE_SIZE: int = 32
+
+    # Observability
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    # Fraction of successful requests written to the access log
+    ACCESS_LOG_SAMPLE_RATE: float = 0.1
+    SLOW_REQUEST_SECONDS: float = 2.0
+
+    # Response compression (brotli needs the `brotli` package, else gzip)
+    # Bodies smaller than this are sent uncompressed
+    COMPRESSION_MIN_BYTES: int = 1000
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+
+    # Background draft jobs
+    # redis://... for a durable queue shared by workers, empty = in-process
+    JOB_BACKEND_URL: str = ""
+    JOB_WORKERS: int = 8
+    JOB_SPEECH_CONCURRENCY: int = 8
+    JOB_LLM_CONCURRENCY: int = 4
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_SECONDS: float = 1.0
+    JOB_RESULT_TTL_SECONDS: float = 3600
+    JOB_MAX_STORED: int = 10000
+    # Queued jobs hold their audio (up to AUDIO_MAX_BYTES each); past this, submit gets 429
+    JOB_MAX_QUEUED: int = 64
+    # A job running longer than this is taken to be on a dead worker and requeued
+    JOB_STALE_SECONDS: float = 600
+
+    # Audio preprocessing before Speech-to-Text
+    AUDIO_PREPROCESS_ENABLED: bool = True
+    AUDIO_TARGET_SAMPLE_RATE: int = 16000
+    AUDIO_MAX_BYTES: int = 10 * 1024 * 1024
+    # Synchronous recognize() rejects anything longer than a minute anyway
+    AUDIO_MAX_SECONDS: float = 60
+    # Uploads that can't be decoded here (no ffmpeg) are sent as-is and their
+    # length is unknown; cap them at about AUDIO_MAX_SECONDS of 256 kbit/s audio
+    AUDIO_PASSTHROUGH_MAX_BYTES: int = 2 * 1024 * 1024
+    AUDIO_TRIM_SILENCE: bool = True
+    AUDIO_SILENCE_THRESHOLD_DB: float = -45
+    AUDIO_SILENCE_PADDING_SECONDS: float = 0.2
+    # Used to decode compressed uploads (WebM/Ogg/MP3/FLAC); without it they
+    # are passed through undecoded with a matching encoding
+    FFMPEG_PATH: str = "ffmpeg"
+
+    # Bulk offline import
+    BULK_IMPORT_CONCURRENCY: int = 8
+    # Transactions per DB transaction when writing an import
+    BULK_IMPORT_BATCH_SIZE: int = 200
+    BULK_IMPORT_MAX_FILES: int = 500
+    BULK_IMPORT_MAX_CSV_ROWS: int = 50000
+
+    # Stock accounting
+    # "row" updates products.stock on every confirm; "ledger" appends to
+    # inventory_ledger instead (services/inventory.py), for shops whose
+    # cashiers sell the same products concurrently. Run
+    # `python -m db.maintenance init-inventory` before switching.
+    INVENTORY_MODE: str = "row"
+    # Products with this many movements between two compactions are spread
+    # over INVENTORY_HOT_BUCKETS buckets; below a quarter of it they go back to one
+    INVENTORY_HOT_MOVEMENTS: int = 200
+    INVENTORY_HOT_BUCKETS: int = 8
+    # Background compaction in ledger mode, 0 = only via `compact-inventory`
+    INVENTORY_COMPACT_INTERVAL_SECONDS: float = 60
+
+    # History retention (db/partitions.py, services/archive.py)
+    # Monthly partitions created ahead of time by `create-partitions`
+    PARTITION_MONTHS_AHEAD: int = 3
+    # Transcripts older than this move to the compressed archive
+    TRANSCRIPT_ARCHIVE_AFTER_DAYS: int = 90
+    # Transcripts per compressed block (and per archiving transaction)
+    TRANSCRIPT_ARCHIVE_BATCH_ROWS: int = 2000
+    TRANSCRIPT_ARCHIVE_ZSTD_LEVEL: int = 10
+    # Decompressed blocks kept in memory for lookups
+    TRANSCRIPT_ARCHIVE_CACHE_BLOCKS: int = 32
+
+    # Report exports
+    EXPORT_CHUNK_ROWS: int = 5000
+    EXPORT_CACHE_TTL_SECONDS: float = 900
+    EXPORT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    EXPORT_CACHE_MAX_ENTRY_BYTES: int = 8 * 1024 * 1024
+
+    # Live dashboard
+    # redis://... to fan events out across uvicorn workers, empty = in-process only
+    EVENTS_BACKEND_URL: str = ""
+    LIVE_SUBSCRIBER_QUEUE_SIZE: int = 100
+    LIVE_KEEPALIVE_SECONDS: float = 15
+
+    # LLM gateway
+    # OpenAI-compatible endpoint, empty = api.openai.com
+    OPENAI_BASE_URL: str = ""
+    LLM_GATEWAY_ENABLED: bool = True
+    LLM_GATEWAY_WINDOW_SECONDS: float = 0.02
+    LLM_GATEWAY_MAX_BATCH: int = 16
+    LLM_GATEWAY_MAX_QUEUE: int = 200
+    LLM_GATEWAY_MAX_WAIT_SECONDS: float = 10
+    LLM_GATEWAY_MAX_ATTEMPTS: int = 3
+    LLM_RATE_LIMIT_RPM: float = 500
+    LLM_RATE_LIMIT_TPM: float = 200000
+    LLM_COMPLETION_TOKEN_ESTIMATE: int = 300
+
+    # Upstream resilience (per attempt timeouts, retries, circuit breakers)
+    SPEECH_TIMEOUT_SECONDS: float = 30
+    SPEECH_ATTEMPTS: int = 2
+    # 0 = no hedging; a hedge is a second billed recognize call
+    SPEECH_HEDGE_AFTER_SECONDS: float = 0
+    LLM_TIMEOUT_SECONDS: float = 30
+    LLM_ATTEMPTS: int = 2
+    LLM_HEDGE_AFTER_SECONDS: float = 0
+    UPSTREAM_BACKOFF_BASE_SECONDS: float = 0.2
+    UPSTREAM_BACKOFF_MAX_SECONDS: float = 2
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30
+
+    # Per-UMKM admission control (core/admission.py)
+    ADMISSION_ENABLED: bool = True
+    # redis://... to share the per-UMKM rates between workers, empty = per process
+    ADMISSION_BACKEND_URL: str = ""
+    # Per UMKM; interactive requests over the rate get 429, jobs and bulk imports are paced
+    ADMISSION_SPEECH_PER_MINUTE: float = 30
+    ADMISSION_SPEECH_BURST: int = 10
+    ADMISSION_LLM_PER_MINUTE: float = 60
+    ADMISSION_LLM_BURST: int = 20
+    ADMISSION_REPORTS_PER_MINUTE: float = 600
+    ADMISSION_REPORTS_BURST: int = 60
+    # Per process caps, shared fairly between UMKMs once reached
+    ADMISSION_SPEECH_CONCURRENCY: int = 16
+    ADMISSION_LLM_CONCURRENCY: int = 16
+    # generate-draft and speech-to-text requests in flight
+    ADMISSION_HEAVY_CONCURRENCY: int = 32
+    ADMISSION_MAX_QUEUE_PER_UMKM: int = 20
+    ADMISSION_MAX_WAIT_SECONDS: float = 10
+    # {"<umkm_id>": weight} for a bigger fair share, default 1
+    ADMISSION_WEIGHTS: Dict[str, float] = {}
+
+    # Caching
+    # redis://... to share invalidations between uvicorn workers, empty = in-process only
+    CACHE_BACKEND_URL: str = ""
+    CATALOG_CACHE_TTL_SECONDS: float = 300
+    CATALOG_CACHE_MAX_ENTRIES: int = 1024
+    CATALOG_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Local product matcher
+    MATCHER_BYPASS_LLM: bool = True
+    MATCHER_TOP_K: int = 20
+    MATCHER_MIN_SCORE: float = 0.75
+    MATCHER_MIN_MARGIN: float = 0.15
+
+    # Deduplication
+    DRAFT_DEDUP_TTL_SECONDS: float = 600
+    DRAFT_DEDUP_MAX_ENTRIES: int = 1000
+    TRANSCRIPT_CACHE_TTL_SECONDS: float = 3600
+    TRANSCRIPT_CACHE_MAX_ENTRIES: int = 10000
+
+    # Generated drafts kept for confirm-by-id (services/draft_store.py)
+    # redis://... so any worker can confirm a draft, empty = in-process only
+    DRAFT_STORE_BACKEND_URL: str = ""
+    DRAFT_STORE_TTL_SECONDS: float = 1800
+    DRAFT_STORE_MAX_ENTRIES: int = 10000
+    DRAFT_STORE_GC_INTERVAL_SECONDS: float = 60
 
     @property
     def database_url(self) -> str:
@@ -27,6 +218,13 @@ class Settings(BaseSettings):
             f"@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
 
+    @property
+    def async_database_url(self) -> str:
+        return (
+            f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
+            f"@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+        )
+
     class Config:
         env_file = str(Path(__file__).parent.parent.parent / ".env")
         env_file_encoding = "utf-8"
@@ -35,7 +233,7 @@ class Settings(BaseSettings):
 settings = Settings()
 # Fix relative path issue
 google_cred_path = Path(settings.GOOGLE_APPLICATION_CREDENTIALS)
-if not google_cred_path.is_absolute():
+if settings.GOOGLE_APPLICATION_CREDENTIALS and not google_cred_path.is_absolute():
     # Convert to absolute path relative to project root
     settings.GOOGLE_APPLICATION_CREDENTIALS = str((Path(__file__).parents[2] / google_cred_path).resolve())
-    print(f"Using Google credentials from: {settings.GOOGLE_APPLICATION_CREDENTIALS}")
+    logging.getLogger(__name__).info("Using Google credentials from: %s", settings.GOOGLE_APPLICATION_CREDENTIALS)
@@ -0,0 +1,23 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from core.config import settings
+
+# Bounded pool for the calls that are still blocking (sync DB sessions, SDKs
+# without an async client). Keeps them off the event loop without letting a
+# burst of uploads spawn an unbounded number of threads.
+blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_POOL_SIZE,
+    thread_name_prefix="blocking",
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking callable on the bounded executor and await its result.
+    """
+    loop = asyncio.get_running_loop()
+    # run_in_executor doesn't carry contextvars over (per-request metrics)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, functools.partial(context.run, func, *args, **kwargs))
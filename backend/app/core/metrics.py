@@ -0,0 +1,210 @@
+"""
+Small in-process metrics registry rendered in the Prometheus text format
+on GET /metrics. Counters and histograms are updated on the hot path, so
+they are plain dict/float updates under one lock; gauges that mirror other
+components' state (caches, DB pool) are read from callbacks at scrape time.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield from self.header()
+        with _lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """
+    Gauge whose samples come from `callback()` at scrape time, as
+    {label values tuple: value}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Callable[[], dict] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        yield from self.header()
+        if self.callback is not None:
+            items = list(self.callback().items())
+        else:
+            with _lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        yield from self.header()
+        with _lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+http_request_db_queries = registry.histogram(
+    "http_request_db_queries", "DB queries issued per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+stage_seconds = registry.histogram(
+    "pipeline_stage_duration_seconds", "Duration of pipeline stages", ("pipeline", "stage"))
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "DB statement latency", (),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5))
+db_queries_total = registry.counter("db_queries_total", "DB statements executed")
+llm_tokens_total = registry.counter("llm_tokens_total", "LLM tokens used", ("kind",))
+llm_requests_total = registry.counter("llm_requests_total", "LLM calls", ("outcome",))
+
+
+@contextmanager
+def stage_timer(stage: str, pipeline: str = "draft"):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, pipeline=pipeline, stage=stage)
+
+
+def stats_gauge(name: str, documentation: str, source: Callable[[], dict], label: str = "stat"):
+    """
+    Expose a component's stats() dict as one gauge labelled by key.
+    Non-numeric values are skipped.
+    """
+    def collect():
+        return {
+            (key,): value for key, value in source().items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+    return registry.gauge(name, documentation, (label,), callback=collect)
+
+
+# Per-request DB statement counter. The middleware puts a fresh one-element
+# list in the context; the engine hooks increment it (worker threads get a
+# copy of the context, so they share the same list).
+_request_queries: ContextVar = ContextVar("request_queries", default=None)
+
+
+def start_query_count():
+    counter = [0]
+    _request_queries.set(counter)
+    return counter
+
+
+def record_db_query(elapsed: float):
+    db_queries_total.inc()
+    db_query_seconds.observe(elapsed)
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second up to `capacity`. Used from the event loop
+    only, so no locking.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """
+        Take `amount` tokens and return 0, or return how many seconds to
+        wait until they will be there (taking nothing). A request larger
+        than the bucket goes through once the bucket is full and leaves it
+        in debt, so it still counts in full against the rate instead of
+        waiting forever.
+        """
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= amount
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    async def acquire(self, amount: float = 1):
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def wait_time(self, amount: float = 1) -> float:
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
@@ -0,0 +1,262 @@
+"""
+Shared wrapper for calls to paid upstreams (Google Speech, OpenAI).
+
+Every call gets a deadline, retryable failures are retried with full-jitter
+exponential backoff, slow calls can optionally be hedged with a second
+request, and a circuit breaker per upstream fails fast while the upstream
+is down instead of letting requests pile up on it.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+upstream_calls_total = registry.counter(
+    "upstream_calls_total", "Calls to external upstreams by outcome", ("upstream", "outcome"),
+)
+upstream_retries_total = registry.counter("upstream_retries_total", "Retried upstream calls", ("upstream",))
+upstream_hedges_total = registry.counter("upstream_hedges_total", "Hedged upstream requests sent", ("upstream",))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Errors worth retrying, by class name so neither google-api-core nor
+# openai has to be imported here
+_RETRYABLE_NAMES = {
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+    "ResourceExhausted", "Aborted", "GatewayTimeout", "BadGateway",
+    "APIConnectionError", "APITimeoutError", "RateLimitError",
+    "TimeoutError", "ConnectionError", "UpstreamTimeout",
+}
+
+
+class CircuitOpen(Exception):
+    """
+    The upstream's circuit breaker is open; the call was not attempted.
+    """
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(TimeoutError):
+    def __init__(self, upstream: str, timeout: float):
+        super().__init__(f"{upstream} did not answer within {timeout:g}s")
+
+
+def is_retryable(error: Exception) -> bool:
+    if any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open):
+    success closes it, failure opens it again. Thread-safe, since the sync
+    call paths run on executor threads.
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpen(self.name, remaining)
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpen(self.name, self.reset_timeout)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit closed", extra={"upstream": self.name})
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("Circuit opened after %d failures", self.failures, extra={"upstream": self.name})
+                    self.opened_total += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        # A half-open probe that ended in a non-upstream error (bad input)
+        # says nothing about the upstream; let the next call probe instead
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_total": self.opened_total,
+                "retry_after": max(0.0, self.opened_at + self.reset_timeout - time.monotonic()) if self.state == OPEN else 0.0,
+            }
+
+
+class UpstreamPolicy:
+    """
+    How to call one upstream: `timeout` per attempt, up to `attempts`
+    attempts with backoff between `backoff_base` and `backoff_max`, and a
+    hedge request after `hedge_after` seconds (0 = never hedge; hedging
+    doubles the cost of slow calls, so only use it where that is acceptable).
+    """
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        breaker: CircuitBreaker,
+        hedge_after: float = 0,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self.hedge_after = hedge_after
+
+    def _admit(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            upstream_calls_total.inc(upstream=self.name, outcome="short_circuited")
+            raise
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _attempt(self, make_call):
+        if not self.hedge_after or self.hedge_after >= self.timeout:
+            return await asyncio.wait_for(make_call(), self.timeout)
+
+        deadline = time.monotonic() + self.timeout
+        tasks = [asyncio.ensure_future(make_call())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                upstream_hedges_total.inc(upstream=self.name)
+                tasks.append(asyncio.ensure_future(make_call()))
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, pending = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    # every request failed; report the first one's error
+                    return tasks[0].result()
+                tasks = list(pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, make_call):
+        """
+        Await `make_call()` (a function returning a fresh awaitable per
+        attempt) under this policy.
+        """
+        self._admit()
+        for attempt in range(self.attempts):
+            try:
+                result = await self._attempt(make_call)
+            except asyncio.TimeoutError:
+                error = UpstreamTimeout(self.name, self.timeout)
+                outcome = "timeout"
+            except Exception as e:
+                if not is_retryable(e):
+                    upstream_calls_total.inc(upstream=self.name, outcome="rejected")
+                    self.breaker.release_probe()
+                    raise
+                error, outcome = e, "error"
+            else:
+                upstream_calls_total.inc(upstream=self.name, outcome="ok")
+                self.breaker.record_success()
+                return result
+
+            upstream_calls_total.inc(upstream=self.name, outcome=outcome)
+            self.breaker.record_failure()
+            if attempt + 1 >= self.attempts or self.breaker.state == OPEN:
+                raise error
+            upstream_retries_total.inc(upstream=self.name)
+            await asyncio.sleep(self._backoff(attempt))
+
+    def call_sync(self, func, *args, **kwargs):
+        """
+        Blocking counterpart of call(). There is no way to abandon a
+        blocking call, so `func` receives `timeout=` and must enforce it
+        itself (both the gRPC and the OpenAI clients accept one). No hedging.
+        """
+        self._admit()
+        for attempt in range(self.attempts):
+            try:
+                result = func(*args, timeout=self.timeout, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    upstream_calls_total.inc(upstream=self.name, outcome="rejected")
+                    self.breaker.release_probe()
+                    raise
+                upstream_calls_total.inc(upstream=self.name, outcome="error")
+                self.breaker.record_failure()
+                if attempt + 1 >= self.attempts or self.breaker.state == OPEN:
+                    raise
+                upstream_retries_total.inc(upstream=self.name)
+                time.sleep(self._backoff(attempt))
+            else:
+                upstream_calls_total.inc(upstream=self.name, outcome="ok")
+                self.breaker.record_success()
+                return result
+
+
+breakers = {}
+
+
+def upstream_policy(name: str, timeout: float, attempts: int, backoff_base: float, backoff_max: float,
+                    failure_threshold: int, reset_timeout: float, hedge_after: float = 0) -> UpstreamPolicy:
+    breaker = breakers.setdefault(name, CircuitBreaker(name, failure_threshold, reset_timeout))
+    return UpstreamPolicy(name, timeout, attempts, backoff_base, backoff_max, breaker, hedge_after)
+
+
+def breaker_stats() -> dict:
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+registry.gauge(
+    "circuit_breaker_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)", ("upstream",),
+    callback=lambda: {(name,): _STATE_VALUES[b.state] for name, b in breakers.items()},
+)
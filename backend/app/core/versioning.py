@@ -0,0 +1,73 @@
+import threading
+from core.config import settings
+
+
+class InMemoryVersionBackend:
+    """
+    Per-key version counters kept in this process. Good enough for a single
+    worker and for tests; several caches can share one instance to simulate
+    several workers.
+    """
+    blocking = False
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+
+class RedisVersionBackend:
+    """
+    Version counters in Redis, so a bump made by one uvicorn worker is seen
+    by every other worker on its next read. Every call is a network round
+    trip, so async code goes through run_blocking (see `blocking`).
+    """
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = "ucap:version:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND_URL is set but the `redis` package is not installed") from e
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key: str) -> int:
+        value = self._client.get(self._prefix + key)
+        return int(value) if value is not None else 0
+
+    def bump(self, key: str) -> int:
+        return int(self._client.incr(self._prefix + key))
+
+
+def create_version_backend(url: str):
+    if url:
+        return RedisVersionBackend(url)
+    return InMemoryVersionBackend()
+
+
+# Shared by every cache that needs cross-worker invalidation
+version_backend = create_version_backend(settings.CACHE_BACKEND_URL)
+
+
+def sales_version_key(umkm_id: int) -> str:
+    return f"sales:{umkm_id}"
+
+
+def bump_sales_version(umkm_id: int) -> int:
+    """
+    Call after committing sales or purchases for `umkm_id`; anything cached
+    from that UMKM's transactions (exports, reports) is then stale.
+    """
+    return version_backend.bump(sales_version_key(umkm_id))
+
+
+def sales_version(umkm_id: int) -> int:
+    return version_backend.get(sales_version_key(umkm_id))
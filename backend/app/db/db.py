@@ -1,13 +1,197 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from core.config import settings
+from core.metrics import record_db_query, registry
+
+
+class PoolStats:
+    """
+    How long requests waited for a connection. Checked-out/overflow counts
+    come straight from the pool in snapshot().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+
+class _TimedGetMixin:
+    stats: PoolStats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+
+def _timed_pool_class(base, stats: PoolStats):
+    return type(f"Timed{base.__name__}", (_TimedGetMixin, base), {"stats": stats})
+
+
+def _pool_kwargs(**overrides) -> dict:
+    kwargs = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    kwargs.update(overrides)
+    return kwargs
+
+
+def build_engine(url: str = None, stats: PoolStats = None, **overrides):
+    """
+    Sync engine with the settings-driven pool. `overrides` replace any
+    create_engine pool argument (the benchmarks use this to compare sizes).
+    """
+    stats = stats or PoolStats()
+    return create_engine(
+        url or settings.database_url,
+        poolclass=_timed_pool_class(QueuePool, stats),
+        connect_args={"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"},
+        **_pool_kwargs(**overrides),
+    )
+
+
+def instrument_engine(sync_engine):
+    """
+    Count and time every statement for /metrics and the per-request query
+    count.
+    """
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_db_query(time.perf_counter() - context._query_start)
+
+
+# Engines are created on first use, not at import: importing the app (tests,
+# workers that never touch Postgres, `python -c "import main"`) should not
+# need database settings or load a driver.
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+_engine = None
+_session_factory = None
+_async_engine = None
+_async_session_factory = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = build_engine(stats=pool_stats)
+                instrument_engine(engine)
+                _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+
+def get_async_engine():
+    """
+    The asyncpg engine, or None unless DB_ASYNC_ENABLED.
+    """
+    global _async_engine, _async_session_factory
+    if not settings.DB_ASYNC_ENABLED:
+        return None
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+                engine = create_async_engine(
+                    settings.async_database_url,
+                    poolclass=_timed_pool_class(AsyncAdaptedQueuePool, async_pool_stats),
+                    connect_args={"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}},
+                    **_pool_kwargs(),
+                )
+                instrument_engine(engine.sync_engine)
+                _async_session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+                _async_engine = engine
+    return _async_engine
+
+
+def SessionLocal():
+    # Kept as a callable under the old sessionmaker name so call sites
+    # (`SessionLocal()`, `with SessionLocal() as db`) did not change
+    get_engine()
+    return _session_factory()
+
+
+def AsyncSessionLocal():
+    if get_async_engine() is None:
+        raise RuntimeError("Async database access is disabled, set DB_ASYNC_ENABLED=true")
+    return _async_session_factory()
 
-engine = create_engine(settings.database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_pool_stats() -> dict:
+    # Only engines that exist; asking for stats should not create one
+    stats = {}
+    if _engine is not None:
+        stats["sync"] = pool_stats.snapshot(_engine.pool)
+    if _async_engine is not None:
+        stats["async"] = async_pool_stats.snapshot(_async_engine.sync_engine.pool)
+    return stats
+
+
+async def dispose_engines():
+    if _engine is not None:
+        _engine.dispose()
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+def _collect_pool_gauges() -> dict:
+    return {
+        (engine_name, stat): value
+        for engine_name, snapshot in get_pool_stats().items()
+        for stat, value in snapshot.items()
+    }
+
+
+registry.gauge("db_pool", "Connection pool state and checkout waits", ("engine", "stat"), callback=_collect_pool_gauges)
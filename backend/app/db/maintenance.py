@@ -0,0 +1,251 @@
+"""
+Schema objects owned by the API (rollups, indexes) and the maintenance
+commands around them.
+
+    python -m db.maintenance ensure-schema
+    python -m db.maintenance rebuild-rollup [--umkm-id 1]
+    python -m db.maintenance purge-idempotency-keys [--older-than-hours 48]
+    python -m db.maintenance init-inventory [--umkm-id 1]
+    python -m db.maintenance compact-inventory [--umkm-id 1]
+    python -m db.maintenance partition-tables [--months-ahead 3]
+    python -m db.maintenance create-partitions [--months-ahead 3]
+    python -m db.maintenance detach-partitions --older-than-months 24 [--drop]
+    python -m db.maintenance archive-transcripts [--older-than-days 90]
+    python -m db.maintenance invalidate-catalog --umkm-id 1
+"""
+import argparse
+from sqlalchemy import text
+from core.config import settings
+from db.db import get_engine
+from db import partitions
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+        umkm_id           INTEGER NOT NULL,
+        day               DATE NOT NULL,
+        total_amount      NUMERIC(16, 2) NOT NULL DEFAULT 0,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (umkm_id, day)
+    )
+    """,
+    # (umkm_id, sale_date, sale_id) serves both date ranges and keyset pages
+    "CREATE INDEX IF NOT EXISTS ix_sales_umkm_date_id ON sales (umkm_id, sale_date, sale_id)",
+    # Newest sale id of a UMKM in one probe, for report validators
+    "CREATE INDEX IF NOT EXISTS ix_sales_umkm_id ON sales (umkm_id, sale_id)",
+    "DROP INDEX IF EXISTS ix_sales_umkm_sale_date",
+    "CREATE INDEX IF NOT EXISTS ix_sales_items_sale_id ON sales_items (sale_id)",
+    "CREATE INDEX IF NOT EXISTS ix_sales_items_product_sale ON sales_items (product_id, sale_id)",
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        idempotency_key VARCHAR(255) PRIMARY KEY,
+        umkm_id         INTEGER NOT NULL,
+        request_hash    CHAR(64) NOT NULL,
+        response        JSONB,
+        created_at      TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at)",
+    # Stock ledger for INVENTORY_MODE=ledger (services/inventory.py)
+    """
+    CREATE TABLE IF NOT EXISTS inventory_ledger (
+        movement_id BIGSERIAL PRIMARY KEY,
+        umkm_id     INTEGER NOT NULL,
+        product_id  INTEGER NOT NULL,
+        bucket      SMALLINT NOT NULL,
+        delta       INTEGER NOT NULL,
+        kind        VARCHAR(20) NOT NULL,
+        created_at  TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_inventory_ledger_bucket ON inventory_ledger (product_id, bucket, movement_id)",
+    """
+    CREATE TABLE IF NOT EXISTS inventory_buckets (
+        product_id       INTEGER NOT NULL,
+        bucket           SMALLINT NOT NULL,
+        umkm_id          INTEGER NOT NULL,
+        balance          INTEGER NOT NULL,
+        last_movement_id BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, bucket)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_inventory_buckets_umkm ON inventory_buckets (umkm_id, product_id)",
+    "CREATE INDEX IF NOT EXISTS ix_purchases_umkm_date_id ON purchases (umkm_id, purchase_date, purchase_id)",
+    # Transcripts not archived yet, in the order archive-transcripts takes them
+    "CREATE INDEX IF NOT EXISTS ix_sales_unarchived ON sales (umkm_id, sale_id) WHERE transcript IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_purchases_unarchived ON purchases (umkm_id, purchase_id) WHERE transcript IS NOT NULL",
+    """
+    CREATE TABLE IF NOT EXISTS transcript_archive (
+        kind        VARCHAR(10) NOT NULL,
+        umkm_id     INTEGER NOT NULL,
+        first_id    INTEGER NOT NULL,
+        last_id     INTEGER NOT NULL,
+        row_count   INTEGER NOT NULL,
+        raw_bytes   INTEGER NOT NULL,
+        payload     BYTEA NOT NULL,
+        archived_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (kind, umkm_id, first_id)
+    )
+    """,
+]
+
+
+def _apply_schema(conn):
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(text(statement))
+
+
+def ensure_schema():
+    with get_engine().begin() as conn:
+        _apply_schema(conn)
+    print("Schema is up to date")
+
+
+def rebuild_rollup(umkm_id: int = None):
+    """
+    Recompute daily_sales_rollup from sales. The table is locked for the
+    duration, so confirms running meanwhile wait instead of adding to rows
+    that are about to be replaced. Days before the oldest sale still in
+    the table (detached partitions) keep their totals.
+    """
+    where = "WHERE umkm_id = :umkm_id" if umkm_id is not None else ""
+    params = {"umkm_id": umkm_id} if umkm_id is not None else {}
+    with get_engine().begin() as conn:
+        conn.execute(text("LOCK TABLE daily_sales_rollup IN EXCLUSIVE MODE"))
+        conn.execute(text(f"""
+            DELETE FROM daily_sales_rollup
+            {where or "WHERE TRUE"} AND day >= (SELECT CAST(MIN(sale_date) AS DATE) FROM sales)
+        """), params)
+        result = conn.execute(text(f"""
+            INSERT INTO daily_sales_rollup (umkm_id, day, total_amount, transaction_count)
+            SELECT umkm_id, CAST(sale_date AS DATE), SUM(total_amount), COUNT(*)
+            FROM sales
+            {where}
+            GROUP BY umkm_id, CAST(sale_date AS DATE)
+        """), params)
+    print(f"Rebuilt daily_sales_rollup: {result.rowcount} rows")
+
+
+def purge_idempotency_keys(older_than_hours: int):
+    with get_engine().begin() as conn:
+        result = conn.execute(text("""
+            DELETE FROM idempotency_keys
+            WHERE created_at < NOW() - make_interval(hours => :hours)
+        """), {"hours": older_than_hours})
+    print(f"Purged {result.rowcount} idempotency keys")
+
+
+def init_inventory(umkm_id: int = None):
+    from services.inventory import init_inventory as seed
+    print(f"Seeded {seed(umkm_id)} inventory buckets from products.stock")
+
+
+def compact_inventory(umkm_id: int = None):
+    from services.inventory import compact_inventory as compact
+    stats = compact(umkm_id)
+    print(f"Compacted {stats['movements']} movements of {stats['products']} products in {stats['seconds']:.2f}s")
+
+
+def invalidate_catalog(umkm_id: int):
+    """
+    For product edits made outside the API (admin tools, SQL). Bumps the
+    catalog version in CACHE_BACKEND_URL, so running workers reload the
+    catalog on their next read; without a shared backend they only see the
+    edit once their entry's CATALOG_CACHE_TTL_SECONDS runs out.
+    """
+    from services.catalog import invalidate_catalog as invalidate
+    if not settings.CACHE_BACKEND_URL:
+        print("CACHE_BACKEND_URL is not set: running workers keep their catalog until it expires")
+        return
+    invalidate(umkm_id)
+    print(f"Invalidated the cached catalog of UMKM {umkm_id}")
+
+
+def partition_tables(months_ahead: int):
+    """
+    One-off conversion of sales and purchases to monthly partitions. Takes
+    an exclusive lock on each table while its rows are copied, so run it
+    in a maintenance window.
+    """
+    for table in partitions.PARTITIONED_TABLES:
+        with get_engine().begin() as conn:
+            if partitions.is_partitioned(conn, table):
+                print(f"{table} is already partitioned")
+                continue
+            copied = partitions.convert_to_partitioned(conn, table, months_ahead)
+            # Indexes went with the old table; recreate them on the partitioned one
+            _apply_schema(conn)
+        print(f"Partitioned {table}: {copied} rows")
+
+
+def create_partitions(months_ahead: int):
+    for table in partitions.PARTITIONED_TABLES:
+        with get_engine().begin() as conn:
+            created = partitions.ensure_partitions(conn, table, months_ahead)
+        print(f"{table}: created {', '.join(created) if created else 'nothing'}")
+
+
+def detach_partitions(older_than_months: int, drop: bool):
+    for table in partitions.PARTITIONED_TABLES:
+        with get_engine().begin() as conn:
+            detached = partitions.detach_partitions(conn, table, older_than_months, drop=drop)
+        print(f"{table}: {'dropped' if drop else 'detached'} {', '.join(detached) if detached else 'nothing'}")
+
+
+def archive_transcripts(older_than_days: int):
+    from services.archive import archive_transcripts as archive
+    stats = archive(older_than_days)
+    ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0
+    print(f"Archived {stats['rows']} transcripts, {stats['raw_bytes']} -> {stats['stored_bytes']} bytes "
+          f"({ratio:.1f}x) in {stats['seconds']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UMKM database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("ensure-schema", help="create rollup tables and indexes")
+    rebuild = commands.add_parser("rebuild-rollup", help="backfill daily_sales_rollup from sales")
+    rebuild.add_argument("--umkm-id", type=int, default=None)
+    purge = commands.add_parser("purge-idempotency-keys", help="delete old confirm idempotency keys")
+    purge.add_argument("--older-than-hours", type=int, default=48)
+    init = commands.add_parser("init-inventory", help="seed ledger buckets from products.stock")
+    init.add_argument("--umkm-id", type=int, default=None)
+    compact = commands.add_parser("compact-inventory", help="fold the stock ledger into products.stock")
+    compact.add_argument("--umkm-id", type=int, default=None)
+    partition = commands.add_parser("partition-tables", help="convert sales and purchases to monthly partitions")
+    partition.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+    create = commands.add_parser("create-partitions", help="create the coming months' partitions")
+    create.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+    detach = commands.add_parser("detach-partitions", help="detach (or drop) old monthly partitions")
+    detach.add_argument("--older-than-months", type=int, required=True)
+    detach.add_argument("--drop", action="store_true")
+    archive = commands.add_parser("archive-transcripts", help="move old transcripts to the compressed archive")
+    archive.add_argument("--older-than-days", type=int, default=settings.TRANSCRIPT_ARCHIVE_AFTER_DAYS)
+    invalidate = commands.add_parser("invalidate-catalog", help="drop a UMKM's cached catalog after product edits")
+    invalidate.add_argument("--umkm-id", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "ensure-schema":
+        ensure_schema()
+    elif args.command == "rebuild-rollup":
+        rebuild_rollup(args.umkm_id)
+    elif args.command == "purge-idempotency-keys":
+        purge_idempotency_keys(args.older_than_hours)
+    elif args.command == "init-inventory":
+        init_inventory(args.umkm_id)
+    elif args.command == "compact-inventory":
+        compact_inventory(args.umkm_id)
+    elif args.command == "partition-tables":
+        partition_tables(args.months_ahead)
+    elif args.command == "create-partitions":
+        create_partitions(args.months_ahead)
+    elif args.command == "detach-partitions":
+        detach_partitions(args.older_than_months, args.drop)
+    elif args.command == "archive-transcripts":
+        archive_transcripts(args.older_than_days)
+    elif args.command == "invalidate-catalog":
+        invalidate_catalog(args.umkm_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Monthly range partitions for sales and purchases.
+
+Each table is partitioned on its date column into `<table>_YYYY_MM`
+partitions, plus `<table>_default` for rows outside every partition
+(backdated offline imports, a month nobody created in time). The report
+and export queries all bound the date column with plain range predicates,
+so the planner only touches the months they ask for, and the newest
+partition stays small enough to remain in memory.
+
+Old months are detached, not deleted: the partition becomes a plain table
+(and its items are moved to `<items table>_YYYY_MM` next to it), ready to
+be dumped or dropped. Their daily totals stay in daily_sales_rollup, and
+their transcripts in transcript_archive once archive-transcripts has run.
+
+Items tables are not partitioned, they have no date; detaching moves the
+items of a detached month out of them instead.
+"""
+import logging
+import re
+from datetime import date
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# table -> (id column, date column, items table, items foreign key)
+PARTITIONED_TABLES = {
+    "sales": ("sale_id", "sale_date", "sales_items", "sale_id"),
+    "purchases": ("purchase_id", "purchase_date", "purchase_items", "purchase_id"),
+}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.execute(text("""
+        SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)
+    """), {"table": table}).scalar() or False
+
+
+def monthly_partitions(conn, table: str) -> dict:
+    """
+    {month: partition name} of the attached monthly partitions.
+    """
+    names = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+    """), {"table": table}).scalars().all()
+    pattern = re.compile(rf"^{table}_(\d{{4}})_(\d{{2}})$")
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(conn, table: str, month: date) -> bool:
+    """
+    Attach the partition for `month` if it is missing. Rows of that month
+    sitting in the default partition are moved into it first (Postgres
+    refuses to attach over them). Returns whether a partition was created.
+    """
+    if month in monthly_partitions(conn, table):
+        return False
+    _, date_column, _, _ = PARTITIONED_TABLES[table]
+    name = partition_name(table, month)
+    bounds = {"start": month, "stop": add_months(month, 1)}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {table}_default
+            WHERE {date_column} >= :start AND {date_column} < :stop
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds)
+    conn.execute(text(f"""
+        ALTER TABLE {table} ATTACH PARTITION {name}
+        FOR VALUES FROM ('{bounds["start"]}') TO ('{bounds["stop"]}')
+    """))
+    return True
+
+
+def ensure_partitions(conn, table: str, months_ahead: int, today: date = None) -> list:
+    """
+    Make sure this month and the next `months_ahead` have a partition.
+    """
+    current = month_start(today or date.today())
+    return [
+        partition_name(table, month)
+        for month in (add_months(current, n) for n in range(months_ahead + 1))
+        if create_partition(conn, table, month)
+    ]
+
+
+def convert_to_partitioned(conn, table: str, months_ahead: int) -> int:
+    """
+    Rebuild a plain `table` as a partitioned one, in the caller's
+    transaction: writers are locked out, every month that has rows gets
+    its partition, rows are copied over and the old table is dropped. The
+    caller recreates the secondary indexes (maintenance.SCHEMA_STATEMENTS).
+    Foreign keys from the items table are dropped as well, since Postgres
+    can only reference a partitioned table by its full (id, date) key;
+    items are still only written in the same transaction as their header.
+    Returns the number of rows copied.
+    """
+    id_column, date_column, _, _ = PARTITIONED_TABLES[table]
+    legacy = f"{table}_unpartitioned"
+    conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                            {"table": table, "column": id_column}).scalar()
+    referencing = conn.execute(text("""
+        SELECT conrelid::regclass::text AS referencing_table, conname
+        FROM pg_constraint WHERE confrelid = to_regclass(:table) AND contype = 'f'
+    """), {"table": table}).all()
+    for referencing_table, constraint in referencing:
+        conn.execute(text(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{constraint}"'))
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    conn.execute(text(f"""
+        CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE ({date_column})
+    """))
+    # Keep the id sequence alive when the old table is dropped
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.{id_column}"))
+    conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+
+    months = conn.execute(text(f"""
+        SELECT DISTINCT CAST(date_trunc('month', {date_column}) AS DATE) FROM {legacy} ORDER BY 1
+    """)).scalars().all()
+    for month in months:
+        create_partition(conn, table, month)
+    ensure_partitions(conn, table, months_ahead)
+
+    copied = conn.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy}")).rowcount
+    conn.execute(text(f"DROP TABLE {legacy}"))
+    # Built after the copy, and once the old table's {table}_pkey name is free
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY ({id_column}, {date_column})"))
+    conn.execute(text(f"ANALYZE {table}"))
+    return copied
+
+
+def detach_partitions(conn, table: str, older_than_months: int, drop: bool = False, today: date = None) -> list:
+    """
+    Detach the monthly partitions that end before `older_than_months`
+    months ago, moving their items into `<items table>_YYYY_MM`. With
+    `drop`, both are dropped instead of kept.
+    """
+    id_column, _, items_table, items_key = PARTITIONED_TABLES[table]
+    cutoff = add_months(month_start(today or date.today()), -older_than_months)
+    detached = []
+    for month, name in sorted(monthly_partitions(conn, table).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        items_name = partition_name(items_table, month)
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {items_name} (LIKE {items_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        """))
+        conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {items_table} i USING {name} h
+                WHERE i.{items_key} = h.{id_column}
+                RETURNING i.*
+            )
+            INSERT INTO {items_name} SELECT * FROM moved
+        """))
+        if drop:
+            conn.execute(text(f"DROP TABLE {items_name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+        logger.info("Partition %s", "dropped" if drop else "detached", extra={"partition": name})
+    return detached
@@ -1,9 +1,40 @@
-from google.cloud import speech_v1p1beta1 as speech
-from core.config import settings
 import os
+from core.config import settings
+
+# Clients are built on first use: importing google.cloud.speech pulls in
+# gRPC, which report-only workers and tests never need.
+_speech_client = None
+_speech_async_client = None
+
+
+def _configure_credentials():
+    # Make sure the environment variable is set (optional if already set globally)
+    if settings.GOOGLE_APPLICATION_CREDENTIALS:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = settings.GOOGLE_APPLICATION_CREDENTIALS
+
+
+def get_speech_client():
+    """
+    Singleton blocking Speech client.
+    """
+    global _speech_client
+    if _speech_client is None:
+        from google.cloud import speech_v1p1beta1 as speech
+
+        _configure_credentials()
+        _speech_client = speech.SpeechClient()
+    return _speech_client
+
 
-# Make sure the environment variable is set (optional if already set globally)
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = settings.GOOGLE_APPLICATION_CREDENTIALS
+def get_speech_async_client():
+    """
+    The async client binds its gRPC channel to the running event loop, so
+    besides being lazy it must be created from inside that loop.
+    """
+    global _speech_async_client
+    if _speech_async_client is None:
+        from google.cloud import speech_v1p1beta1 as speech
 
-# Create and reuse a singleton Speech client
-speech_client = speech.SpeechClient()
+        _configure_credentials()
+        _speech_async_client = speech.SpeechAsyncClient()
+    return _speech_async_client
@@ -1,8 +1,78 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, ORJSONResponse
 from api.v1.endpoints import router as api_router
 from fastapi.middleware.cors import CORSMiddleware
+from core.config import settings
+from core.compression import CompressionMiddleware
+from core.admission import AdmissionRejected
+from core.log import setup_logging, access_logger
+from core.metrics import registry, http_request_seconds, http_request_db_queries, start_query_count
+from services.jobs import job_runner
+from services.events import broker
+from services.llm import gateway as llm_gateway, get_llm_chain
+from services.inventory import compact_periodically
+from services.draft_store import draft_store
+from db.db import get_engine, dispose_engines
+from helper.gcp import get_speech_client, get_speech_async_client
+from core.executor import run_blocking
 
-app = FastAPI()
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def _warm_up_blocking():
+    from sqlalchemy import text
+
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+    get_speech_client()
+    get_llm_chain()
+
+
+async def warm_up():
+    """
+    Build the clients and open a first DB connection now rather than in
+    the first request. A failure is logged, not fatal: the same error will
+    surface on first use, and report-only deployments may lack credentials.
+    """
+    start = time.perf_counter()
+    try:
+        await run_blocking(_warm_up_blocking)
+        # bound to the running loop, so created here and not in a thread
+        get_speech_async_client()
+    except Exception:
+        logger.exception("Startup warm-up failed")
+        return
+    logger.info("Startup warm-up done", extra={"duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_runner.start()
+    await broker.start()
+    if settings.STARTUP_WARMUP:
+        await warm_up()
+    compaction = None
+    if settings.INVENTORY_MODE == "ledger" and settings.INVENTORY_COMPACT_INTERVAL_SECONDS > 0:
+        compaction = asyncio.create_task(compact_periodically(settings.INVENTORY_COMPACT_INTERVAL_SECONDS))
+    draft_gc = asyncio.create_task(draft_store.collect_periodically(settings.DRAFT_STORE_GC_INTERVAL_SECONDS))
+    yield
+    draft_gc.cancel()
+    if compaction is not None:
+        compaction.cancel()
+    await job_runner.stop()
+    await broker.stop()
+    await llm_gateway.stop()
+    await dispose_engines()
+
+
+# orjson serializes dicts several times faster than the stdlib encoder
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,14 +81,55 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_BYTES,
+    gzip_level=settings.GZIP_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
+)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return ORJSONResponse(
+        {"detail": str(exc)},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"Request: {request.method} {request.url}")
-    response = await call_next(request)
-    print(f"Response status: {response.status_code}")
-    return response
+async def record_requests(request: Request, call_next):
+    start = time.perf_counter()
+    queries = start_query_count()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_request_seconds.observe(elapsed, method=request.method, route=route_path, status=status)
+        http_request_db_queries.observe(queries[0], route=route_path)
+
+        level = logging.WARNING if status >= 500 or elapsed >= settings.SLOW_REQUEST_SECONDS else logging.INFO
+        access_logger.log(level, "request", extra={
+            "method": request.method,
+            "route": route_path,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "db_queries": queries[0],
+        })
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 # Include the API router
 
-app.include_router(api_router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(api_router, prefix="/api/v1")
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import List, Literal
 
 from typing import Optional
+import datetime as dt
 
 
 class PrepareTranscriptRequest(BaseModel):
@@ -30,6 +31,15 @@ class TransactionFromLLM(BaseModel):
     transcript: str = ""
     items: List[TransactionItem]
 
+class DraftItemEdit(BaseModel):
+    product_id: int
+    quantity: int  # 0 removes the product from the draft
+    unit_price: Optional[float] = None  # purchases only
+
+class DraftConfirmRequest(BaseModel):
+    umkm_id: int
+    edits: List[DraftItemEdit] = []
+
 class TransactionRequest(BaseModel):
     umkm_id: int
 
@@ -37,3 +47,35 @@ class MonthlyTransaction(BaseModel):
     umkm_id: int
     year: int
     month: int
+
+
+# Report responses
+
+class DailyTotal(BaseModel):
+    date: dt.date
+    total_amount: float
+
+class MonthlyTransactionResponse(BaseModel):
+    umkm_id: str
+    data: List[DailyTotal]
+
+class PeriodTotals(BaseModel):
+    total_sales: float
+    total_transactions: int
+
+class TransactionSummaryResponse(BaseModel):
+    umkm_id: str
+    daily: PeriodTotals
+    monthly: PeriodTotals
+
+class SaleOut(BaseModel):
+    sale_id: int
+    sale_date: dt.datetime
+    status: Optional[str] = None
+    total_amount: float
+    items: List[TransactionItem]
+
+class TransactionHistoryResponse(BaseModel):
+    umkm_id: str
+    data: List[SaleOut]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,155 @@
+"""
+Cold storage for old transcripts.
+
+Transcripts are only read when someone opens a single old transaction,
+yet they are most of the bytes of every sales/purchases row. Once a row
+is older than TRANSCRIPT_ARCHIVE_AFTER_DAYS its transcript is moved into
+transcript_archive: per UMKM, blocks of up to TRANSCRIPT_ARCHIVE_BATCH_ROWS
+transcripts as one zstd-compressed JSON object {id: transcript}. Short,
+similar sentences compress far better together than row by row. The
+transcript column of the row is set to NULL.
+
+lookup_transcript() reads the hot row first and falls back to the
+archive, keeping recently decompressed blocks in memory.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Optional
+import zstandard
+from cachetools import LRUCache
+from sqlalchemy import text
+from core.config import settings
+from core.metrics import registry
+from db.db import get_engine
+
+logger = logging.getLogger(__name__)
+
+# kind -> (table, id column, date column)
+ARCHIVED_TABLES = {
+    "sale": ("sales", "sale_id", "sale_date"),
+    "purchase": ("purchases", "purchase_id", "purchase_date"),
+}
+
+transcript_lookups_total = registry.counter(
+    "transcript_lookups_total", "Transcript lookups by where they were found", ("source",),
+)
+
+_blocks = LRUCache(maxsize=settings.TRANSCRIPT_ARCHIVE_CACHE_BLOCKS)
+_blocks_lock = threading.Lock()
+
+
+def _compress(transcripts: dict) -> bytes:
+    raw = json.dumps(transcripts, ensure_ascii=False, separators=(",", ":")).encode()
+    return zstandard.ZstdCompressor(level=settings.TRANSCRIPT_ARCHIVE_ZSTD_LEVEL).compress(raw)
+
+
+def _decompress(payload: bytes) -> dict:
+    return json.loads(zstandard.ZstdDecompressor().decompress(payload))
+
+
+def _archive_batch(conn, kind: str, cutoff_days: int, batch_rows: int) -> tuple:
+    table, id_column, date_column = ARCHIVED_TABLES[kind]
+    rows = conn.execute(text(f"""
+        SELECT umkm_id, {id_column} AS id, transcript FROM {table}
+        WHERE transcript IS NOT NULL AND {date_column} < NOW() - make_interval(days => :days)
+        ORDER BY umkm_id, {id_column}
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    """), {"days": cutoff_days, "limit": batch_rows}).all()
+    if not rows:
+        return 0, 0, 0
+
+    by_umkm = {}
+    for row in rows:
+        by_umkm.setdefault(row.umkm_id, {})[str(row.id)] = row.transcript
+    raw_bytes = stored_bytes = 0
+    for umkm_id, transcripts in by_umkm.items():
+        payload = _compress(transcripts)
+        ids = [int(record_id) for record_id in transcripts]
+        size = sum(len(transcript.encode()) for transcript in transcripts.values())
+        conn.execute(text("""
+            INSERT INTO transcript_archive (kind, umkm_id, first_id, last_id, row_count, raw_bytes, payload)
+            VALUES (:kind, :umkm_id, :first_id, :last_id, :row_count, :raw_bytes, :payload)
+        """), {
+            "kind": kind, "umkm_id": umkm_id, "first_id": min(ids), "last_id": max(ids),
+            "row_count": len(ids), "raw_bytes": size, "payload": payload,
+        })
+        raw_bytes += size
+        stored_bytes += len(payload)
+
+    # The date predicate lets the planner skip the partitions that are too new
+    conn.execute(text(f"""
+        UPDATE {table} SET transcript = NULL
+        WHERE {id_column} = ANY(CAST(:ids AS integer[]))
+        AND {date_column} < NOW() - make_interval(days => :days)
+    """), {"ids": [row.id for row in rows], "days": cutoff_days})
+    return len(rows), raw_bytes, stored_bytes
+
+
+def archive_transcripts(older_than_days: int = None, batch_rows: int = None) -> dict:
+    """
+    Move every transcript older than `older_than_days` into the archive,
+    one short transaction per block so confirms are never held up.
+    """
+    older_than_days = settings.TRANSCRIPT_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_rows = batch_rows or settings.TRANSCRIPT_ARCHIVE_BATCH_ROWS
+    start = time.perf_counter()
+    stats = {"rows": 0, "raw_bytes": 0, "stored_bytes": 0}
+    for kind in ARCHIVED_TABLES:
+        while True:
+            with get_engine().begin() as conn:
+                rows, raw_bytes, stored_bytes = _archive_batch(conn, kind, older_than_days, batch_rows)
+            if not rows:
+                break
+            stats["rows"] += rows
+            stats["raw_bytes"] += raw_bytes
+            stats["stored_bytes"] += stored_bytes
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _archived_transcript(db, kind: str, umkm_id: int, record_id: int) -> Optional[str]:
+    blocks = db.execute(text("""
+        SELECT first_id FROM transcript_archive
+        WHERE kind = :kind AND umkm_id = :umkm_id AND first_id <= :id AND last_id >= :id
+    """), {"kind": kind, "umkm_id": umkm_id, "id": record_id}).scalars().all()
+    for first_id in blocks:
+        key = (kind, umkm_id, first_id)
+        with _blocks_lock:
+            transcripts = _blocks.get(key)
+        if transcripts is None:
+            payload = db.execute(text("""
+                SELECT payload FROM transcript_archive
+                WHERE kind = :kind AND umkm_id = :umkm_id AND first_id = :first_id
+            """), {"kind": kind, "umkm_id": umkm_id, "first_id": first_id}).scalar()
+            # Blocks never change once written, so caching them needs no invalidation
+            transcripts = _decompress(bytes(payload))
+            with _blocks_lock:
+                _blocks[key] = transcripts
+        if str(record_id) in transcripts:
+            return transcripts[str(record_id)]
+    return None
+
+
+def lookup_transcript(db, kind: str, umkm_id: int, record_id: int) -> Optional[dict]:
+    """
+    {"transcript", "archived"} for one sale or purchase, or None when the
+    transaction is unknown (not in the table and never archived).
+    """
+    table, id_column, _ = ARCHIVED_TABLES[kind]
+    row = db.execute(text(f"""
+        SELECT transcript FROM {table} WHERE {id_column} = :id AND umkm_id = :umkm_id
+    """), {"id": record_id, "umkm_id": umkm_id}).fetchone()
+    if row is not None and row.transcript is not None:
+        transcript_lookups_total.inc(source="table")
+        return {"transcript": row.transcript, "archived": False}
+
+    transcript = _archived_transcript(db, kind, umkm_id, record_id)
+    if transcript is not None:
+        transcript_lookups_total.inc(source="archive")
+        return {"transcript": transcript, "archived": True}
+    transcript_lookups_total.inc(source="missing")
+    # A row whose transcript was simply never recorded
+    return {"transcript": None, "archived": False} if row is not None else None
@@ -0,0 +1,242 @@
+"""
+Audio preprocessing before Speech-to-Text: sniff the container, decode,
+downmix to mono, resample to 16 kHz and trim leading/trailing silence, so
+Google receives (and bills) less audio. Everything after decoding is
+vectorized NumPy; callers run it off the event loop.
+"""
+import logging
+import shutil
+import struct
+import subprocess
+import numpy as np
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+audio_bytes_total = registry.counter("audio_bytes_total", "Audio bytes before/after preprocessing", ("stage",))
+audio_seconds_total = registry.counter("audio_seconds_total", "Audio seconds before/after preprocessing", ("stage",))
+
+
+class AudioRejected(ValueError):
+    """
+    The upload is too large, too long or not audio we can handle.
+    """
+
+
+class PreparedAudio:
+    __slots__ = ("content", "encoding", "sample_rate_hertz", "duration_seconds", "original_bytes", "container")
+
+    def __init__(self, content, encoding, sample_rate_hertz, duration_seconds, original_bytes, container):
+        self.content = content
+        # RecognitionConfig.AudioEncoding member name
+        self.encoding = encoding
+        self.sample_rate_hertz = sample_rate_hertz
+        self.duration_seconds = duration_seconds
+        self.original_bytes = original_bytes
+        self.container = container
+
+
+def sniff_container(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"OggS":
+        return "ogg"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return "unknown"
+
+
+def passthrough_format(container: str, data: bytes):
+    """
+    (encoding, sample rate) to send an undecoded upload as-is.
+    """
+    if container == "webm":
+        return "WEBM_OPUS", 48000
+    if container == "ogg":
+        # OpusHead: magic(8) version(1) channels(1) pre-skip(2) input rate(4)
+        head = data.find(b"OpusHead")
+        if head >= 0 and len(data) >= head + 16:
+            rate = struct.unpack_from("<I", data, head + 12)[0]
+            if rate in (8000, 12000, 16000, 24000, 48000):
+                return "OGG_OPUS", rate
+        return "OGG_OPUS", 48000
+    if container == "flac":
+        # STREAMINFO follows the 4-byte block header; rate is 20 bits at offset 10
+        if len(data) >= 21:
+            return "FLAC", int.from_bytes(data[18:21], "big") >> 4
+        return "FLAC", 16000
+    if container == "mp3":
+        return "MP3", 16000
+    raise AudioRejected("Unsupported audio format")
+
+
+def parse_wav(data: bytes):
+    """
+    Decode a RIFF/WAVE file into (float32 samples shaped (frames, channels),
+    sample rate). Handles PCM 8/16/24/32-bit and 32/64-bit float, and the
+    0xFFFFFFFF sizes ffmpeg writes when streaming to a pipe.
+    """
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if tag == 0xFFFE and size >= 26:
+                tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioRejected("WAV data before fmt chunk")
+            end = len(data) if size == 0xFFFFFFFF else min(len(data), body + size)
+            return _pcm_to_float(data[body:end], *fmt)
+        pos = body + size + (size & 1)
+    raise AudioRejected("WAV without data chunk")
+
+
+def _pcm_to_float(raw: bytes, tag: int, channels: int, rate: int, bits: int):
+    width = bits // 8
+    raw = raw[:len(raw) - len(raw) % (width * channels)]
+    if tag == 3 and bits == 32:
+        samples = np.frombuffer(raw, dtype="<f4")
+    elif tag == 3 and bits == 64:
+        samples = np.frombuffer(raw, dtype="<f8").astype(np.float32)
+    elif tag == 1 and bits == 16:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif tag == 1 and bits == 32:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif tag == 1 and bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif tag == 1 and bits == 24:
+        triples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608.0
+    else:
+        raise AudioRejected(f"Unsupported WAV encoding (format {tag}, {bits} bit)")
+    return samples.reshape(-1, channels), rate
+
+
+def _decode_with_ffmpeg(data: bytes):
+    ffmpeg = shutil.which(settings.FFMPEG_PATH)
+    if ffmpeg is None:
+        return None
+    # Decode at most a second past the limit: a small, highly compressed
+    # upload could otherwise expand to gigabytes of float32 before
+    # preprocess_audio() gets to check its duration
+    limit = f"{settings.AUDIO_MAX_SECONDS + 1:g}"
+    try:
+        result = subprocess.run(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-t", limit, "-f", "wav", "-acodec", "pcm_f32le", "pipe:1"],
+            input=data, capture_output=True, timeout=30,
+        )
+    except subprocess.TimeoutExpired:
+        raise AudioRejected("Decoding the audio took too long")
+    if result.returncode != 0:
+        raise AudioRejected(f"Could not decode audio: {result.stderr.decode(errors='ignore').strip()[:200]}")
+    return parse_wav(result.stdout)
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """
+    Windowed-sinc low-pass (when downsampling) followed by linear
+    interpolation onto the target grid.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        cutoff = 0.5 * target_rate / source_rate
+        taps = np.arange(-32, 33)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, (kernel / kernel.sum()).astype(np.float32), mode="same")
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    source_times = np.arange(len(samples)) / source_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def trim_silence(samples: np.ndarray, rate: int, threshold_db: float, padding: float, frame_seconds: float = 0.02) -> np.ndarray:
+    """
+    Energy VAD: drop leading and trailing 20 ms frames quieter than
+    `threshold_db` dBFS, keeping `padding` seconds around the voiced part.
+    When the clip's noise floor is under `threshold_db` but close to it,
+    the threshold is raised to 10 dB over the floor; if nothing clears
+    that (speech barely above steady background), the plain threshold is
+    used, so a clip loud throughout is never dropped.
+    """
+    frame = max(1, int(rate * frame_seconds))
+    frames = len(samples) // frame
+    if frames == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[:frames * frame].reshape(frames, frame) ** 2, axis=1) + 1e-12)
+    level_db = 20 * np.log10(rms)
+    floor = np.percentile(level_db, 10)
+    threshold = max(threshold_db, floor + 10) if floor < threshold_db else threshold_db
+    voiced = np.flatnonzero(level_db > threshold)
+    if voiced.size == 0:
+        voiced = np.flatnonzero(level_db > threshold_db)
+    if voiced.size == 0:
+        return samples[:0]
+    pad = int(padding * rate)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def preprocess_audio(data: bytes) -> PreparedAudio:
+    """
+    Turn an upload into what Speech-to-Text should receive. Decodable audio
+    becomes 16 kHz mono LINEAR16 with silence trimmed; anything we can't
+    decode here is passed through with the encoding its container implies,
+    up to AUDIO_PASSTHROUGH_MAX_BYTES.
+    """
+    if len(data) > settings.AUDIO_MAX_BYTES:
+        raise AudioRejected(f"Audio is larger than {settings.AUDIO_MAX_BYTES} bytes")
+    container = sniff_container(data)
+    if container == "unknown":
+        raise AudioRejected("Unsupported audio format")
+
+    decoded = parse_wav(data) if container == "wav" else _decode_with_ffmpeg(data)
+    audio_bytes_total.inc(len(data), stage="received")
+    if decoded is None:
+        # Nothing to measure the duration on, so the size stands in for it
+        if len(data) > settings.AUDIO_PASSTHROUGH_MAX_BYTES:
+            raise AudioRejected(
+                f"Audio that can't be decoded here must be under {settings.AUDIO_PASSTHROUGH_MAX_BYTES} bytes"
+            )
+        encoding, rate = passthrough_format(container, data)
+        audio_bytes_total.inc(len(data), stage="sent")
+        return PreparedAudio(data, encoding, rate, None, len(data), container)
+
+    samples, rate = decoded
+    duration = len(samples) / rate
+    if duration > settings.AUDIO_MAX_SECONDS:
+        raise AudioRejected(f"Audio is longer than {settings.AUDIO_MAX_SECONDS:g} seconds")
+
+    mono = resample(downmix(samples), rate, settings.AUDIO_TARGET_SAMPLE_RATE)
+    if settings.AUDIO_TRIM_SILENCE:
+        mono = trim_silence(mono, settings.AUDIO_TARGET_SAMPLE_RATE,
+                            settings.AUDIO_SILENCE_THRESHOLD_DB, settings.AUDIO_SILENCE_PADDING_SECONDS)
+    pcm = (np.clip(mono, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+    trimmed = len(mono) / settings.AUDIO_TARGET_SAMPLE_RATE
+    audio_seconds_total.inc(duration, stage="received")
+    audio_seconds_total.inc(trimmed, stage="sent")
+    audio_bytes_total.inc(len(pcm), stage="sent")
+    logger.debug("Preprocessed audio", extra={
+        "container": container, "bytes_in": len(data), "bytes_out": len(pcm),
+        "seconds_in": round(duration, 2), "seconds_out": round(trimmed, 2),
+    })
+    return PreparedAudio(pcm, "LINEAR16", settings.AUDIO_TARGET_SAMPLE_RATE, trimmed, len(data), container)
@@ -0,0 +1,232 @@
+"""
+Bulk offline import: a day's worth of voice notes or a CSV export synced
+in one request. The catalog is fetched once per import, drafts are
+generated concurrently (bounded), and confirmed transactions are written
+in batches through create_transactions_bulk. Progress is yielded as
+events so the endpoint can stream it instead of buffering the whole batch.
+"""
+import asyncio
+import csv
+import io
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from pydantic import ValidationError
+from schemas.schemas import Product, TransactionFromLLM, TransactionItem
+from services.draft import generate_draft_from_audio, DraftPipelineError
+from services.draft_store import draft_store, resolve_items
+from services.transaction import create_transactions_bulk
+from services.transcript import fetch_product_list
+from db.db import SessionLocal
+from core.config import settings
+from core.executor import run_blocking
+from core.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ("ref", "transaction_type", "product_id", "product_name", "quantity", "unit_price", "date")
+
+
+class BulkImportError(ValueError):
+    """
+    The batch as a whole can't be imported (too large, unreadable CSV).
+    """
+
+
+def _write_batch(umkm_id: int, entries: List[Tuple[TransactionFromLLM, Optional[datetime]]]) -> dict:
+    db = SessionLocal()
+    try:
+        with stage_timer("write", pipeline="bulk"):
+            return create_transactions_bulk(umkm_id, entries, db)
+    finally:
+        db.close()
+
+
+async def _flush(umkm_id: int, pending: list) -> AsyncIterator[dict]:
+    """
+    Write `pending` [(ref, payload, occurred_at)] as one batch and yield a
+    "confirmed" event per transaction (or one "error" for the batch).
+    """
+    batch = list(pending)
+    pending.clear()
+    try:
+        written = await run_blocking(_write_batch, umkm_id, [(payload, at) for _, payload, at in batch])
+    except Exception as e:
+        for ref, _, _ in batch:
+            yield {"type": "error", "ref": ref, "stage": "write", "detail": str(e)}
+        return
+    for (ref, _, _), result in zip(batch, written["results"]):
+        yield {"type": "confirmed", "ref": ref, **result}
+    yield {"type": "stock", "stock": written["stock"]}
+
+
+async def import_audio(
+    umkm_id: int,
+    clips: list,
+    confirm: bool = False,
+    limits: dict = None,
+) -> AsyncIterator[dict]:
+    """
+    Draft every clip in `clips` [(name, UploadFile)] with at most
+    BULK_IMPORT_CONCURRENCY in flight, yielding a "draft" or "error" event
+    per clip as it finishes (completion order, `ref` is the clip's name).
+    With `confirm`, drafts with items are resolved against the catalog like
+    stored drafts (sales at the catalog price) and written in batches of
+    BULK_IMPORT_BATCH_SIZE as they come in; a draft with products the
+    catalog doesn't know is stored instead and reported as an "error" with
+    its draft_id, to be fixed and confirmed by hand.
+    """
+    if len(clips) > settings.BULK_IMPORT_MAX_FILES:
+        raise BulkImportError(f"At most {settings.BULK_IMPORT_MAX_FILES} clips per import")
+
+    catalog = await fetch_product_list(umkm_id)
+    semaphore = asyncio.Semaphore(settings.BULK_IMPORT_CONCURRENCY)
+
+    async def draft(name, upload):
+        async with semaphore:
+            # Read inside the slot so only the clips being processed are in memory
+            audio_bytes = await upload.read()
+            try:
+                return name, await generate_draft_from_audio(audio_bytes, umkm_id, limits=limits, catalog=catalog), None
+            except DraftPipelineError as e:
+                return name, None, e
+
+    tasks = [asyncio.create_task(draft(name, upload)) for name, upload in clips]
+    pending = []
+    drafted = failed = confirmed = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            name, result, error = await finished
+            if error is not None:
+                failed += 1
+                yield {"type": "error", "ref": name, "stage": error.stage, "detail": str(error.error)}
+                continue
+            drafted += 1
+            transaction = result["draft_transaction"]
+            event = {
+                "type": "draft",
+                "ref": name,
+                "transcript": result["transcript"],
+                "parsed_by": result["parsed_by"],
+                "draft_transaction": transaction.model_dump(),
+            }
+            if not confirm:
+                # Reviewed later, one by one, through /drafts/{draft_id}/confirm
+                event["draft_id"] = (await draft_store.save(umkm_id, result, catalog=catalog))["draft_id"]
+            yield event
+            if confirm and transaction.items:
+                items, unresolved = resolve_items(transaction.transaction_type, transaction.items, catalog)
+                if unresolved:
+                    failed += 1
+                    stored = await draft_store.save(umkm_id, result, catalog=catalog)
+                    products = ", ".join(str(item["product_id"]) for item in unresolved)
+                    yield {
+                        "type": "error", "ref": name, "stage": "validate", "draft_id": stored["draft_id"],
+                        "detail": f"Products not in the catalog or with an invalid quantity: {products}",
+                    }
+                    continue
+                resolved = transaction.model_copy(update={"items": [TransactionItem(**line) for line in items]})
+                pending.append((name, resolved, None))
+                if len(pending) >= settings.BULK_IMPORT_BATCH_SIZE:
+                    async for event in _flush(umkm_id, pending):
+                        confirmed += event["type"] == "confirmed"
+                        yield event
+        if pending:
+            async for event in _flush(umkm_id, pending):
+                confirmed += event["type"] == "confirmed"
+                yield event
+    finally:
+        # Client went away: don't keep paying for STT/LLM on its behalf
+        for task in tasks:
+            task.cancel()
+    yield {"type": "summary", "drafted": drafted, "confirmed": confirmed, "failed": failed}
+
+
+def _resolve_item(row: dict, by_id: dict, by_name: dict) -> TransactionItem:
+    product = None
+    if row.get("product_id"):
+        product = by_id.get(int(row["product_id"]))
+    elif row.get("product_name"):
+        product = by_name.get(row["product_name"].strip().lower())
+    if product is None:
+        raise ValueError(f"Unknown product {row.get('product_id') or row.get('product_name')!r}")
+    quantity = int(row["quantity"])
+    if quantity <= 0:
+        raise ValueError(f"Invalid quantity {quantity} for product {product.product_id}")
+    unit_price = float(row["unit_price"]) if row.get("unit_price") else product.price
+    if unit_price < 0:
+        raise ValueError(f"Invalid unit price {unit_price:g} for product {product.product_id}")
+    return TransactionItem(
+        product_id=product.product_id,
+        name=product.name,
+        quantity=quantity,
+        unit_price=unit_price,
+    )
+
+
+def parse_transactions_csv(data: bytes, umkm_id: int, catalog: List[Product]) -> Tuple[list, list]:
+    """
+    Group CSV rows (CSV_COLUMNS; one row per item, rows sharing a `ref` are
+    one transaction) into transactions. Products are given by id or by exact
+    catalog name; quantities must be positive, `unit_price` (not negative)
+    defaults to the catalog price and `date` (ISO 8601) to now.
+
+    Returns ([(ref, payload, occurred_at)], [error events]).
+    """
+    try:
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    except UnicodeDecodeError:
+        raise BulkImportError("CSV must be UTF-8")
+    missing = {"quantity"} - set(reader.fieldnames or ())
+    if missing or not {"product_id", "product_name"} & set(reader.fieldnames or ()):
+        raise BulkImportError(f"CSV needs the columns {', '.join(CSV_COLUMNS)}")
+
+    by_id = {p.product_id: p for p in catalog}
+    by_name = {p.name.strip().lower(): p for p in catalog}
+    groups = OrderedDict()
+    errors = []
+    for line, row in enumerate(reader, start=2):
+        if line - 1 > settings.BULK_IMPORT_MAX_CSV_ROWS:
+            raise BulkImportError(f"At most {settings.BULK_IMPORT_MAX_CSV_ROWS} rows per import")
+        ref = row.get("ref") or f"line-{line}"
+        group = groups.setdefault(ref, {"type": row.get("transaction_type") or "sale", "date": row.get("date"), "items": [], "error": None})
+        if group["error"]:
+            continue
+        try:
+            group["items"].append(_resolve_item(row, by_id, by_name))
+        except (ValueError, ValidationError) as e:
+            group["error"] = f"line {line}: {e}"
+
+    entries = []
+    for ref, group in groups.items():
+        if group["error"]:
+            errors.append({"type": "error", "ref": ref, "stage": "validate", "detail": group["error"]})
+            continue
+        try:
+            payload = TransactionFromLLM(umkm_id=umkm_id, transaction_type=group["type"], transcript="", items=group["items"])
+            occurred_at = datetime.fromisoformat(group["date"]) if group["date"] else None
+        except (ValueError, ValidationError) as e:
+            errors.append({"type": "error", "ref": ref, "stage": "validate", "detail": str(e)})
+            continue
+        entries.append((ref, payload, occurred_at))
+    return entries, errors
+
+
+async def import_csv(umkm_id: int, data: bytes) -> AsyncIterator[dict]:
+    """
+    Validate the CSV against the catalog, then write it in batches of
+    BULK_IMPORT_BATCH_SIZE transactions, yielding progress per batch.
+    """
+    catalog = await fetch_product_list(umkm_id)
+    entries, errors = await run_blocking(parse_transactions_csv, data, umkm_id, catalog)
+    for event in errors:
+        yield event
+
+    confirmed = 0
+    for start in range(0, len(entries), settings.BULK_IMPORT_BATCH_SIZE):
+        pending = entries[start:start + settings.BULK_IMPORT_BATCH_SIZE]
+        async for event in _flush(umkm_id, pending):
+            confirmed += event["type"] == "confirmed"
+            yield event
+    yield {"type": "summary", "confirmed": confirmed, "failed": len(entries) + len(errors) - confirmed}
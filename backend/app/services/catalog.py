@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from core.config import settings
+from core.versioning import version_backend
+from core.executor import run_blocking
+from core.metrics import stats_gauge
+from schemas.schemas import Product
+
+# Rough per-object overhead used for the memory cap; exact accounting of
+# Pydantic objects isn't worth the cost on every put.
+_PRODUCT_OVERHEAD_BYTES = 400
+
+
+def catalog_version_key(umkm_id: int) -> str:
+    return f"catalog:{umkm_id}"
+
+
+class _Entry:
+    __slots__ = ("products", "version", "expires_at", "size")
+
+    def __init__(self, products, version, expires_at, size):
+        self.products = products
+        self.version = version
+        self.expires_at = expires_at
+        self.size = size
+
+
+class CatalogCache:
+    """
+    In-process cache of the active product list per UMKM.
+
+    Entries expire after `ttl` seconds, the least recently used ones are
+    evicted past `max_entries` or `max_bytes`, and every entry remembers the
+    catalog version it was loaded under. Writers bump the version in the
+    shared backend, so a stale entry is dropped on the next read in any
+    worker that shares the backend.
+    """
+    def __init__(self, backend, ttl: float, max_entries: int, max_bytes: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def version(self, umkm_id: int) -> int:
+        return self.backend.get(catalog_version_key(umkm_id))
+
+    async def aversion(self, umkm_id: int) -> int:
+        """
+        version() for the event loop: a shared (Redis) backend is read on
+        the blocking executor instead of stalling the loop.
+        """
+        if self.backend.blocking:
+            return await run_blocking(self.version, umkm_id)
+        return self.version(umkm_id)
+
+    def get(self, umkm_id: int) -> Optional[List[Product]]:
+        return self.lookup(umkm_id, self.version(umkm_id))
+
+    def lookup(self, umkm_id: int, version: int) -> Optional[List[Product]]:
+        """
+        get() against a version the caller has already read.
+        """
+        with self._lock:
+            entry = self._entries.get(umkm_id)
+            if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._drop(umkm_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(umkm_id)
+            self.hits += 1
+            return entry.products
+
+    def put(self, umkm_id: int, products: List[Product], version: int):
+        """
+        Store `products` loaded under `version`. Read the version *before*
+        querying the database, so an invalidation racing with the query
+        leaves the new entry already stale instead of hiding the write.
+        """
+        size = sum(_PRODUCT_OVERHEAD_BYTES + len(p.name) for p in products)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if umkm_id in self._entries:
+                self._drop(umkm_id)
+            self._entries[umkm_id] = _Entry(products, version, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, umkm_id: int):
+        self.backend.bump(catalog_version_key(umkm_id))
+        with self._lock:
+            self.invalidations += 1
+            if umkm_id in self._entries:
+                self._drop(umkm_id)
+
+    def _drop(self, umkm_id: int):
+        entry = self._entries.pop(umkm_id)
+        self._bytes -= entry.size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+catalog_cache = CatalogCache(
+    version_backend,
+    ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+    max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    max_bytes=settings.CATALOG_CACHE_MAX_BYTES,
+)
+
+stats_gauge("catalog_cache", "Product catalog cache counters", catalog_cache.stats)
+
+
+def catalog_fingerprint(products: List[Product]) -> str:
+    """
+    Hash of what the catalog holds, the same in every worker and across
+    restarts (unlike the version counter).
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for product in sorted(products, key=lambda p: p.product_id):
+        digest.update(f"{product.product_id}\x1f{product.name}\x1f{product.price}\x1e".encode())
+    return digest.hexdigest()
+
+
+def invalidate_catalog(umkm_id: int):
+    """
+    Call after any write that touches what the catalog holds (names,
+    prices, activation) has been committed. Stock is not cached, so sales
+    and purchases must not call this: every cached catalog, matcher index
+    and transcript result of the UMKM would be thrown away with it.
+    Products are edited outside the API, which runs this through
+    `python -m db.maintenance invalidate-catalog`.
+    """
+    catalog_cache.invalidate(umkm_id)
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from schemas.schemas import ParseTranscriptRequest, Product
+from services.speech import speech_to_text_async
+from services.audio import AudioRejected
+from services.transcript import fetch_product_list
+from services.llm import aparse_transcript_with_llm
+from services.llm_gateway import LLMOverloaded
+from core.resilience import CircuitOpen, UpstreamTimeout
+from core.admission import admission, AdmissionRejected
+from services.matcher import matchers
+from services.catalog import catalog_cache
+from services.idempotency import transcript_cache
+from core.config import settings
+from core.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+class DraftPipelineError(Exception):
+    """
+    Raised when one stage of the draft pipeline fails. `stage` is the
+    human readable step name used in the HTTP error detail; `status_code`
+    is 422 when the input itself was rejected, so retrying won't help, and
+    429 when admission control turned the call away.
+    """
+    def __init__(self, stage: str, error: Exception, status_code: int = 500):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code >= 500
+
+
+def _upstream_status(error: Exception) -> int:
+    if isinstance(error, AdmissionRejected):
+        return 429
+    if isinstance(error, (CircuitOpen, LLMOverloaded)):
+        return 503
+    if isinstance(error, UpstreamTimeout):
+        return 504
+    return 500
+
+
+@asynccontextmanager
+async def _upstream_slot(limits: Optional[dict], upstream: str, umkm_id: int, pace: bool):
+    """
+    Admission for one upstream call (core/admission.py). Interactive
+    callers get AdmissionRejected when their UMKM is over its rate or its
+    queue is full. Batch callers queue as long as it takes; with `pace` they
+    also sleep off the UMKM's rate, before taking their own semaphore so a
+    throttled UMKM holds nothing shared while it waits.
+    """
+    if not limits or upstream not in limits:
+        async with admission.slot(upstream, umkm_id):
+            yield
+        return
+    if pace:
+        await admission.pace(upstream, umkm_id)
+    else:
+        await admission.check(upstream, umkm_id)
+    async with limits[upstream]:
+        async with admission.slot(upstream, umkm_id, patient=True, take_tokens=False):
+            yield
+
+
+async def generate_draft_from_audio(
+    audio_bytes: bytes,
+    umkm_id: int,
+    limits: dict = None,
+    catalog: List[Product] = None,
+    pace: bool = True,
+) -> dict:
+    """
+    Audio -> transcript -> draft transaction.
+
+    Speech recognition and the product list fetch don't depend on each other,
+    so both run concurrently; only the LLM step waits for both.
+
+    `limits` optionally maps "speech"/"openai" to semaphores that cap how
+    many calls the caller lets run against each upstream; such batch
+    callers wait out their UMKM's rate, or with `pace=False` get a 429
+    DraftPipelineError to reschedule themselves. Batch callers pass the
+    already fetched `catalog` so it is read once per batch.
+    """
+    async def transcribe():
+        async with _upstream_slot(limits, "speech", umkm_id, pace):
+            return await speech_to_text_async(audio_bytes)
+
+    async def products():
+        if catalog is not None:
+            return catalog
+        return await fetch_product_list(umkm_id)
+
+    # Read before the fetch: a catalog change racing with this request then
+    # leaves its cached LLM result under the older, already stale version
+    catalog_version = await catalog_cache.aversion(umkm_id)
+    transcript, product_list = await asyncio.gather(
+        transcribe(),
+        products(),
+        return_exceptions=True,
+    )
+    if isinstance(transcript, AudioRejected):
+        raise DraftPipelineError("Audio preprocessing", transcript, status_code=422)
+    if isinstance(transcript, Exception):
+        raise DraftPipelineError("Speech-to-text", transcript, status_code=_upstream_status(transcript))
+    if isinstance(product_list, Exception):
+        raise DraftPipelineError("Prepare transcript", product_list)
+
+    # Simple utterances whose products all match confidently skip the LLM;
+    # otherwise the LLM only sees the closest candidates, not the whole catalog
+    with stage_timer("match"):
+        matcher = matchers.get(umkm_id, product_list)
+        match = matcher.match(transcript) if settings.MATCHER_BYPASS_LLM else None
+    if match is not None and match.confident:
+        parse_result = match.to_transaction(umkm_id, transcript)
+        return {
+            "transcript": transcript,
+            "draft_transaction": parse_result,
+            "parsed_by": "matcher",
+        }
+
+    cached = transcript_cache.get(umkm_id, catalog_version, transcript)
+    if cached is not None:
+        return {
+            "transcript": transcript,
+            "draft_transaction": cached,
+            "parsed_by": "cache",
+        }
+
+    if len(product_list) > settings.MATCHER_TOP_K:
+        product_list = matcher.candidates(transcript, settings.MATCHER_TOP_K)
+
+    try:
+        parse_req = ParseTranscriptRequest(
+            umkm_id=umkm_id,
+            transcript=transcript,
+            product_list=product_list
+        )
+        async with _upstream_slot(limits, "openai", umkm_id, pace):
+            parse_result = await aparse_transcript_with_llm(parse_req)
+    except Exception as e:
+        raise DraftPipelineError("Parse transcript", e, status_code=_upstream_status(e))
+    logger.debug("Draft transaction", extra={"umkm_id": umkm_id, "items": len(parse_result.items)})
+    transcript_cache.put(umkm_id, catalog_version, transcript, parse_result)
+
+    return {
+        "transcript": transcript,
+        "draft_transaction": parse_result,
+        "parsed_by": "llm",
+    }
@@ -0,0 +1,312 @@
+"""
+Server-side store of generated drafts.
+
+A draft is resolved against the UMKM's catalog when it is generated:
+product ids are checked, names and unit prices filled in from the catalog
+(sales always sell at the catalog price; purchases keep the price that was
+said, falling back to the catalog price) and totals precomputed. Items the
+catalog doesn't know are kept aside as `unresolved` for the user to fix.
+
+The client then confirms by draft id, sending only its item edits, and
+the transaction is written from the stored draft: no product list, prices
+or transcript travel back, and nothing the client sends is trusted beyond
+the edits, which are checked against the catalog as well. A draft is
+committed at most once; confirming it again replays the first result.
+
+Drafts live for DRAFT_STORE_TTL_SECONDS, in this process (bounded by
+DRAFT_STORE_MAX_ENTRIES) or in Redis with DRAFT_STORE_BACKEND_URL, which
+is needed when several workers serve the API.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.metrics import registry, stats_gauge
+from schemas.schemas import DraftItemEdit, Product, TransactionFromLLM, TransactionItem
+from services.transaction import create_transaction_from_llm
+from services.transcript import fetch_product_list, get_catalog
+
+logger = logging.getLogger(__name__)
+
+draft_confirm_seconds = registry.histogram(
+    "draft_confirm_seconds", "Time to confirm a stored draft, by outcome", ("outcome",),
+)
+
+
+class DraftNotFound(Exception):
+    """
+    The draft expired, was evicted or never existed (for this UMKM).
+    """
+
+
+class DraftInvalid(Exception):
+    """
+    The draft, after edits, can't be written as a transaction.
+    """
+
+
+class InMemoryDraftBackend:
+    """
+    Drafts inside this process; only the worker that generated a draft can
+    confirm it. Expired drafts are dropped by collect() and, past
+    `max_entries`, the oldest ones are evicted.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self._drafts = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def put(self, draft: dict):
+        with self._lock:
+            self._drafts[draft["draft_id"]] = draft
+
+    def get(self, draft_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._drafts.get(draft_id)
+
+    def collect(self) -> int:
+        with self._lock:
+            return len(self._drafts.expire())
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._drafts)
+
+
+class RedisDraftBackend:
+    """
+    One key per draft with a Redis TTL, so any worker can confirm any
+    draft and Redis does the garbage collection.
+    """
+    def __init__(self, url: str, ttl: float, prefix: str = "ucap:draft:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("DRAFT_STORE_BACKEND_URL is set but the `redis` package is not installed") from e
+        self._client = redis.Redis.from_url(url)
+        self._ttl = int(ttl)
+        self._prefix = prefix
+
+    def put(self, draft: dict):
+        self._client.set(self._prefix + draft["draft_id"], json.dumps(draft), ex=self._ttl)
+
+    def get(self, draft_id: str) -> Optional[dict]:
+        raw = self._client.get(self._prefix + draft_id)
+        return json.loads(raw) if raw else None
+
+    def collect(self) -> int:
+        return 0
+
+    def size(self) -> Optional[int]:
+        # Not tracked per worker; Redis holds the count
+        return None
+
+
+def create_draft_backend():
+    if settings.DRAFT_STORE_BACKEND_URL:
+        return RedisDraftBackend(settings.DRAFT_STORE_BACKEND_URL, settings.DRAFT_STORE_TTL_SECONDS)
+    return InMemoryDraftBackend(settings.DRAFT_STORE_TTL_SECONDS, settings.DRAFT_STORE_MAX_ENTRIES)
+
+
+def resolve_items(transaction_type: str, items: List[TransactionItem], catalog: List[Product]) -> tuple:
+    """
+    (items, unresolved): items merged per product and priced from the
+    catalog, and those whose product isn't in it or whose quantity isn't
+    positive.
+    """
+    by_id = {p.product_id: p for p in catalog}
+    resolved = OrderedDict()
+    unresolved = []
+    for item in items:
+        product = by_id.get(item.product_id)
+        if product is None or item.quantity <= 0:
+            unresolved.append({
+                "product_id": item.product_id,
+                "name": item.name,
+                "quantity": item.quantity,
+                "reason": "unknown_product" if product is None else "invalid_quantity",
+            })
+            continue
+        line = resolved.get(product.product_id)
+        if line is None:
+            unit_price = item.unit_price if transaction_type == "purchase" and item.unit_price > 0 else product.price
+            line = resolved[product.product_id] = {
+                "product_id": product.product_id,
+                "name": product.name,
+                "quantity": 0,
+                "unit_price": unit_price,
+            }
+        line["quantity"] += item.quantity
+    return list(resolved.values()), unresolved
+
+
+def check_against_catalog(payload: TransactionFromLLM, db: Session) -> TransactionFromLLM:
+    """
+    A full transaction sent by the client (the legacy /confirm body),
+    resolved the way a draft is: unknown products and non-positive
+    quantities are rejected with DraftInvalid, sales are priced from the
+    catalog.
+    """
+    items, unresolved = resolve_items(payload.transaction_type, payload.items, get_catalog(payload.umkm_id, db))
+    if unresolved:
+        products = ", ".join(str(item["product_id"]) for item in unresolved)
+        raise DraftInvalid(f"Products not in the catalog or with an invalid quantity: {products}")
+    return payload.model_copy(update={"items": [TransactionItem(**line) for line in items]})
+
+
+def _with_totals(draft: dict) -> dict:
+    for line in draft["items"]:
+        line["subtotal"] = line["quantity"] * line["unit_price"]
+    draft["total_amount"] = sum(line["subtotal"] for line in draft["items"])
+    return draft
+
+
+class DraftStore:
+    """
+    Saves resolved drafts in the backend and confirms them, counting how
+    many lookups found their draft.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.collected = 0
+
+    async def save(self, umkm_id: int, result: dict, catalog: List[Product] = None) -> dict:
+        """
+        Resolve the `draft_transaction` of a generate_draft_from_audio()
+        result against the catalog (fetched unless given) and store it.
+        Returns the stored draft.
+        """
+        transaction = result["draft_transaction"]
+        if catalog is None:
+            catalog = await fetch_product_list(umkm_id)
+        items, unresolved = resolve_items(transaction.transaction_type, transaction.items, catalog)
+        now = time.time()
+        draft = _with_totals({
+            "draft_id": uuid.uuid4().hex,
+            "umkm_id": umkm_id,
+            "transaction_type": transaction.transaction_type,
+            "supplier_id": transaction.supplier_id,
+            "transcript": result["transcript"],
+            "parsed_by": result["parsed_by"],
+            "items": items,
+            "unresolved": unresolved,
+            "created_at": now,
+            "expires_at": now + settings.DRAFT_STORE_TTL_SECONDS,
+        })
+        self.backend.put(draft)
+        return draft
+
+    def get(self, draft_id: str, umkm_id: int) -> dict:
+        draft = self.backend.get(draft_id)
+        # Another UMKM's draft id is as good as an unknown one
+        if draft is None or draft["umkm_id"] != umkm_id:
+            self.misses += 1
+            raise DraftNotFound(f"Draft {draft_id} not found or expired")
+        self.hits += 1
+        return draft
+
+    def confirm(self, draft_id: str, umkm_id: int, edits: List[DraftItemEdit], db: Session) -> dict:
+        """
+        Write the stored draft with `edits` applied. Each edit sets the
+        quantity of one product (0 removes it); products not in the draft
+        are looked up in the catalog, which is only read when an edit
+        needs it. The unit price can only be edited on purchases.
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            draft = self.get(draft_id, umkm_id)
+            items = _apply_edits(draft, edits, db)
+            if not items:
+                raise DraftInvalid("Draft has no items to confirm")
+            payload = TransactionFromLLM(
+                umkm_id=umkm_id,
+                transaction_type=draft["transaction_type"],
+                supplier_id=draft["supplier_id"],
+                transcript=draft["transcript"],
+                items=items,
+            )
+            result = create_transaction_from_llm(payload, db, f"{umkm_id}:draft:{draft_id}")
+            outcome = "replayed" if result.get("replayed") else "confirmed"
+            return {**result, "draft_id": draft_id}
+        except DraftNotFound:
+            outcome = "not_found"
+            raise
+        except DraftInvalid:
+            outcome = "invalid"
+            raise
+        finally:
+            draft_confirm_seconds.observe(time.perf_counter() - start, outcome=outcome)
+
+    def collect(self) -> int:
+        collected = self.backend.collect()
+        self.collected += collected
+        return collected
+
+    async def collect_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                collected = self.collect()
+            except Exception:
+                logger.exception("Draft store collection failed")
+                continue
+            if collected:
+                logger.debug("Collected expired drafts", extra={"drafts": collected})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "collected": self.collected,
+        }
+
+
+def _apply_edits(draft: dict, edits: List[DraftItemEdit], db: Session) -> List[TransactionItem]:
+    lines = OrderedDict((line["product_id"], dict(line)) for line in draft["items"])
+    by_id = None
+    for edit in edits:
+        if edit.quantity < 0:
+            raise DraftInvalid(f"Quantity of product {edit.product_id} can't be negative")
+        if edit.unit_price is not None and draft["transaction_type"] != "purchase":
+            raise DraftInvalid("Unit prices can only be edited on purchases")
+        if edit.quantity == 0:
+            lines.pop(edit.product_id, None)
+            continue
+        line = lines.get(edit.product_id)
+        if line is None:
+            if by_id is None:
+                by_id = {p.product_id: p for p in get_catalog(draft["umkm_id"], db)}
+            product = by_id.get(edit.product_id)
+            if product is None:
+                raise DraftInvalid(f"Product {edit.product_id} is not in the catalog")
+            line = lines[edit.product_id] = {
+                "product_id": product.product_id,
+                "name": product.name,
+                "unit_price": product.price,
+            }
+        line["quantity"] = edit.quantity
+        if edit.unit_price is not None:
+            if edit.unit_price <= 0:
+                raise DraftInvalid(f"Unit price of product {edit.product_id} must be positive")
+            line["unit_price"] = edit.unit_price
+    return [
+        TransactionItem(product_id=line["product_id"], name=line["name"],
+                        quantity=line["quantity"], unit_price=line["unit_price"])
+        for line in lines.values()
+    ]
+
+
+draft_store = DraftStore(create_draft_backend())
+stats_gauge("draft_store", "Stored draft lookups and garbage collection", draft_store.stats)
@@ -0,0 +1,237 @@
+"""
+Live dashboard events. Writers publish one event per committed transaction
+on the UMKM's channel; dashboards subscribe once and apply the deltas, so
+database load grows with writes instead of with open tabs.
+
+Fan-out to subscribers is in-process. With EVENTS_BACKEND_URL set, events
+go through Redis pub/sub so every uvicorn worker delivers every event.
+"""
+import asyncio
+import json
+import logging
+from typing import Optional
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+events_published_total = registry.counter("live_events_published_total", "Live dashboard events published", ("type",))
+events_dropped_total = registry.counter("live_events_dropped_total", "Subscribers that fell behind and were told to resync")
+
+
+class InMemoryEventBackend:
+    """
+    Single worker: publishing is local delivery.
+    """
+    def __init__(self):
+        self._deliver = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    def publish(self, channel: str, event: dict):
+        if self._deliver is not None:
+            self._deliver(channel, event)
+
+
+class RedisEventBackend:
+    """
+    Publish with a plain Redis client (publishers may run in executor
+    threads) and listen with redis.asyncio on a pattern subscription,
+    handing every message to local delivery.
+    """
+    def __init__(self, url: str, prefix: str = "ucap:events:"):
+        try:
+            import redis
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("EVENTS_BACKEND_URL is set but the `redis` package is not installed") from e
+        self._publisher = redis.Redis.from_url(url)
+        self._subscriber = aioredis.Redis.from_url(url)
+        self._prefix = prefix
+        self._task = None
+
+    async def start(self, deliver):
+        pubsub = self._subscriber.pubsub()
+        await pubsub.psubscribe(f"{self._prefix}*")
+
+        async def listen():
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                channel = message["channel"].decode()[len(self._prefix):]
+                deliver(channel, json.loads(message["data"]))
+
+        self._task = asyncio.create_task(listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, channel: str, event: dict):
+        self._publisher.publish(self._prefix + channel, json.dumps(event, default=str))
+
+
+def create_event_backend():
+    if settings.EVENTS_BACKEND_URL:
+        return RedisEventBackend(settings.EVENTS_BACKEND_URL)
+    return InMemoryEventBackend()
+
+
+class EventBroker:
+    """
+    Per-channel fan-out to subscriber queues on the event loop.
+
+    publish() may be called from any thread. Each subscriber has a bounded
+    queue; one that can't keep up has its backlog replaced by a single
+    {"type": "resync"}, telling the client to reload its snapshot instead of
+    letting it hold up publishers or grow memory.
+    """
+    def __init__(self, backend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver_threadsafe)
+
+    async def stop(self):
+        await self.backend.stop()
+        self._loop = None
+
+    def publish(self, channel: str, event: dict):
+        events_published_total.inc(type=event.get("type", "unknown"))
+        try:
+            self.backend.publish(channel, event)
+        except Exception:
+            # The write is already committed; a lost event only costs a refresh
+            logger.exception("Could not publish live event", extra={"channel": channel})
+
+    def _deliver_threadsafe(self, channel: str, event: dict):
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(channel, event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, channel, event)
+
+    def _deliver(self, channel: str, event: dict):
+        for queue in self._subscribers.get(channel, ()):
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                events_dropped_total.inc()
+            else:
+                queue.put_nowait(event)
+
+    def subscribe(self, channel: str) -> "Subscription":
+        """
+        Start receiving events right away; use as a context manager so the
+        queue is dropped when the subscriber goes away.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        return Subscription(self, channel, queue)
+
+    def _unsubscribe(self, channel: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+class Subscription:
+    def __init__(self, broker: EventBroker, channel: str, queue: asyncio.Queue):
+        self._broker = broker
+        self._channel = channel
+        self._queue = queue
+
+    async def next(self, timeout: float = None) -> Optional[dict]:
+        """
+        The next event, or None if nothing arrived within `timeout`.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._broker._unsubscribe(self._channel, self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+broker = EventBroker(create_event_backend(), queue_size=settings.LIVE_SUBSCRIBER_QUEUE_SIZE)
+
+registry.gauge(
+    "live_subscribers", "Open live dashboard subscriptions",
+    callback=lambda: {(): broker.subscriber_count()},
+)
+
+
+def dashboard_channel(umkm_id: int) -> str:
+    return f"dashboard:{umkm_id}"
+
+
+def publish_transaction(payload, result: dict, version: int):
+    """
+    Publish a committed sale or purchase. Sales carry the deltas the
+    dashboard applies to its daily/monthly totals plus the row for its
+    recent-transactions list; `version` is the sales version the commit
+    produced, so a client can skip events its snapshot already includes.
+    """
+    items = [
+        {"product_id": i.product_id, "name": i.name, "quantity": i.quantity, "unit_price": i.unit_price}
+        for i in payload.items
+    ]
+    total_amount = sum(i.quantity * i.unit_price for i in payload.items)
+    if payload.transaction_type == "sale":
+        event = {
+            "type": "sale",
+            "version": version,
+            "delta": {"day": result["sale_date"][:10], "total_sales": total_amount, "total_transactions": 1},
+            "transaction": {
+                "sale_id": result["sale_id"],
+                "sale_date": result["sale_date"],
+                "status": "selesai",
+                "total_amount": total_amount,
+                "items": items,
+            },
+        }
+    else:
+        event = {
+            "type": "purchase",
+            "version": version,
+            "purchase_id": result["purchase_id"],
+            "total_amount": total_amount,
+            "items": items,
+        }
+    event["stock"] = result["stock"]
+    broker.publish(dashboard_channel(payload.umkm_id), event)
+
+
+def publish_resync(umkm_id: int, version: Optional[int] = None):
+    """
+    For writes that don't map to a single delta (bulk imports, backdated
+    rows): tell dashboards to reload their snapshot.
+    """
+    broker.publish(dashboard_channel(umkm_id), {"type": "resync", "version": version})
@@ -0,0 +1,257 @@
+"""
+Report exports for arbitrary date ranges. Rows are read through a
+server-side cursor and encoded chunk by chunk, so memory stays flat however
+many rows an export has. Finished exports that are small enough are cached
+under the UMKM's sales version and replayed byte for byte until the next
+transaction is committed.
+"""
+import csv
+import io
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Iterator, Optional
+from sqlalchemy import text
+from db.db import get_engine
+from core.config import settings
+from core.metrics import stats_gauge
+
+_ROLLUP_QUERY = """
+    SELECT CAST(date_trunc('{unit}', day) AS DATE) AS period,
+           SUM(total_amount) AS total_amount,
+           SUM(transaction_count) AS transaction_count
+    FROM daily_sales_rollup
+    WHERE umkm_id = :umkm_id AND day >= :start_date AND day < :end_date
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+EXPORTS = {
+    "day": (("date", "total_amount", "transaction_count"), _ROLLUP_QUERY.format(unit="day")),
+    "week": (("week_start", "total_amount", "transaction_count"), _ROLLUP_QUERY.format(unit="week")),
+    "month": (("month", "total_amount", "transaction_count"), _ROLLUP_QUERY.format(unit="month")),
+    "product": (
+        ("product_id", "name", "quantity", "total_amount", "transaction_count"),
+        """
+        SELECT si.product_id, p.name, SUM(si.quantity), SUM(si.quantity * si.unit_price), COUNT(DISTINCT s.sale_id)
+        FROM sales s
+        JOIN sales_items si ON si.sale_id = s.sale_id
+        JOIN products p ON p.product_id = si.product_id
+        WHERE s.umkm_id = :umkm_id AND s.sale_date >= :start_date AND s.sale_date < :end_date
+        GROUP BY si.product_id, p.name
+        ORDER BY SUM(si.quantity * si.unit_price) DESC
+        """,
+    ),
+    # One row per sale, for accountants reconciling individual transactions
+    "sale": (
+        ("sale_id", "sale_date", "customer_name", "status", "total_amount"),
+        """
+        SELECT sale_id, sale_date, customer_name, status, total_amount
+        FROM sales
+        WHERE umkm_id = :umkm_id AND sale_date >= :start_date AND sale_date < :end_date
+        ORDER BY sale_date, sale_id
+        """,
+    ),
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_rows(umkm_id: int, group_by: str, start_date: date, end_date: date) -> Iterator[list]:
+    """
+    Yield lists of up to EXPORT_CHUNK_ROWS rows for the inclusive
+    [start_date, end_date] range, fetched with a server-side cursor.
+    """
+    _, query = EXPORTS[group_by]
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=settings.EXPORT_CHUNK_ROWS).execute(
+            text(query),
+            {"umkm_id": umkm_id, "start_date": start_date, "end_date": end_date + timedelta(days=1)},
+        )
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+
+def encode_csv(columns, chunks) -> Iterator[bytes]:
+    # BOM so Excel opens the file as UTF-8
+    yield ("\ufeff" + ",".join(columns) + "\r\n").encode()
+    for rows in chunks:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """
+    Write-only file that hands its bytes back on drain(), so the Parquet
+    writer can stream row groups without buffering the whole file.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def encode_parquet(columns, chunks) -> Iterator[bytes]:
+    """
+    One Parquet row group per chunk. Needs pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _DrainableSink()
+    writer = None
+    for rows in chunks:
+        table = pa.Table.from_pylist([dict(zip(columns, (_parquet_value(v) for v in row))) for row in rows])
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression="zstd")
+        writer.write_table(table.cast(writer.schema))
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([(c, pa.string()) for c in columns]))
+    writer.close()
+    yield sink.drain()
+
+
+def _parquet_value(value):
+    # NUMERIC comes back as Decimal with varying scale per row
+    return float(value) if hasattr(value, "as_tuple") else value
+
+
+def gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parquet_available() -> bool:
+    try:
+        # Availability probe: only whether the import works matters
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ExportCache:
+    """
+    LRU of finished export files keyed by their parameters and the UMKM's
+    sales version at the time the export started. Files larger than
+    `max_entry_bytes` are streamed but never kept.
+    """
+    def __init__(self, ttl: float, max_bytes: int, max_entry_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data: bytes):
+        if self.ttl <= 0 or len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (data, time.monotonic() + self.ttl)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+export_cache = ExportCache(
+    ttl=settings.EXPORT_CACHE_TTL_SECONDS,
+    max_bytes=settings.EXPORT_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.EXPORT_CACHE_MAX_ENTRY_BYTES,
+)
+
+stats_gauge("export_cache", "Report export cache counters", export_cache.stats)
+
+
+def _caching(key, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Pass `chunks` through while keeping a copy, and store it once the
+    export finished, unless it grew past the per-entry cap.
+    """
+    kept, size = [], 0
+    for chunk in chunks:
+        if kept is not None:
+            kept.append(chunk)
+            size += len(chunk)
+            if size > export_cache.max_entry_bytes:
+                kept = None
+        yield chunk
+    if kept is not None:
+        export_cache.put(key, b"".join(kept))
+
+
+def export_stream(
+    umkm_id: int, group_by: str, start_date: date, end_date: date, fmt: str, gzip: bool, data_version: str,
+) -> Iterator[bytes]:
+    """
+    The export file as a byte iterator, from the cache when an identical
+    export was produced for the same `data_version` (the report validator,
+    which changes whenever a sale is recorded).
+    """
+    key = (umkm_id, group_by, start_date, end_date, fmt, gzip, data_version)
+    cached = export_cache.get(key)
+    if cached is not None:
+        return iter((cached,))
+
+    columns, _ = EXPORTS[group_by]
+    encode = encode_parquet if fmt == "parquet" else encode_csv
+    chunks = encode(columns, iter_rows(umkm_id, group_by, start_date, end_date))
+    if gzip:
+        chunks = gzip_stream(chunks)
+    return _caching(key, chunks)
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Optional, Tuple
+from cachetools import TTLCache
+from core.config import settings
+from core.metrics import stats_gauge
+from schemas.schemas import TransactionFromLLM
+from services.matcher import normalize_tokens
+
+
+def request_key(umkm_id: int, idempotency_key: Optional[str], body: bytes) -> str:
+    """
+    Dedup key for an upload: the client's Idempotency-Key when it sends one,
+    otherwise a hash of the bytes (a retried upload is byte-identical).
+    """
+    if idempotency_key:
+        return f"{umkm_id}:key:{idempotency_key}"
+    return f"{umkm_id}:sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+class RequestDeduplicator:
+    """
+    Runs at most one coroutine per key. Concurrent callers with the same key
+    await the first caller's task; later callers get the finished result
+    until it expires. Failures are not cached, so a retry after an error
+    runs again. Only used from the event loop, so no locking.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self._results = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._in_flight = {}
+        self.hits = 0
+        self.joins = 0
+        self.misses = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """
+        Returns (result, deduplicated).
+        """
+        if key in self._results:
+            self.hits += 1
+            return self._results[key], True
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.joins += 1
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = asyncio.ensure_future(factory())
+        self._in_flight[key] = task
+        try:
+            # shield: a client disconnecting must not cancel the work other
+            # callers joined
+            result = await asyncio.shield(task)
+        finally:
+            self._in_flight.pop(key, None)
+        self._results[key] = result
+        return result, False
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._results),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "joins": self.joins,
+            "misses": self.misses,
+        }
+
+
+class TranscriptResultCache:
+    """
+    (umkm_id, catalog version, normalized transcript) -> parsed transaction,
+    so common phrases ("es teh dua") are only sent to the LLM once per
+    catalog version.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(umkm_id: int, catalog_version: int, transcript: str):
+        return umkm_id, catalog_version, " ".join(normalize_tokens(transcript))
+
+    def get(self, umkm_id: int, catalog_version: int, transcript: str) -> Optional[TransactionFromLLM]:
+        cached = self._entries.get(self._key(umkm_id, catalog_version, transcript))
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Callers get their own copy, carrying their own transcript text
+        return cached.model_copy(deep=True, update={"transcript": transcript})
+
+    def put(self, umkm_id: int, catalog_version: int, transcript: str, result: TransactionFromLLM):
+        self._entries[self._key(umkm_id, catalog_version, transcript)] = result.model_copy(deep=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+draft_deduplicator = RequestDeduplicator(settings.DRAFT_DEDUP_TTL_SECONDS, settings.DRAFT_DEDUP_MAX_ENTRIES)
+transcript_cache = TranscriptResultCache(settings.TRANSCRIPT_CACHE_TTL_SECONDS, settings.TRANSCRIPT_CACHE_MAX_ENTRIES)
+stats_gauge("draft_dedup", "Draft request deduplication counters", draft_deduplicator.stats)
+stats_gauge("transcript_result_cache", "Transcript -> parsed draft cache counters", transcript_cache.stats)
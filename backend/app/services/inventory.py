@@ -0,0 +1,351 @@
+"""
+Ledger mode for stock (INVENTORY_MODE=ledger).
+
+In row mode every confirmed sale runs `UPDATE products SET stock = ...` on
+the same few popular rows, so concurrent cashiers queue on their row locks
+and each sale leaves a dead tuple behind. In ledger mode stock changes are
+only appended to inventory_ledger:
+
+  * a product's stock lives in one or more buckets (inventory_buckets); a
+    bucket's balance is its compacted snapshot plus the ledger rows
+    appended to it since (movement_id > last_movement_id)
+  * writers serialize per bucket on a transaction-level advisory lock
+    (product_id, bucket), always taken in (product_id, bucket) order. A
+    sale only appends when its bucket still covers the quantity with the
+    lock held, so stock never goes negative; when no single bucket covers
+    it the sale locks all of the product's buckets and draws from several.
+    That second round of locks is out of order, so two such sales can
+    deadlock; Postgres aborts one and the confirm is retried (is_deadlock)
+  * compact_inventory() folds the deltas into the snapshots, writes the
+    total back to products.stock and spreads products that saw more than
+    INVENTORY_HOT_MOVEMENTS movements since the last compaction over
+    INVENTORY_HOT_BUCKETS buckets, so concurrent sales of a hot product
+    mostly wait on different locks
+
+Switching an existing database over: stop writers, run
+`python -m db.maintenance init-inventory`, set INVENTORY_MODE=ledger. Back to
+row mode: run `compact-inventory` first, products.stock is then current.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.executor import run_blocking
+from core.metrics import registry
+from db.db import get_engine
+
+logger = logging.getLogger(__name__)
+
+inventory_changes_total = registry.counter(
+    "inventory_stock_changes_total", "Ledger stock changes by how they were applied", ("path",),
+)
+inventory_compaction_seconds = registry.histogram(
+    "inventory_compaction_seconds", "Duration of an inventory compaction run",
+)
+
+def is_deadlock(error: Exception) -> bool:
+    return getattr(getattr(error, "orig", None), "pgcode", None) == "40P01"
+
+
+# Balance of every bucket of the requested products: snapshot plus the
+# ledger rows appended since it was taken
+_BUCKET_BALANCES = """
+    SELECT b.product_id, b.bucket,
+           b.balance + COALESCE((
+               SELECT SUM(l.delta) FROM inventory_ledger l
+               WHERE l.product_id = b.product_id AND l.bucket = b.bucket
+               AND l.movement_id > b.last_movement_id
+           ), 0) AS available
+    FROM inventory_buckets b
+    WHERE b.umkm_id = :umkm_id AND b.product_id = ANY(CAST(:product_ids AS integer[]))
+"""
+
+
+def _lock_random_buckets(db: Session, umkm_id: int, product_ids: list) -> dict:
+    """
+    Lock one randomly picked bucket per product, in product order, and
+    return {product_id: bucket}. Products without buckets are left out.
+    """
+    rows = db.execute(text("""
+        SELECT s.product_id, s.bucket, pg_advisory_xact_lock(s.product_id, s.bucket)
+        FROM (
+            SELECT product_id, CAST(floor(random() * COUNT(*)) AS integer) AS bucket
+            FROM inventory_buckets
+            WHERE umkm_id = :umkm_id AND product_id = ANY(CAST(:product_ids AS integer[]))
+            GROUP BY product_id
+            ORDER BY product_id
+        ) s
+    """), {"umkm_id": umkm_id, "product_ids": product_ids}).all()
+    return {row.product_id: row.bucket for row in rows}
+
+
+def _lock_all_buckets(db: Session, umkm_id: int, product_ids: list):
+    # Locks already held by this transaction are simply granted again
+    db.execute(text("""
+        SELECT pg_advisory_xact_lock(s.product_id, s.bucket)
+        FROM (
+            SELECT product_id, bucket FROM inventory_buckets
+            WHERE umkm_id = :umkm_id AND product_id = ANY(CAST(:product_ids AS integer[]))
+            ORDER BY product_id, bucket
+        ) s
+    """), {"umkm_id": umkm_id, "product_ids": product_ids})
+
+
+def _init_buckets(db: Session, umkm_id: int, product_ids: list) -> list:
+    """
+    Give products that have never been through the ledger a single bucket
+    holding their products.stock. Returns the ids that exist.
+    """
+    db.execute(text("""
+        INSERT INTO inventory_buckets (product_id, bucket, umkm_id, balance, last_movement_id)
+        SELECT product_id, 0, umkm_id, stock, 0 FROM products
+        WHERE umkm_id = :umkm_id AND product_id = ANY(CAST(:product_ids AS integer[]))
+        ON CONFLICT DO NOTHING
+    """), {"umkm_id": umkm_id, "product_ids": product_ids})
+    return db.execute(text("""
+        SELECT product_id FROM inventory_buckets
+        WHERE umkm_id = :umkm_id AND product_id = ANY(CAST(:product_ids AS integer[])) AND bucket = 0
+    """), {"umkm_id": umkm_id, "product_ids": product_ids}).scalars().all()
+
+
+def _append(db: Session, umkm_id: int, kind: str, movements: list):
+    if not movements:
+        return
+    product_ids, buckets, deltas = (list(column) for column in zip(*movements))
+    db.execute(text("""
+        INSERT INTO inventory_ledger (umkm_id, product_id, bucket, delta, kind)
+        SELECT :umkm_id, m.product_id, m.bucket, m.delta, :kind
+        FROM unnest(CAST(:product_ids AS integer[]), CAST(:buckets AS integer[]), CAST(:deltas AS integer[]))
+            AS m(product_id, bucket, delta)
+    """), {"umkm_id": umkm_id, "kind": kind, "product_ids": product_ids, "buckets": buckets, "deltas": deltas})
+
+
+def _apply_across_buckets(db: Session, umkm_id: int, pending: dict, sign: int) -> dict:
+    """
+    Slow path: lock all buckets of the `pending` products and apply their
+    quantities there. A sale whose random bucket could not cover it draws
+    from several buckets, largest first; a change whose bucket vanished in a
+    compaction while it waited for the lock goes to bucket 0. Returns
+    {product_id: (applied, stock)}, without products that have no buckets.
+    """
+    product_ids = sorted(pending)
+    _lock_all_buckets(db, umkm_id, product_ids)
+    balances = {}
+    for row in db.execute(text(_BUCKET_BALANCES), {"umkm_id": umkm_id, "product_ids": product_ids}).mappings():
+        balances.setdefault(row["product_id"], []).append((row["available"], row["bucket"]))
+
+    movements, outcomes = [], {}
+    for product_id in product_ids:
+        if product_id not in balances:
+            continue
+        quantity = pending[product_id]
+        buckets = sorted(balances[product_id], reverse=True)
+        total = sum(available for available, _ in buckets)
+        if sign > 0:
+            movements.append((product_id, 0, quantity))
+            outcomes[product_id] = (True, total + quantity)
+            continue
+        if total < quantity:
+            outcomes[product_id] = (False, total)
+            continue
+        remaining = quantity
+        for available, bucket in buckets:
+            take = min(available, remaining)
+            if take > 0:
+                movements.append((product_id, bucket, -take))
+                remaining -= take
+            if not remaining:
+                break
+        outcomes[product_id] = (True, total - quantity)
+    _append(db, umkm_id, "sale" if sign < 0 else "purchase", movements)
+    return outcomes
+
+
+def apply_ledger_changes(db: Session, umkm_id: int, deltas: dict, sign: int) -> list:
+    """
+    Ledger-mode counterpart of transaction._apply_stock_changes, with the
+    same outcomes: "ok" with the remaining stock, "insufficient_stock" with
+    the stock that was available (sales only, nothing is taken), or
+    "not_found".
+    """
+    requested = dict(zip(deltas["product_ids"], deltas["quantities"]))
+    product_ids = sorted(requested)
+    chosen = _lock_random_buckets(db, umkm_id, product_ids)
+    missing = [pid for pid in product_ids if pid not in chosen]
+    if missing:
+        # First time through the ledger (init-inventory not run for them)
+        for product_id in _init_buckets(db, umkm_id, missing):
+            db.execute(text("SELECT pg_advisory_xact_lock(:product_id, 0)"), {"product_id": product_id})
+            chosen[product_id] = 0
+
+    kind = "sale" if sign < 0 else "purchase"
+    found = sorted(chosen)
+    rows = db.execute(text(f"""
+        WITH balance AS ({_BUCKET_BALANCES}),
+        chosen AS (
+            SELECT r.product_id, r.bucket, r.quantity, b.available,
+                   (SELECT SUM(t.available) FROM balance t WHERE t.product_id = r.product_id) AS total
+            FROM unnest(CAST(:chosen_ids AS integer[]), CAST(:buckets AS integer[]), CAST(:quantities AS integer[]))
+                AS r(product_id, bucket, quantity)
+            JOIN balance b ON b.product_id = r.product_id AND b.bucket = r.bucket
+        ),
+        appended AS (
+            INSERT INTO inventory_ledger (umkm_id, product_id, bucket, delta, kind)
+            SELECT :umkm_id, product_id, bucket, :sign * quantity, :kind FROM chosen
+            WHERE :sign > 0 OR available >= quantity
+            RETURNING product_id
+        )
+        SELECT c.product_id, c.quantity, c.available, c.total,
+               EXISTS (SELECT 1 FROM appended a WHERE a.product_id = c.product_id) AS applied
+        FROM chosen c
+    """), {
+        "umkm_id": umkm_id,
+        "product_ids": found,
+        "chosen_ids": found,
+        "buckets": [chosen[pid] for pid in found],
+        "quantities": [requested[pid] for pid in found],
+        "sign": sign,
+        "kind": kind,
+    }).mappings().all()
+
+    results = {}
+    for row in rows:
+        if row["applied"]:
+            results[row["product_id"]] = (True, row["total"] + sign * row["quantity"])
+            inventory_changes_total.inc(path="fast")
+    pending = {pid: requested[pid] for pid in found if pid not in results}
+    if pending:
+        for product_id, (applied, stock) in _apply_across_buckets(db, umkm_id, pending, sign).items():
+            results[product_id] = (applied, stock)
+            inventory_changes_total.inc(path="spread" if applied else "insufficient")
+
+    outcomes = []
+    for product_id, quantity in requested.items():
+        if product_id not in results:
+            status, stock = "not_found", None
+        else:
+            applied, stock = results[product_id]
+            status = "ok" if applied else "insufficient_stock"
+        outcomes.append({"product_id": product_id, "quantity": quantity, "status": status, "stock": stock})
+    return outcomes
+
+
+def init_inventory(umkm_id: Optional[int] = None) -> int:
+    """
+    Seed a single bucket per product from products.stock. Products that
+    already have buckets are left alone.
+    """
+    where = "WHERE umkm_id = :umkm_id" if umkm_id is not None else ""
+    with get_engine().begin() as conn:
+        result = conn.execute(text(f"""
+            INSERT INTO inventory_buckets (product_id, bucket, umkm_id, balance, last_movement_id)
+            SELECT product_id, 0, umkm_id, stock, 0 FROM products {where}
+            ON CONFLICT DO NOTHING
+        """), {"umkm_id": umkm_id})
+    return result.rowcount
+
+
+def _compact_product(conn, product_id: int, hot_movements: int, hot_buckets: int) -> int:
+    """
+    Fold one product's ledger tail into its snapshot and re-spread its
+    stock over the bucket count its activity calls for. Runs with all of
+    its bucket locks held, so no writer has an uncommitted movement for it.
+    Returns the number of movements folded.
+    """
+    conn.execute(text("""
+        SELECT pg_advisory_xact_lock(product_id, bucket)
+        FROM (SELECT product_id, bucket FROM inventory_buckets WHERE product_id = :product_id ORDER BY bucket) s
+    """), {"product_id": product_id})
+    rows = conn.execute(text("""
+        SELECT b.bucket, b.umkm_id, b.balance + COALESCE(t.delta, 0) AS available,
+               GREATEST(b.last_movement_id, COALESCE(t.last_id, 0)) AS last_id, COALESCE(t.movements, 0) AS movements
+        FROM inventory_buckets b
+        LEFT JOIN LATERAL (
+            SELECT SUM(l.delta) AS delta, MAX(l.movement_id) AS last_id, COUNT(*) AS movements
+            FROM inventory_ledger l
+            WHERE l.product_id = b.product_id AND l.bucket = b.bucket AND l.movement_id > b.last_movement_id
+        ) t ON TRUE
+        WHERE b.product_id = :product_id
+        ORDER BY b.bucket
+    """), {"product_id": product_id}).mappings().all()
+    if not rows:
+        return 0
+
+    umkm_id = rows[0]["umkm_id"]
+    total = sum(row["available"] for row in rows)
+    last_id = max(row["last_id"] for row in rows)
+    movements = sum(row["movements"] for row in rows)
+    if movements >= hot_movements:
+        target = hot_buckets
+    elif movements < hot_movements // 4:
+        target = 1
+    else:
+        target = len(rows)
+
+    # Every bucket, old or new, starts after the newest folded movement
+    share, extra = divmod(total, target) if total > 0 else (0, 0)
+    balances = [share + (1 if n < extra else 0) for n in range(target)]
+    if total <= 0:
+        balances[0] = total
+    conn.execute(text("DELETE FROM inventory_buckets WHERE product_id = :product_id"), {"product_id": product_id})
+    conn.execute(text("""
+        INSERT INTO inventory_buckets (product_id, bucket, umkm_id, balance, last_movement_id)
+        SELECT :product_id, b.bucket - 1, :umkm_id, b.balance, :last_id
+        FROM unnest(CAST(:balances AS integer[])) WITH ORDINALITY AS b(balance, bucket)
+    """), {"product_id": product_id, "umkm_id": umkm_id, "balances": balances, "last_id": last_id})
+    conn.execute(text("UPDATE products SET stock = :stock WHERE product_id = :product_id AND stock <> :stock"),
+                 {"product_id": product_id, "stock": total})
+    return movements
+
+
+def compact_inventory(umkm_id: Optional[int] = None) -> dict:
+    """
+    Compact every product with ledger movements since the last run (and
+    collapse hot products that went quiet), one short transaction per
+    product so sales are only held up for that product's fold.
+    """
+    start = time.perf_counter()
+    where = "AND b.umkm_id = :umkm_id" if umkm_id is not None else ""
+    with get_engine().connect() as conn:
+        product_ids = conn.execute(text(f"""
+            SELECT b.product_id
+            FROM inventory_buckets b
+            WHERE (b.bucket > 0 OR EXISTS (
+                SELECT 1 FROM inventory_ledger l
+                WHERE l.product_id = b.product_id AND l.bucket = b.bucket AND l.movement_id > b.last_movement_id
+            )) {where}
+            GROUP BY b.product_id
+            ORDER BY b.product_id
+        """), {"umkm_id": umkm_id}).scalars().all()
+
+    folded = 0
+    for product_id in product_ids:
+        try:
+            with get_engine().begin() as conn:
+                folded += _compact_product(conn, product_id, settings.INVENTORY_HOT_MOVEMENTS, settings.INVENTORY_HOT_BUCKETS)
+        except Exception as e:
+            # Lost a deadlock against a sale on its slow path; next run
+            if not is_deadlock(e):
+                raise
+            logger.info("Skipped compacting product %s (deadlock)", product_id)
+    elapsed = time.perf_counter() - start
+    inventory_compaction_seconds.observe(elapsed)
+    return {"products": len(product_ids), "movements": folded, "seconds": elapsed}
+
+
+async def compact_periodically(interval: float):
+    """
+    Background compaction loop started from the app lifespan.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await run_blocking(compact_inventory)
+        except Exception:
+            logger.exception("Inventory compaction failed")
+            continue
+        if stats["products"]:
+            logger.info("Inventory compacted", extra=stats)
@@ -0,0 +1,376 @@
+import asyncio
+import base64
+import json
+import logging
+import random
+import time
+import uuid
+from typing import AsyncIterator, Optional
+from cachetools import TTLCache
+from core.config import settings
+from core.metrics import registry
+from services.draft import generate_draft_from_audio, DraftPipelineError
+from services.draft_store import draft_store
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL = (SUCCEEDED, FAILED)
+
+
+def new_job(umkm_id: int, audio_bytes: bytes) -> dict:
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "umkm_id": umkm_id,
+        "status": QUEUED,
+        "attempts": 0,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "audio": audio_bytes,
+    }
+
+
+def public_view(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "audio"}
+
+
+class JobQueueFull(Exception):
+    """
+    Too many jobs are waiting already; submit again after `retry_after`.
+    """
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InMemoryJobBackend:
+    """
+    Queue and job store inside this process. Jobs are lost on restart and
+    only visible to this worker; fine for tests and single-worker setups.
+    Only finished jobs expire or are evicted (past `max_jobs`); queued and
+    running ones stay until they finish.
+    """
+    def __init__(self, ttl: float, max_jobs: int):
+        self._queue = asyncio.Queue()
+        self._active = {}
+        self._finished = TTLCache(maxsize=max_jobs, ttl=ttl)
+
+    async def enqueue(self, job: dict):
+        await self.save(job)
+        await self._queue.put(job["job_id"])
+
+    async def dequeue(self) -> Optional[dict]:
+        job_id = await self._queue.get()
+        return await self.get(job_id)
+
+    async def save(self, job: dict):
+        if job["status"] in TERMINAL:
+            self._active.pop(job["job_id"], None)
+            # Finished jobs don't need their audio any more
+            self._finished[job["job_id"]] = {**job, "audio": None}
+        else:
+            self._active[job["job_id"]] = job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return self._active.get(job_id) or self._finished.get(job_id)
+
+    async def stalled(self, stale_after: float) -> list:
+        # Jobs never outlive the process that runs them
+        return []
+
+    async def queued(self) -> int:
+        return self._queue.qsize()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisJobBackend:
+    """
+    Durable queue in Redis: a list of job ids plus one key per job. Any
+    worker can pick up a job and any worker can answer status requests.
+
+    A dequeued id is moved (BLMOVE) to a processing list and only leaves it
+    when the job finishes or goes back on the queue, so jobs of a worker
+    that died are still there for stalled() to hand out again. Only
+    finished jobs get a TTL.
+    """
+    def __init__(self, url: str, ttl: float, prefix: str = "ucap:jobs:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("JOB_BACKEND_URL is set but the `redis` package is not installed") from e
+        self._client = redis.Redis.from_url(url)
+        self._ttl = int(ttl)
+        self._prefix = prefix
+        self._depth = 0
+
+    def _key(self, job_id: str) -> str:
+        return f"{self._prefix}job:{job_id}"
+
+    @staticmethod
+    def _dump(job: dict) -> str:
+        return json.dumps({**job, "audio": base64.b64encode(job["audio"]).decode() if job.get("audio") else None})
+
+    @staticmethod
+    def _load(raw) -> dict:
+        job = json.loads(raw)
+        job["audio"] = base64.b64decode(job["audio"]) if job.get("audio") else None
+        return job
+
+    async def enqueue(self, job: dict):
+        # Also takes the job off the processing list when it is a retry
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(job["job_id"]), self._dump(job))
+            pipe.lrem(f"{self._prefix}processing", 1, job["job_id"])
+            pipe.lpush(f"{self._prefix}queue", job["job_id"])
+            await pipe.execute()
+
+    async def dequeue(self) -> Optional[dict]:
+        job_id = (await self._client.blmove(
+            f"{self._prefix}queue", f"{self._prefix}processing", 0, "RIGHT", "LEFT",
+        )).decode()
+        self._depth = await self._client.llen(f"{self._prefix}queue")
+        job = await self.get(job_id)
+        if job is None:
+            await self._client.lrem(f"{self._prefix}processing", 1, job_id)
+        return job
+
+    async def save(self, job: dict):
+        if job["status"] not in TERMINAL:
+            await self._client.set(self._key(job["job_id"]), self._dump(job))
+            return
+        # Finished jobs don't need their audio any more
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(job["job_id"]), self._dump({**job, "audio": None}), ex=self._ttl)
+            pipe.lrem(f"{self._prefix}processing", 1, job["job_id"])
+            await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        raw = await self._client.get(self._key(job_id))
+        return self._load(raw) if raw else None
+
+    async def stalled(self, stale_after: float) -> list:
+        """
+        Take the jobs not updated for `stale_after` seconds off the
+        processing list and return them. LREM makes sure only one worker
+        gets each.
+        """
+        jobs = []
+        now = time.time()
+        for raw_id in await self._client.lrange(f"{self._prefix}processing", 0, -1):
+            job = await self.get(raw_id.decode())
+            if job is not None and job["status"] not in TERMINAL and now - job["updated_at"] < stale_after:
+                continue
+            removed = await self._client.lrem(f"{self._prefix}processing", 1, raw_id)
+            if removed and job is not None and job["status"] not in TERMINAL:
+                jobs.append(job)
+        return jobs
+
+    async def queued(self) -> int:
+        self._depth = await self._client.llen(f"{self._prefix}queue")
+        return self._depth
+
+    def depth(self) -> int:
+        # Last value seen by this worker; exact enough for a gauge
+        return self._depth
+
+
+def create_job_backend():
+    if settings.JOB_BACKEND_URL:
+        return RedisJobBackend(settings.JOB_BACKEND_URL, settings.JOB_RESULT_TTL_SECONDS)
+    return InMemoryJobBackend(settings.JOB_RESULT_TTL_SECONDS, settings.JOB_MAX_STORED)
+
+
+class DraftJobRunner:
+    """
+    Worker pool that turns queued audio into draft transactions.
+
+    Each upstream gets its own semaphore, so e.g. OpenAI throttling can't
+    occupy every worker while Speech-to-Text sits idle. Failed attempts are
+    retried with exponential backoff and jitter up to JOB_MAX_ATTEMPTS.
+    Submitting past `max_queued` waiting jobs raises JobQueueFull, and jobs
+    left running by a dead worker are requeued after `stale_after`.
+    """
+    def __init__(self, backend, workers: int, limits: dict, max_attempts: int, retry_base: float,
+                 max_queued: int, stale_after: float):
+        self.backend = backend
+        self.workers = workers
+        self.limits = limits
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.max_queued = max_queued
+        self.stale_after = stale_after
+        # Moving average of a job's run time, for the Retry-After of a full queue
+        self.job_seconds = 5.0
+        self._tasks = []
+        self._watchers = {}
+        # retries waiting out their backoff; kept referenced until requeued
+        self._retries = set()
+        self.running = 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaim_periodically()))
+
+    async def stop(self):
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, umkm_id: int, audio_bytes: bytes) -> dict:
+        queued = await self.backend.queued()
+        if queued >= self.max_queued:
+            raise JobQueueFull(
+                f"{queued} draft jobs are waiting already",
+                retry_after=queued * self.job_seconds / self.workers,
+            )
+        job = new_job(umkm_id, audio_bytes)
+        await self.backend.enqueue(job)
+        return public_view(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await self.backend.get(job_id)
+        return public_view(job) if job else None
+
+    async def watch(self, job_id: str, poll_interval: float = 1.0) -> AsyncIterator[dict]:
+        """
+        Yield the job every time it changes, until it finishes. Changes made
+        by this process are pushed immediately; jobs run by another worker
+        (shared backend) are picked up by polling.
+        """
+        notify = asyncio.Queue()
+        self._watchers.setdefault(job_id, set()).add(notify)
+        try:
+            last = None
+            while True:
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if job["updated_at"] != last:
+                    last = job["updated_at"]
+                    yield job
+                if job["status"] in TERMINAL:
+                    return
+                try:
+                    await asyncio.wait_for(notify.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(notify)
+                if not watchers:
+                    self._watchers.pop(job_id, None)
+
+    async def _update(self, job: dict, **changes):
+        job.update(changes, updated_at=time.time())
+        await self.backend.save(job)
+        for notify in self._watchers.get(job["job_id"], ()):
+            notify.put_nowait(None)
+
+    async def _work(self, worker_id: int):
+        while True:
+            job = await self.backend.dequeue()
+            if job is None or job["status"] in TERMINAL:
+                continue
+            self.running += 1
+            start = time.perf_counter()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.exception("Draft job crashed", extra={"job_id": job["job_id"]})
+                await self._fail(job, e)
+            finally:
+                self.running -= 1
+                self.job_seconds += 0.1 * (time.perf_counter() - start - self.job_seconds)
+
+    async def _fail(self, job: dict, error: Exception):
+        # Left as running, the job would never finish for whoever waits on it
+        try:
+            await self._update(job, status=FAILED, error=f"Draft job crashed: {error}")
+        except Exception:
+            logger.exception("Could not mark draft job failed", extra={"job_id": job["job_id"]})
+
+    async def _run(self, job: dict):
+        await self._update(job, status=RUNNING, attempts=job["attempts"] + 1)
+        try:
+            result = await generate_draft_from_audio(job["audio"], job["umkm_id"], limits=self.limits, pace=False)
+        except DraftPipelineError as e:
+            if e.status_code == 429:
+                # Over its UMKM's rate: wait that out off the worker, and
+                # don't count it as an attempt
+                await self._update(job, status=QUEUED, attempts=job["attempts"] - 1)
+                self._schedule_requeue(job, e.error.retry_after)
+                return
+            if not e.retryable or job["attempts"] >= self.max_attempts:
+                await self._update(job, status=FAILED, error=str(e))
+                return
+            delay = self.retry_base * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.5)
+            logger.info("Retrying draft job in %.1fs: %s", delay, e, extra={"job_id": job["job_id"]})
+            await self._update(job, status=RETRYING, error=str(e))
+            self._schedule_requeue(job, delay)
+            return
+
+        draft = await draft_store.save(job["umkm_id"], result)
+        await self._update(job, status=SUCCEEDED, error=None, result={
+            "message": "Draft transaction generated successfully",
+            "draft_id": draft["draft_id"],
+            "draft": draft,
+            "draft_transaction": result["draft_transaction"].model_dump(),
+            "transcript": result["transcript"],
+            "parsed_by": result["parsed_by"],
+        })
+
+    def _schedule_requeue(self, job: dict, delay: float):
+        task = asyncio.create_task(self._requeue(job, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, job: dict, delay: float):
+        await asyncio.sleep(delay)
+        job.update(status=QUEUED, updated_at=time.time())
+        await self.backend.enqueue(job)
+
+    async def _reclaim_periodically(self):
+        while True:
+            await asyncio.sleep(self.stale_after / 2)
+            try:
+                for job in await self.backend.stalled(self.stale_after):
+                    if job["attempts"] >= self.max_attempts:
+                        await self._update(job, status=FAILED, error="Draft job was lost by its worker")
+                        continue
+                    logger.warning("Requeueing stalled draft job", extra={"job_id": job["job_id"]})
+                    job.update(status=QUEUED, updated_at=time.time())
+                    await self.backend.enqueue(job)
+            except Exception:
+                logger.exception("Reclaiming stalled draft jobs failed")
+
+
+job_runner = DraftJobRunner(
+    create_job_backend(),
+    workers=settings.JOB_WORKERS,
+    limits={
+        "speech": asyncio.Semaphore(settings.JOB_SPEECH_CONCURRENCY),
+        "openai": asyncio.Semaphore(settings.JOB_LLM_CONCURRENCY),
+    },
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_base=settings.JOB_RETRY_BASE_SECONDS,
+    max_queued=settings.JOB_MAX_QUEUED,
+    stale_after=settings.JOB_STALE_SECONDS,
+)
+
+registry.gauge(
+    "draft_jobs", "Draft job queue depth and running jobs", ("state",),
+    callback=lambda: {("queued",): job_runner.backend.depth(), ("running",): job_runner.running},
+)
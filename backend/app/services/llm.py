@@ -1,19 +1,37 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.output_parsers import PydanticOutputParser
-from langchain.prompts import ChatPromptTemplate
+import threading
+from functools import lru_cache
 from schemas.schemas import TransactionFromLLM, ParseTranscriptRequest
 from core.config import settings
-import os 
+from core.metrics import stage_timer, stats_gauge, llm_tokens_total, llm_requests_total
+from services.llm_gateway import LLMGateway
+from core.resilience import upstream_policy
 
 #setup langchain
-parser = PydanticOutputParser(pydantic_object=TransactionFromLLM)
-prompt = ChatPromptTemplate.from_template(
-    """
-    Kamu adalah asisten untuk UMKM. Berikut adalah daftar produk yang dijual oleh UMKM:
+# langchain and the OpenAI client take a good part of a second to import,
+# so the parser, prompt and model are built on first use instead of at
+# import time.
 
-    {product_list}
+@lru_cache(maxsize=None)
+def get_parser():
+    from langchain.output_parsers import PydanticOutputParser
 
-    Kalimat transkrip dari penjual: "{input_text}"
+    return PydanticOutputParser(pydantic_object=TransactionFromLLM)
+
+@lru_cache(maxsize=None)
+def get_format_instructions() -> str:
+    # Built once; it is the same for every request
+    return get_parser().get_format_instructions()
+
+@lru_cache(maxsize=None)
+def get_prompt():
+    from langchain.prompts import ChatPromptTemplate
+
+    # Everything that is the same for every request comes first, so provider
+    # prompt caching can reuse the prefix; the per-UMKM product list and the
+    # transcript follow in the user message.
+    return ChatPromptTemplate.from_messages([
+        ("system", """
+    Kamu adalah asisten untuk UMKM yang mengubah transkrip penjual menjadi transaksi.
 
     Tugasmu:
     - Tentukan jenis transaksi: purchase atau sale (puntuk sekarang semua trx merupakan sale)
@@ -24,19 +42,131 @@ prompt = ChatPromptTemplate.from_template(
 
     Format output JSON:
     {format_instructions}
-    """
+    """),
+        ("human", """
+    Berikut adalah daftar produk yang dijual oleh UMKM:
+
+    {product_list}
+
+    Kalimat transkrip dari penjual: "{input_text}"
+    """),
+    ]).partial(format_instructions=get_format_instructions())
+
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain.chat_models import ChatOpenAI
+
+    if not settings.OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    return ChatOpenAI(
+        model="gpt-4.1-nano",
+        temperature=0,
+        openai_api_key=settings.OPENAI_API_KEY,
+        # e.g. a local OpenAI-compatible server for load tests
+        openai_api_base=settings.OPENAI_BASE_URL or None,
+        request_timeout=settings.LLM_TIMEOUT_SECONDS,
+        # retries are done by llm_policy / the gateway, not inside the client
+        max_retries=0,
+    )
+
+llm_policy = upstream_policy(
+    "openai",
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    attempts=settings.LLM_ATTEMPTS,
+    backoff_base=settings.UPSTREAM_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.UPSTREAM_BACKOFF_MAX_SECONDS,
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREAKER_RESET_SECONDS,
+    hedge_after=settings.LLM_HEDGE_AFTER_SECONDS,
 )
-llm = ChatOpenAI(model="gpt-4.1-nano", temperature=0, openai_api_key=settings.OPENAI_API_KEY)
 
-chain = prompt | llm | parser
+# The model call and the output parsing are separate steps so each can be
+# timed and the token usage read off the raw message. Benchmarks assign
+# llm_chain directly; otherwise get_llm_chain() builds it once.
+llm_chain = None
+_chain_lock = threading.Lock()
 
-def parse_transcript_with_llm(data: ParseTranscriptRequest) -> TransactionFromLLM:
-    product_lines = "\n".join(f"- {p.name} (Rp {p.price})" for p in data.product_list)
+def get_llm_chain():
+    global llm_chain
+    if llm_chain is None:
+        with _chain_lock:
+            if llm_chain is None:
+                llm_chain = get_prompt() | get_llm()
+    return llm_chain
+
+def get_chain():
+    return get_llm_chain() | get_parser()
 
-    result = chain.invoke({
+def _build_chain_input(data: ParseTranscriptRequest) -> dict:
+    product_lines = "\n".join(f"- {p.name} (Rp {p.price})" for p in data.product_list)
+    return {
         "input_text": data.transcript,
         "product_list": product_lines,
-        "format_instructions": parser.get_format_instructions()
-    })
+    }
+
+def _estimate_tokens(inputs: dict) -> int:
+    # ~4 characters per token, plus room for the JSON answer
+    prompt_chars = len(get_format_instructions()) + sum(len(v) for v in inputs.values())
+    return prompt_chars // 4 + settings.LLM_COMPLETION_TOKEN_ESTIMATE
+
+gateway = LLMGateway(
+    # looked up at call time, so a swapped llm_chain (benchmarks) is used
+    lambda inputs: get_llm_chain().abatch(inputs, return_exceptions=True),
+    _estimate_tokens,
+    window=settings.LLM_GATEWAY_WINDOW_SECONDS,
+    max_batch=settings.LLM_GATEWAY_MAX_BATCH,
+    max_queue=settings.LLM_GATEWAY_MAX_QUEUE,
+    requests_per_minute=settings.LLM_RATE_LIMIT_RPM,
+    tokens_per_minute=settings.LLM_RATE_LIMIT_TPM,
+    max_wait=settings.LLM_GATEWAY_MAX_WAIT_SECONDS,
+    max_attempts=settings.LLM_GATEWAY_MAX_ATTEMPTS,
+)
+
+stats_gauge("llm_gateway", "LLM gateway queue and dispatch counters", gateway.stats)
+
+def _record_token_usage(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+    llm_tokens_total.inc(prompt_tokens, kind="prompt")
+    llm_tokens_total.inc(completion_tokens, kind="completion")
+
+def _parse_message(message) -> TransactionFromLLM:
+    _record_token_usage(message)
+    with stage_timer("parse"):
+        return get_parser().invoke(message)
+
+def parse_transcript_with_llm(data: ParseTranscriptRequest) -> TransactionFromLLM:
+    try:
+        with stage_timer("llm"):
+            inputs = _build_chain_input(data)
+            # the client enforces request_timeout itself
+            message = llm_policy.call_sync(lambda timeout: get_llm_chain().invoke(inputs))
+    except Exception:
+        llm_requests_total.inc(outcome="error")
+        raise
+    llm_requests_total.inc(outcome="ok")
+
+    return _parse_message(message)
+
+async def aparse_transcript_with_llm(data: ParseTranscriptRequest) -> TransactionFromLLM:
+    """
+    Async parse through the batching gateway (LLM_GATEWAY_ENABLED), which
+    may raise LLMOverloaded instead of queueing past its budgets.
+    """
+    try:
+        with stage_timer("llm"):
+            inputs = _build_chain_input(data)
+            if settings.LLM_GATEWAY_ENABLED:
+                message = await llm_policy.call(lambda: gateway.submit(inputs))
+            else:
+                message = await llm_policy.call(lambda: get_llm_chain().ainvoke(inputs))
+    except Exception:
+        llm_requests_total.inc(outcome="error")
+        raise
+    llm_requests_total.inc(outcome="ok")
 
-    return result
+    return _parse_message(message)
@@ -0,0 +1,227 @@
+"""
+Micro-batching gateway in front of the LLM provider.
+
+Concurrent parse requests (many UMKMs at lunch time) are collected for a
+short window and sent together with chain.abatch, under global
+requests-per-minute and tokens-per-minute budgets. When the provider
+throttles (HTTP 429) dispatching pauses for its Retry-After and the
+throttled requests go back to the front of the queue; requests that would
+wait longer than LLM_GATEWAY_MAX_WAIT_SECONDS are shed right away with
+LLMOverloaded instead of piling up.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from core.metrics import registry
+from core.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+llm_batch_size = registry.histogram(
+    "llm_gateway_batch_size", "Requests per dispatched LLM batch", buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+llm_queue_seconds = registry.histogram("llm_gateway_queue_seconds", "Time requests wait in the LLM gateway")
+llm_shed_total = registry.counter("llm_gateway_shed_total", "LLM requests rejected by the gateway", ("reason",))
+llm_throttled_total = registry.counter("llm_gateway_throttled_total", "LLM calls throttled by the provider")
+
+
+class LLMOverloaded(Exception):
+    """
+    The gateway won't take (or finish) the request in time; try later.
+    """
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _is_throttle(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: Exception, default: float) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+class _Pending:
+    __slots__ = ("inputs", "tokens", "future", "enqueued_at", "attempts")
+
+    def __init__(self, inputs, tokens, future):
+        self.inputs = inputs
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class LLMGateway:
+    """
+    `batch_call(list of chain inputs)` must return one result or exception
+    per input, e.g. `lambda inputs: chain.abatch(inputs, return_exceptions=True)`.
+    `estimate_tokens(inputs)` sizes a request for the token budget.
+    """
+    def __init__(
+        self,
+        batch_call,
+        estimate_tokens,
+        window: float,
+        max_batch: int,
+        max_queue: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_wait: float,
+        max_attempts: int,
+        throttle_backoff: float = 1.0,
+    ):
+        self.batch_call = batch_call
+        self.estimate_tokens = estimate_tokens
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.throttle_backoff = throttle_backoff
+        self._requests = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 60))
+        self._tokens = TokenBucket(tokens_per_minute / 60, max(1, tokens_per_minute / 60))
+        self._queue = deque()
+        self._wakeup = None
+        self._task = None
+        self._inflight = set()
+        self._cooldown_until = 0.0
+        self.dispatched = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in [self._task, *self._inflight]:
+            if task is not None:
+                task.cancel()
+        self._task = None
+
+    def expected_wait(self) -> float:
+        """
+        Rough time a request queued now waits before being sent.
+        """
+        cooldown = max(0.0, self._cooldown_until - time.monotonic())
+        return cooldown + len(self._queue) / self._requests.rate
+
+    async def submit(self, inputs: dict):
+        self._ensure_started()
+        if len(self._queue) >= self.max_queue:
+            llm_shed_total.inc(reason="queue_full")
+            raise LLMOverloaded("LLM queue is full", retry_after=self.expected_wait())
+        wait = self.expected_wait()
+        if wait > self.max_wait:
+            llm_shed_total.inc(reason="wait")
+            raise LLMOverloaded(f"LLM is busy, expected wait {wait:.1f}s", retry_after=wait)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(_Pending(inputs, self.estimate_tokens(inputs), future))
+        self._wakeup.set()
+        return await future
+
+    def _take_batch(self) -> list:
+        batch = []
+        while self._queue and len(batch) < self.max_batch:
+            pending = self._queue.popleft()
+            # the caller may have given up (client disconnected, timeout)
+            if not pending.future.done():
+                batch.append(pending)
+        return batch
+
+    def _pay_for(self, batch: list) -> int:
+        """
+        Take budget for the leading requests of `batch` that fit in both
+        buckets right now; returns how many did.
+        """
+        paid = 0
+        for pending in batch:
+            if self._requests.wait_time(1) > 0 or self._tokens.wait_time(pending.tokens) > 0:
+                break
+            self._requests.try_acquire(1)
+            self._tokens.try_acquire(pending.tokens)
+            paid += 1
+        return paid
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if len(self._queue) < self.max_batch:
+                # let concurrent requests join this batch
+                await asyncio.sleep(self.window)
+            cooldown = self._cooldown_until - time.monotonic()
+            if cooldown > 0:
+                await asyncio.sleep(cooldown)
+
+            batch = self._take_batch()
+            if not batch:
+                continue
+            # Pay per request: the first one waits for budget, the rest only
+            # ride along while the budget covers them and go back to the
+            # front of the queue otherwise
+            await self._requests.acquire(1)
+            await self._tokens.acquire(batch[0].tokens)
+            paid = 1 + self._pay_for(batch[1:])
+            if paid < len(batch):
+                self._queue.extendleft(reversed(batch[paid:]))
+                batch = batch[:paid]
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list):
+        now = time.monotonic()
+        for pending in batch:
+            llm_queue_seconds.observe(now - pending.enqueued_at)
+            pending.attempts += 1
+        llm_batch_size.observe(len(batch))
+        self.batches += 1
+        self.dispatched += len(batch)
+        try:
+            results = await self.batch_call([p.inputs for p in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        throttled = []
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, Exception) and _is_throttle(result):
+                llm_throttled_total.inc()
+                self._cooldown_until = max(
+                    self._cooldown_until, time.monotonic() + _retry_after(result, self.throttle_backoff),
+                )
+                if pending.attempts < self.max_attempts:
+                    throttled.append(pending)
+                else:
+                    llm_shed_total.inc(reason="throttled")
+                    pending.future.set_exception(LLMOverloaded("LLM provider is throttling", retry_after=self.expected_wait()))
+            elif isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+        if throttled:
+            logger.warning("LLM provider throttled %d requests, pausing dispatch", len(throttled))
+            # oldest first, ahead of everything that arrived meanwhile
+            self._queue.extendleft(reversed(throttled))
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "inflight_batches": len(self._inflight),
+            "dispatched": self.dispatched,
+            "batches": self.batches,
+            "cooldown_seconds": max(0.0, self._cooldown_until - time.monotonic()),
+        }
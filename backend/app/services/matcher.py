@@ -0,0 +1,317 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from schemas.schemas import Product, TransactionFromLLM, TransactionItem
+
+# --- Indonesian normalization -------------------------------------------
+
+_DIGITS = {
+    "nol": 0, "satu": 1, "dua": 2, "tiga": 3, "empat": 4, "lima": 5,
+    "enam": 6, "tujuh": 7, "delapan": 8, "sembilan": 9,
+}
+_SPECIAL_NUMBERS = {"sepuluh": 10, "sebelas": 11, "seratus": 100, "sebiji": 1, "setengah": None}
+
+# Classifiers ("dua *bungkus* nasi") carry no product information
+_CLASSIFIERS = {
+    "bungkus", "bks", "gelas", "porsi", "piring", "botol", "buah", "biji", "pcs",
+    "cup", "mangkok", "mangkuk", "potong", "kotak", "pack", "sachet", "renceng",
+    "kilo", "kg", "liter", "ekor", "batang", "kali", "x",
+}
+_SEPARATORS = {"dan", "sama", "terus", "lalu", "plus", "tambah", "trus", "habis", "pakai", "pake"}
+_FILLERS = {
+    "mau", "pesan", "pesen", "tolong", "ya", "yah", "dong", "deh", "aja", "saja",
+    "mas", "mbak", "bu", "pak", "kak", "lagi", "jadi", "totalnya", "semua", "yang",
+    "ini", "itu", "untuk", "buat", "minta", "beli", "jual", "kasih", "nih", "tuh", "ada",
+}
+# Anything that smells like restocking goes to the LLM, which decides sale/purchase
+_PURCHASE_HINTS = {"kulakan", "restock", "supplier", "belanja", "stok", "grosir", "masuk"}
+
+_SLANG = {
+    "nasgor": "nasi goreng",
+    "esteh": "es teh",
+    "kopsus": "kopi susu",
+    "mi": "mie",
+    "bakmi": "bakmie",
+    "aqua": "air mineral",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_tokens(value: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(value.lower()):
+        token = _SLANG.get(token, token)
+        for part in token.split():
+            # "tehnya", "gorengannya" -> "teh", "gorengan"
+            if len(part) > 5 and part.endswith("nya"):
+                part = part[:-3]
+            tokens.append(part)
+    return tokens
+
+
+def _parse_number(tokens: List[str], i: int) -> Tuple[Optional[int], int]:
+    """
+    Parse an Indonesian number starting at tokens[i].
+    Returns (value, tokens consumed); value is None when there is no number.
+    """
+    token = tokens[i]
+    if token.isdigit():
+        return int(token), 1
+    if token.endswith("x") and token[:-1].isdigit():
+        return int(token[:-1]), 1
+    if token in _SPECIAL_NUMBERS:
+        value = _SPECIAL_NUMBERS[token]
+        return (value, 1) if value is not None else (None, 0)
+    # "sebungkus", "segelas", "seporsi"
+    if token.startswith("se") and token[2:] in _CLASSIFIERS:
+        return 1, 1
+    if token in _DIGITS:
+        value = _DIGITS[token]
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+        if nxt == "belas":
+            return 10 + value, 2
+        if nxt == "puluh":
+            after = tokens[i + 2] if i + 2 < len(tokens) else None
+            if after in _DIGITS:
+                return value * 10 + _DIGITS[after], 3
+            return value * 10, 2
+        if nxt == "ratus":
+            return value * 100, 2
+        return value, 1
+    return None, 0
+
+
+class Segment:
+    __slots__ = ("words", "quantity")
+
+    def __init__(self, words: List[str], quantity: int):
+        self.words = words
+        self.quantity = quantity
+
+    @property
+    def phrase(self) -> str:
+        return " ".join(self.words)
+
+
+def split_segments(tokens: List[str], vocabulary: frozenset = frozenset()) -> List[Segment]:
+    """
+    Split "es teh dua sama dua bungkus nasi goreng" into
+    [("es teh", 2), ("nasi goreng", 2)]. A number either prefixes the next
+    product ("dua nasi") or closes the current one ("es teh dua").
+
+    Classifier words that also occur in product names (`vocabulary`, e.g.
+    "teh botol") are only dropped right after a number ("dua botol").
+    """
+    segments = []
+    words: List[str] = []
+    quantity: Optional[int] = None
+
+    def close():
+        nonlocal words, quantity
+        if words:
+            segments.append(Segment(words, quantity or 1))
+        words, quantity = [], None
+
+    after_number = False
+    i = 0
+    while i < len(tokens):
+        value, consumed = _parse_number(tokens, i)
+        if consumed:
+            if words and quantity is None:
+                quantity = value
+                close()
+            else:
+                if words:
+                    close()
+                quantity = value
+            i += consumed
+            after_number = True
+            continue
+        token = tokens[i]
+        i += 1
+        if token in _CLASSIFIERS and (after_number or token not in vocabulary):
+            continue
+        after_number = False
+        if token in _SEPARATORS:
+            close()
+        elif token in _FILLERS and token not in vocabulary:
+            continue
+        else:
+            words.append(token)
+    close()
+    return segments
+
+
+# --- Similarity ----------------------------------------------------------
+
+def _trigrams(value: str) -> set:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1 or min(len(a), len(b)) < 4:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = j = edits = 0
+    while i < len(a) and j < len(b):
+        if a[i] != b[j]:
+            edits += 1
+            if edits > 1:
+                return False
+            if len(a) == len(b):
+                i += 1
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return edits + (len(b) - j) <= 1
+
+
+def _token_f1(phrase_tokens: List[str], name_tokens: List[str]) -> float:
+    if not phrase_tokens or not name_tokens:
+        return 0.0
+    matched = sum(1 for t in phrase_tokens if any(_within_one_edit(t, n) for n in name_tokens))
+    if not matched:
+        return 0.0
+    precision = matched / len(phrase_tokens)
+    recall = sum(1 for n in name_tokens if any(_within_one_edit(t, n) for t in phrase_tokens)) / len(name_tokens)
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+class _IndexedProduct:
+    __slots__ = ("product", "tokens", "trigrams")
+
+    def __init__(self, product: Product):
+        self.product = product
+        self.tokens = normalize_tokens(product.name)
+        self.trigrams = _trigrams(" ".join(self.tokens))
+
+
+class MatchResult:
+    def __init__(self, items: List[Tuple[Product, int, float, float]], confident: bool):
+        # (product, quantity, score, margin over the runner-up)
+        self.items = items
+        self.confident = confident
+
+    def to_transaction(self, umkm_id: int, transcript: str) -> TransactionFromLLM:
+        return TransactionFromLLM(
+            umkm_id=umkm_id,
+            transaction_type="sale",
+            transcript=transcript,
+            items=[
+                TransactionItem(
+                    product_id=product.product_id,
+                    name=product.name,
+                    quantity=quantity,
+                    unit_price=product.price,
+                )
+                for product, quantity, _, _ in self.items
+            ],
+        )
+
+
+class ProductMatcher:
+    """
+    Product-name index for one UMKM catalog. Names are normalized into
+    Indonesian tokens and character trigrams; an inverted trigram index
+    keeps scoring proportional to the products that share text with the
+    utterance instead of the whole catalog.
+    """
+    def __init__(self, products: List[Product], min_score: float = 0.75, min_margin: float = 0.15):
+        self.products = [_IndexedProduct(p) for p in products]
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.vocabulary = frozenset(t for indexed in self.products for t in indexed.tokens)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for idx, indexed in enumerate(self.products):
+            for gram in indexed.trigrams:
+                self._postings[gram].append(idx)
+
+    def _score(self, phrase_tokens: List[str]) -> List[Tuple[float, int]]:
+        phrase = " ".join(phrase_tokens)
+        grams = _trigrams(phrase)
+        shared = defaultdict(int)
+        for gram in grams:
+            for idx in self._postings.get(gram, ()):
+                shared[idx] += 1
+        scored = []
+        for idx, count in shared.items():
+            indexed = self.products[idx]
+            dice = 2 * count / (len(grams) + len(indexed.trigrams))
+            score = 0.4 * dice + 0.6 * _token_f1(phrase_tokens, indexed.tokens)
+            scored.append((score, idx))
+        scored.sort(reverse=True)
+        return scored
+
+    def match(self, transcript: str) -> MatchResult:
+        tokens = normalize_tokens(transcript)
+        segments = split_segments(tokens, self.vocabulary)
+        confident = bool(segments) and not _PURCHASE_HINTS.intersection(tokens)
+        items = []
+        for segment in segments:
+            scored = self._score(segment.words)
+            if not scored:
+                confident = False
+                continue
+            best_score, best_idx = scored[0]
+            margin = best_score - scored[1][0] if len(scored) > 1 else best_score
+            if best_score < self.min_score or margin < self.min_margin:
+                confident = False
+            items.append((self.products[best_idx].product, segment.quantity, best_score, margin))
+        return MatchResult(items, confident)
+
+    def candidates(self, transcript: str, k: int) -> List[Product]:
+        """
+        Top-k products for the utterance, used to shrink the LLM prompt.
+        Each segment's best matches come first so a long order can't crowd
+        out the products of its last items.
+        """
+        tokens = normalize_tokens(transcript)
+        segments = split_segments(tokens, self.vocabulary) or [Segment(tokens, 1)]
+        best: Dict[int, float] = {}
+        ranked_per_segment = [self._score(s.words) for s in segments]
+        for rank in range(k):
+            for scored in ranked_per_segment:
+                if rank < len(scored):
+                    score, idx = scored[rank]
+                    best[idx] = max(best.get(idx, 0.0), score)
+            if len(best) >= k:
+                break
+        ordered = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [self.products[idx].product for idx, _ in ordered]
+
+
+class MatcherRegistry:
+    """
+    One matcher per UMKM, rebuilt when the catalog cache hands out a new
+    product list (the cache returns the same list object until the entry
+    is reloaded, so an identity check is enough).
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, umkm_id: int, products: List[Product]) -> ProductMatcher:
+        with self._lock:
+            entry = self._entries.get(umkm_id)
+            if entry is not None and entry[0] is products:
+                self._entries.move_to_end(umkm_id)
+                return entry[1]
+        matcher = ProductMatcher(products, settings.MATCHER_MIN_SCORE, settings.MATCHER_MIN_MARGIN)
+        with self._lock:
+            self._entries[umkm_id] = (products, matcher)
+            self._entries.move_to_end(umkm_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return matcher
+
+
+matchers = MatcherRegistry()
@@ -1,21 +1,266 @@
-from google.cloud import speech_v1p1beta1 as speech
-from helper.gcp import speech_client as client 
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+from core.config import settings
+from helper.gcp import get_speech_client, get_speech_async_client
+from core.metrics import stage_timer
+from core.executor import run_blocking
+from core.resilience import upstream_policy
+from services.audio import PreparedAudio, preprocess_audio, sniff_container, passthrough_format
 
-def speech_to_text(audio_bytes: bytes) -> str:
-    print("Audio file received. Size:", len(audio_bytes), "bytes")
+if TYPE_CHECKING:
+    from google.cloud import speech_v1p1beta1 as speech
+
+logger = logging.getLogger(__name__)
+
+speech_policy = upstream_policy(
+    "speech",
+    timeout=settings.SPEECH_TIMEOUT_SECONDS,
+    attempts=settings.SPEECH_ATTEMPTS,
+    backoff_base=settings.UPSTREAM_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.UPSTREAM_BACKOFF_MAX_SECONDS,
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREAKER_RESET_SECONDS,
+    hedge_after=settings.SPEECH_HEDGE_AFTER_SECONDS,
+)
+
+
+def _speech_types():
+    # google.cloud.speech loads gRPC and protobuf; defer it to the first
+    # request that actually needs it
+    from google.cloud import speech_v1p1beta1 as speech
+    return speech
 
-    audio = speech.RecognitionAudio(content=audio_bytes)
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,  # <- correct format
-        sample_rate_hertz=48000,  # <- match the file's actual sample rate
+
+def build_recognition_config(encoding: str = "WEBM_OPUS", sample_rate_hertz: int = 48000) -> "speech.RecognitionConfig":
+    speech = _speech_types()
+    return speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+        sample_rate_hertz=sample_rate_hertz,  # <- must match what we actually send
         language_code="id-ID"
     )
+
+
+def prepare_audio(audio_bytes: bytes) -> PreparedAudio:
+    """
+    Preprocess the upload (see services.audio) or, when that is disabled,
+    only sniff the container to pick a matching RecognitionConfig.
+    """
+    with stage_timer("preprocess"):
+        if settings.AUDIO_PREPROCESS_ENABLED:
+            return preprocess_audio(audio_bytes)
+        container = sniff_container(audio_bytes)
+        encoding, rate = passthrough_format(container if container != "unknown" else "webm", audio_bytes)
+        return PreparedAudio(audio_bytes, encoding, rate, None, len(audio_bytes), container)
+
+
+def _join_transcript(response) -> str:
+    return " ".join([result.alternatives[0].transcript for result in response.results])
+
+
+def speech_to_text(audio_bytes: bytes) -> str:
+    logger.debug("Audio file received", extra={"audio_bytes": len(audio_bytes)})
+
+    prepared = prepare_audio(audio_bytes)
+    if not prepared.content:
+        # Nothing but silence, don't pay for a recognize call
+        return ""
+    audio = _speech_types().RecognitionAudio(content=prepared.content)
+    config = build_recognition_config(prepared.encoding, prepared.sample_rate_hertz)
     try:
-        response = client.recognize(config=config, audio=audio)
+        with stage_timer("stt"):
+            response = speech_policy.call_sync(get_speech_client().recognize, config=config, audio=audio)
     except Exception as e:
-        print(f"Error during speech recognition: {e}")
+        logger.warning("Error during speech recognition: %s", e)
         raise
-    transcript = " ".join([result.alternatives[0].transcript for result in response.results])
-    print(f"TRANSCRIPT: {transcript}")
+    transcript = _join_transcript(response)
+    logger.debug("Transcript: %s", transcript)
 
     return transcript
+
+
+async def speech_to_text_async(audio_bytes: bytes) -> str:
+    """
+    Same as speech_to_text but awaits the gRPC call on the async client,
+    so the event loop keeps serving other requests meanwhile.
+    """
+    logger.debug("Audio file received", extra={"audio_bytes": len(audio_bytes)})
+
+    # Decoding and resampling are CPU work, keep them off the event loop
+    prepared = await run_blocking(prepare_audio, audio_bytes)
+    if not prepared.content:
+        return ""
+    audio = _speech_types().RecognitionAudio(content=prepared.content)
+    config = build_recognition_config(prepared.encoding, prepared.sample_rate_hertz)
+    try:
+        with stage_timer("stt"):
+            response = await speech_policy.call(
+                lambda: get_speech_async_client().recognize(config=config, audio=audio, timeout=speech_policy.timeout)
+            )
+    except Exception as e:
+        logger.warning("Error during speech recognition: %s", e)
+        raise
+    transcript = _join_transcript(response)
+    logger.debug("Transcript: %s", transcript)
+
+    return transcript
+
+
+def build_streaming_config(
+    encoding: str = "WEBM_OPUS",
+    sample_rate_hertz: int = 48000,
+    interim_results: bool = True,
+) -> "speech.StreamingRecognitionConfig":
+    speech = _speech_types()
+    return speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+            sample_rate_hertz=sample_rate_hertz,
+            language_code="id-ID"
+        ),
+        interim_results=interim_results,
+    )
+
+
+_WEBM_CLUSTER = b"\x1f\x43\xb6\x75"
+
+
+class StreamFraming:
+    """
+    Container framing of a streamed WebM/Opus or Ogg/Opus upload. Only the
+    first session gets the container header from the client, so it is kept
+    here to be sent again at the start of every later session, and a
+    session is cut where a WebM cluster or Ogg page starts so the next one
+    begins on something the decoder can read. Headerless encodings
+    (LINEAR16, ...) can be cut anywhere.
+    """
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.header = None if encoding in ("WEBM_OPUS", "OGG_OPUS") else b""
+        self._seen = b""
+
+    def feed(self, chunk: bytes):
+        """
+        Record the stream's first bytes until the header is complete.
+        """
+        if self.header is not None:
+            return
+        self._seen += chunk
+        end = self._header_end()
+        if end is not None:
+            self.header = self._seen[:end]
+            self._seen = b""
+
+    def _header_end(self):
+        if self.encoding == "WEBM_OPUS":
+            # EBML header, Segment info and Tracks; audio starts with the first Cluster
+            end = self._seen.find(_WEBM_CLUSTER)
+            return end if end >= 0 else None
+        # Ogg/Opus: OpusHead and OpusTags pages have granule position 0
+        pos = 0
+        while len(self._seen) >= pos + 27 and self._seen[pos:pos + 4] == b"OggS":
+            if int.from_bytes(self._seen[pos + 6:pos + 14], "little") != 0:
+                return pos
+            segments = self._seen[pos + 26]
+            if len(self._seen) < pos + 27 + segments:
+                return None
+            pos += 27 + segments + sum(self._seen[pos + 27:pos + 27 + segments])
+        return None
+
+    def cut(self, chunk: bytes) -> int:
+        """
+        Offset in `chunk` where a new session can start, or -1.
+        """
+        if self.encoding == "WEBM_OPUS":
+            return chunk.find(_WEBM_CLUSTER) if self.header is not None else -1
+        if self.encoding == "OGG_OPUS":
+            return chunk.find(b"OggS") if self.header is not None else -1
+        return 0
+
+
+async def stream_speech_to_text(
+    audio_queue: asyncio.Queue,
+    streaming_config: "speech.StreamingRecognitionConfig" = None,
+    client=None,
+    session_limit: float = None,
+):
+    """
+    Pipe audio chunks from `audio_queue` into `streaming_recognize` and yield
+    interim/final results as they arrive. A `None` chunk ends the stream.
+
+    Google caps a single streaming session, so once `session_limit` seconds
+    have passed the current request stream is closed at the next WebM
+    cluster or Ogg page and a new session is opened on the same queue,
+    starting with the container header (see StreamFraming). Chunks not yet
+    sent stay in the queue, and when the server closes a session first
+    (OutOfRange) the chunk that was in flight is sent again, so no audio is
+    dropped across the reconnect.
+    """
+    from google.api_core.exceptions import OutOfRange
+
+    speech = _speech_types()
+    client = client or get_speech_async_client()
+    streaming_config = streaming_config or build_streaming_config()
+    session_limit = session_limit or settings.STREAMING_SESSION_LIMIT_SECONDS
+    framing = StreamFraming(speech.RecognitionConfig.AudioEncoding(streaming_config.config.encoding).name)
+    loop = asyncio.get_running_loop()
+    finished = False
+    session = 0
+    # Audio taken off the queue that the next session has to start with
+    carry = None
+    in_flight = None
+
+    while not finished:
+        deadline = loop.time() + session_limit
+
+        async def request_stream():
+            nonlocal finished, carry, in_flight
+            yield speech.StreamingRecognizeRequest(streaming_config=streaming_config)
+            if session and framing.header:
+                yield speech.StreamingRecognizeRequest(audio_content=framing.header)
+            while True:
+                if carry is not None:
+                    chunk, carry = carry, None
+                else:
+                    # Past the deadline, keep going (for at most the grace
+                    # period) until a chunk the session can be cut at
+                    remaining = deadline + settings.STREAMING_SESSION_GRACE_SECONDS - loop.time()
+                    try:
+                        chunk = await asyncio.wait_for(audio_queue.get(), timeout=max(remaining, 0))
+                    except asyncio.TimeoutError:
+                        return
+                    if chunk is None:
+                        finished = True
+                        return
+                    framing.feed(chunk)
+                    if loop.time() >= deadline:
+                        cut = framing.cut(chunk)
+                        if cut >= 0:
+                            chunk, carry = chunk[:cut], chunk[cut:]
+                in_flight = chunk
+                if chunk:
+                    yield speech.StreamingRecognizeRequest(audio_content=chunk)
+                in_flight = None
+                if carry is not None:
+                    return
+
+        try:
+            responses = await client.streaming_recognize(requests=request_stream())
+            async for response in responses:
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    yield {
+                        "type": "final" if result.is_final else "interim",
+                        "transcript": result.alternatives[0].transcript,
+                        "stability": result.stability,
+                        "session": session,
+                    }
+        except OutOfRange as e:
+            # Session hit the server-side duration cap before our own limit;
+            # the chunk it was sending may not have made it
+            logger.info("Streaming session %s closed by server, reconnecting: %s", session, e)
+            if in_flight:
+                carry = in_flight + (carry or b"")
+        in_flight = None
+        session += 1
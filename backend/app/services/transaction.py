@@ -1,87 +1,393 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from schemas.schemas import TransactionFromLLM
+from core.versioning import bump_sales_version
+from services.events import publish_transaction, publish_resync
+from services.inventory import apply_ledger_changes, is_deadlock
+from core.config import settings
 
-def create_transaction_from_llm(payload: TransactionFromLLM, db: Session):
+logger = logging.getLogger(__name__)
+
+
+def _item_arrays(payload: TransactionFromLLM) -> dict:
+    return {
+        "product_ids": [i.product_id for i in payload.items],
+        "quantities": [i.quantity for i in payload.items],
+        "unit_prices": [i.unit_price for i in payload.items],
+    }
+
+
+def _stock_deltas(payload: TransactionFromLLM) -> dict:
+    # UPDATE ... FROM only applies one joined row per product, so the same
+    # product mentioned twice has to be summed up front
+    deltas = OrderedDict()
+    for item in payload.items:
+        deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+    return {"product_ids": list(deltas.keys()), "quantities": list(deltas.values())}
+
+
+def _apply_stock_changes(db: Session, umkm_id: int, deltas: dict, sign: int) -> list:
+    """
+    Apply all stock changes in one statement and report what happened to
+    each product: "ok" with the remaining stock, "insufficient_stock" with
+    the stock that was available (sales only), or "not_found".
+    """
+    if settings.INVENTORY_MODE == "ledger":
+        return apply_ledger_changes(db, umkm_id, deltas, sign)
+    guard = "AND p.stock >= r.quantity" if sign < 0 else ""
+    rows = db.execute(text(f"""
+        WITH requested AS (
+            SELECT * FROM unnest(CAST(:product_ids AS integer[]), CAST(:quantities AS integer[]))
+                AS r(product_id, quantity)
+        ),
+        updated AS (
+            UPDATE products AS p
+            SET stock = p.stock {"-" if sign < 0 else "+"} r.quantity
+            FROM requested r
+            WHERE p.product_id = r.product_id AND p.umkm_id = :umkm_id {guard}
+            RETURNING p.product_id, p.stock
+        )
+        SELECT r.product_id, r.quantity, u.stock AS stock_after, cur.stock AS stock_before
+        FROM requested r
+        LEFT JOIN updated u ON u.product_id = r.product_id
+        LEFT JOIN products cur ON cur.product_id = r.product_id AND cur.umkm_id = :umkm_id
+    """), {"umkm_id": umkm_id, **deltas}).mappings().all()
+
+    outcomes = []
+    for row in rows:
+        if row["stock_after"] is not None:
+            status, stock = "ok", row["stock_after"]
+        elif row["stock_before"] is None:
+            status, stock = "not_found", None
+        else:
+            status, stock = "insufficient_stock", row["stock_before"]
+        outcomes.append({
+            "product_id": row["product_id"],
+            "quantity": row["quantity"],
+            "status": status,
+            "stock": stock,
+        })
+    return outcomes
+
+
+class IdempotencyConflict(Exception):
+    """
+    The idempotency key was already used for a different payload.
+    """
+
+
+def _request_hash(payload: TransactionFromLLM) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+def _claim_idempotency_key(db: Session, key: str, payload: TransactionFromLLM) -> Optional[dict]:
+    """
+    Claim `key` inside the current transaction. Returns None when this
+    request owns it, or the stored response when it was already used.
+    A concurrent request holding the same key makes the INSERT wait until
+    that request commits (replay) or rolls back (we take over).
+    """
+    request_hash = _request_hash(payload)
+    claimed = db.execute(text("""
+        INSERT INTO idempotency_keys (idempotency_key, umkm_id, request_hash)
+        VALUES (:key, :umkm_id, :request_hash)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING idempotency_key
+    """), {"key": key, "umkm_id": payload.umkm_id, "request_hash": request_hash}).fetchone()
+    if claimed:
+        return None
+
+    stored = db.execute(text("""
+        SELECT request_hash, response FROM idempotency_keys WHERE idempotency_key = :key
+    """), {"key": key}).fetchone()
+    db.rollback()
+    if stored.request_hash != request_hash:
+        raise IdempotencyConflict(f"Idempotency key {key!r} was used for a different transaction")
+    return {**stored.response, "replayed": True}
+
+
+def _insert_sale(payload: TransactionFromLLM, db: Session, total_amount: float) -> dict:
+    # The daily rollup is bumped in the same statement, so report
+    # totals stay consistent with sales without an extra round trip
+    tx = db.execute(text("""
+        WITH sale AS (
+            INSERT INTO sales (umkm_id, customer_name, total_amount, transcript, status)
+            VALUES (:umkm_id, :customer_name, :total_amount, :transcript, :status)
+            RETURNING sale_id, umkm_id, sale_date, total_amount
+        ),
+        rollup AS (
+            INSERT INTO daily_sales_rollup (umkm_id, day, total_amount, transaction_count)
+            SELECT umkm_id, CAST(sale_date AS DATE), total_amount, 1 FROM sale
+            ON CONFLICT (umkm_id, day) DO UPDATE
+            SET total_amount = daily_sales_rollup.total_amount + EXCLUDED.total_amount,
+                transaction_count = daily_sales_rollup.transaction_count + 1
+        )
+        SELECT sale_id, sale_date FROM sale
+    """), {
+        "umkm_id": payload.umkm_id,
+        "customer_name": "Auto (LLM)",
+        "total_amount": total_amount,
+        "transcript": payload.transcript,
+        "status": "selesai"
+    })
+    sale_id, sale_date = tx.fetchone()
+
+    db.execute(text("""
+        INSERT INTO sales_items (sale_id, product_id, quantity, unit_price)
+        SELECT :sale_id, item.product_id, item.quantity, item.unit_price
+        FROM unnest(
+            CAST(:product_ids AS integer[]),
+            CAST(:quantities AS integer[]),
+            CAST(:unit_prices AS numeric[])
+        ) AS item(product_id, quantity, unit_price)
+    """), {"sale_id": sale_id, **_item_arrays(payload)})
+
+    # Update stock ↓
+    stock = _apply_stock_changes(db, payload.umkm_id, _stock_deltas(payload), sign=-1)
+
+    return {
+        "message": "Sale transaction created",
+        "sale_id": sale_id,
+        "sale_date": sale_date.isoformat(),
+        "transcript": payload.transcript,
+        "stock": stock,
+        "stock_ok": all(s["status"] == "ok" for s in stock),
+    }
+
+
+def _insert_purchase(payload: TransactionFromLLM, db: Session, total_amount: float) -> dict:
+    tx = db.execute(text("""
+        INSERT INTO purchases (umkm_id, total_amount, transcript)
+        VALUES (:umkm_id, :total_amount, :transcript)
+        RETURNING purchase_id
+    """), {
+        "umkm_id": payload.umkm_id,
+        "total_amount": total_amount,
+        "transcript": payload.transcript
+    })
+    purchase_id = tx.fetchone()[0]
+
+    db.execute(text("""
+        INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price)
+        SELECT :purchase_id, item.product_id, item.quantity, item.unit_price
+        FROM unnest(
+            CAST(:product_ids AS integer[]),
+            CAST(:quantities AS integer[]),
+            CAST(:unit_prices AS numeric[])
+        ) AS item(product_id, quantity, unit_price)
+    """), {"purchase_id": purchase_id, **_item_arrays(payload)})
+
+    # Update stock ↑
+    stock = _apply_stock_changes(db, payload.umkm_id, _stock_deltas(payload), sign=1)
+
+    return {
+        "message": "Purchase transaction created",
+        "purchase_id": purchase_id,
+        "transcript": payload.transcript,
+        "stock": stock,
+        "stock_ok": all(s["status"] == "ok" for s in stock),
+    }
+
+
+# Ledger-mode sales can deadlock on their bucket locks (services/inventory.py)
+_DEADLOCK_ATTEMPTS = 3
+
+
+def create_transaction_from_llm(payload: TransactionFromLLM, db: Session, idempotency_key: str = None):
+    """
+    Insert the transaction header (plus its daily rollup), all its items and
+    all stock changes in three statements regardless of the number of items.
+    Everything is one DB transaction: on any error it is rolled back and the
+    error re-raised.
+
+    With `idempotency_key`, a retried request replays the stored response
+    instead of inserting the transaction (and moving stock) a second time.
+    A transaction that lost a deadlock is retried from the start.
+    """
+    for attempt in range(_DEADLOCK_ATTEMPTS):
+        try:
+            return _create_transaction(payload, db, idempotency_key)
+        except Exception as e:
+            if attempt + 1 >= _DEADLOCK_ATTEMPTS or not is_deadlock(e):
+                raise
+            logger.warning("Deadlock while creating %s, retrying", payload.transaction_type, extra={"umkm_id": payload.umkm_id})
+
+
+def _create_transaction(payload: TransactionFromLLM, db: Session, idempotency_key: Optional[str]):
     try:
+        if idempotency_key:
+            replay = _claim_idempotency_key(db, idempotency_key, payload)
+            if replay is not None:
+                return replay
+
         # Hitung total amount
         total_amount = sum(i.quantity * i.unit_price for i in payload.items)
-        print(f"total amount: {total_amount}")
+        logger.debug("Creating %s", payload.transaction_type, extra={"umkm_id": payload.umkm_id, "items": len(payload.items), "total_amount": total_amount})
         if payload.transaction_type == "sale":
-            tx = db.execute(text("""
-                INSERT INTO sales (umkm_id, customer_name, total_amount, transcript, status)
-                VALUES (:umkm_id, :customer_name, :total_amount, :transcript, :status)
-                RETURNING sale_id
-            """), {
-                "umkm_id": payload.umkm_id,
-                "customer_name": "Auto (LLM)",
-                "total_amount": total_amount,
-                "transcript": payload.transcript,
-                "status": "selesai"
-            })
-            sale_id = tx.fetchone()[0]
-
-            for item in payload.items:
-                db.execute(text("""
-                    INSERT INTO sales_items (sale_id, product_id, quantity, unit_price)
-                    VALUES (:sale_id, :product_id, :quantity, :unit_price)
-                """), {
-                    "sale_id": sale_id,
-                    "product_id": item.product_id,
-                    "quantity": item.quantity,
-                    "unit_price": item.unit_price
-                })
-
-                # Update stock ↓
-                db.execute(text("""
-                    UPDATE products
-                    SET stock = stock - :qty
-                    WHERE product_id = :pid AND stock >= :qty
-                """), {
-                    "qty": item.quantity,
-                    "pid": item.product_id
-                })
-
-            db.commit()
-            return {"message": "Sale transaction created", "sale_id": sale_id, "transcript":payload.transcript}
-
+            result = _insert_sale(payload, db, total_amount)
         elif payload.transaction_type == "purchase":
-            tx = db.execute(text("""
-                INSERT INTO purchases (umkm_id, total_amount, transcript)
-                VALUES (:umkm_id, :total_amount, :transcript)
-                RETURNING purchase_id
-            """), {
-                "umkm_id": payload.umkm_id,
-                "total_amount": total_amount,
-                "transcript": payload.transcript
-            })
-            purchase_id = tx.fetchone()[0]
-
-            for item in payload.items:
-                db.execute(text("""
-                    INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price)
-                    VALUES (:purchase_id, :product_id, :quantity, :unit_price)
-                """), {
-                    "purchase_id": purchase_id,
-                    "product_id": item.product_id,
-                    "quantity": item.quantity,
-                    "unit_price": item.unit_price
-                })
-
-                # Update stock ↑
-                db.execute(text("""
-                    UPDATE products
-                    SET stock = stock + :qty
-                    WHERE product_id = :pid
-                """), {
-                    "qty": item.quantity,
-                    "pid": item.product_id
-                })
-
-            db.commit()
-            return {"message": "Purchase transaction created", "purchase_id": purchase_id, "transcript": payload.transcript}
+            result = _insert_purchase(payload, db, total_amount)
+
+        if idempotency_key:
+            db.execute(text("""
+                UPDATE idempotency_keys SET response = CAST(:response AS jsonb)
+                WHERE idempotency_key = :key
+            """), {"key": idempotency_key, "response": json.dumps(result)})
+
+        db.commit()
+        version = bump_sales_version(payload.umkm_id)
+        publish_transaction(payload, result, version)
+        return result
+    except IdempotencyConflict:
+        raise
     except Exception as e:
-        print(f"DB ERROR: {e}")
+        logger.error("DB ERROR: %s", e)
+        db.rollback()
         raise
 
 
+def _allocate_ids(db: Session, table: str, column: str, count: int) -> list:
+    # Taking the ids up front lets items reference their header in the same
+    # multi-row insert without relying on the order RETURNING comes back in
+    return db.execute(text("""
+        SELECT nextval(pg_get_serial_sequence(:table, :column)) FROM generate_series(1, :count)
+    """), {"table": table, "column": column, "count": count}).scalars().all()
+
+
+def _flatten_items(ids: list, payloads: List[TransactionFromLLM]) -> dict:
+    parent_ids, product_ids, quantities, unit_prices = [], [], [], []
+    for parent_id, payload in zip(ids, payloads):
+        for item in payload.items:
+            parent_ids.append(parent_id)
+            product_ids.append(item.product_id)
+            quantities.append(item.quantity)
+            unit_prices.append(item.unit_price)
+    return {"parent_ids": parent_ids, "product_ids": product_ids, "quantities": quantities, "unit_prices": unit_prices}
+
+
+def _batch_deltas(payloads: List[TransactionFromLLM]) -> dict:
+    deltas = OrderedDict()
+    for payload in payloads:
+        for item in payload.items:
+            deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+    return {"product_ids": list(deltas.keys()), "quantities": list(deltas.values())}
+
+
+def _header_arrays(payloads: List[TransactionFromLLM], occurred_at: list) -> dict:
+    return {
+        "dates": occurred_at,
+        "totals": [sum(i.quantity * i.unit_price for i in p.items) for p in payloads],
+        "transcripts": [p.transcript for p in payloads],
+    }
+
+
+def _insert_sales_bulk(db: Session, umkm_id: int, payloads: List[TransactionFromLLM], occurred_at: list) -> Tuple[list, list]:
+    sale_ids = _allocate_ids(db, "sales", "sale_id", len(payloads))
+    db.execute(text("""
+        WITH sale AS (
+            INSERT INTO sales (sale_id, umkm_id, customer_name, sale_date, total_amount, transcript, status)
+            SELECT s.sale_id, :umkm_id, :customer_name, COALESCE(s.sale_date, NOW()), s.total_amount, s.transcript, :status
+            FROM unnest(
+                CAST(:sale_ids AS integer[]),
+                CAST(:dates AS timestamp[]),
+                CAST(:totals AS numeric[]),
+                CAST(:transcripts AS text[])
+            ) AS s(sale_id, sale_date, total_amount, transcript)
+            RETURNING umkm_id, sale_date, total_amount
+        ),
+        rollup AS (
+            INSERT INTO daily_sales_rollup (umkm_id, day, total_amount, transaction_count)
+            SELECT umkm_id, CAST(sale_date AS DATE), SUM(total_amount), COUNT(*)
+            FROM sale GROUP BY 1, 2
+            ON CONFLICT (umkm_id, day) DO UPDATE
+            SET total_amount = daily_sales_rollup.total_amount + EXCLUDED.total_amount,
+                transaction_count = daily_sales_rollup.transaction_count + EXCLUDED.transaction_count
+        )
+        SELECT COUNT(*) FROM sale
+    """), {
+        "umkm_id": umkm_id,
+        "customer_name": "Bulk import",
+        "status": "selesai",
+        "sale_ids": sale_ids,
+        **_header_arrays(payloads, occurred_at),
+    })
+    db.execute(text("""
+        INSERT INTO sales_items (sale_id, product_id, quantity, unit_price)
+        SELECT * FROM unnest(
+            CAST(:parent_ids AS integer[]),
+            CAST(:product_ids AS integer[]),
+            CAST(:quantities AS integer[]),
+            CAST(:unit_prices AS numeric[])
+        )
+    """), _flatten_items(sale_ids, payloads))
+    stock = _apply_stock_changes(db, umkm_id, _batch_deltas(payloads), sign=-1)
+    return sale_ids, stock
+
+
+def _insert_purchases_bulk(db: Session, umkm_id: int, payloads: List[TransactionFromLLM], occurred_at: list) -> Tuple[list, list]:
+    purchase_ids = _allocate_ids(db, "purchases", "purchase_id", len(payloads))
+    db.execute(text("""
+        INSERT INTO purchases (purchase_id, umkm_id, purchase_date, total_amount, transcript)
+        SELECT p.purchase_id, :umkm_id, COALESCE(p.purchase_date, NOW()), p.total_amount, p.transcript
+        FROM unnest(
+            CAST(:purchase_ids AS integer[]),
+            CAST(:dates AS timestamp[]),
+            CAST(:totals AS numeric[]),
+            CAST(:transcripts AS text[])
+        ) AS p(purchase_id, purchase_date, total_amount, transcript)
+    """), {"umkm_id": umkm_id, "purchase_ids": purchase_ids, **_header_arrays(payloads, occurred_at)})
+    db.execute(text("""
+        INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price)
+        SELECT * FROM unnest(
+            CAST(:parent_ids AS integer[]),
+            CAST(:product_ids AS integer[]),
+            CAST(:quantities AS integer[]),
+            CAST(:unit_prices AS numeric[])
+        )
+    """), _flatten_items(purchase_ids, payloads))
+    stock = _apply_stock_changes(db, umkm_id, _batch_deltas(payloads), sign=1)
+    return purchase_ids, stock
+
+
+def create_transactions_bulk(umkm_id: int, entries: List[Tuple[TransactionFromLLM, Optional[datetime]]], db: Session) -> dict:
+    """
+    Write a batch of transactions for one UMKM in a single DB transaction
+    with a fixed number of statements: headers, items and stock changes are
+    each one multi-row statement per transaction type.
+
+    Purchases are applied before sales, so restocks recorded in the same
+    batch count towards the sales. Stock changes are summed per product
+    over the batch: `stock` reports one outcome per product, and a product
+    without enough stock for the whole batch is not decremented at all.
+
+    Returns {"results": [...] in `entries` order, "stock": [...]}.
+    """
+    results = [None] * len(entries)
+    stock = []
+    try:
+        for transaction_type, insert in (("purchase", _insert_purchases_bulk), ("sale", _insert_sales_bulk)):
+            positions = [n for n, (payload, _) in enumerate(entries) if payload.transaction_type == transaction_type]
+            if not positions:
+                continue
+            payloads = [entries[n][0] for n in positions]
+            ids, outcomes = insert(db, umkm_id, payloads, [entries[n][1] for n in positions])
+            stock.extend(outcomes)
+            for n, new_id in zip(positions, ids):
+                results[n] = {
+                    "transaction_type": transaction_type,
+                    f"{transaction_type}_id": new_id,
+                    "total_amount": sum(i.quantity * i.unit_price for i in entries[n][0].items),
+                }
+        db.commit()
+    except Exception as e:
+        logger.error("DB ERROR: %s", e)
+        db.rollback()
+        raise
+    publish_resync(umkm_id, bump_sales_version(umkm_id))
+    return {"results": results, "stock": stock}
@@ -1,26 +1,92 @@
+from typing import List
+import logging
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from schemas.schemas import PrepareTranscriptRequest
+from schemas.schemas import PrepareTranscriptRequest, Product
+from db.db import SessionLocal, AsyncSessionLocal
+from core.executor import run_blocking
+from services.catalog import catalog_cache
+from core.metrics import stage_timer
+from core.config import settings
 
+logger = logging.getLogger(__name__)
 
 
-def prepare_transcript_service(data: PrepareTranscriptRequest, db: Session):
+_PRODUCT_LIST_QUERY = text("""
+    SELECT product_id,name, price FROM products
+    WHERE umkm_id = :umkm_id AND is_active = TRUE
+""")
+
+
+def _rows_to_products(result):
+    return [{"product_id":row[0] ,"name": row[1], "price": float(row[2])} for row in result]
+
+
+def get_product_list(umkm_id: int, db: Session):
     try:
-        result = db.execute(
-            text("""
-                SELECT product_id,name, price FROM products
-                WHERE umkm_id = :umkm_id AND is_active = TRUE
-            """),
-            {"umkm_id": data.umkm_id}
-        ).fetchall()
+        result = db.execute(_PRODUCT_LIST_QUERY, {"umkm_id": umkm_id}).fetchall()
     except Exception as e:
-        print(f"DB ERROR: {e}")
+        logger.error("DB ERROR: %s", e)
         raise
 
-    print(f"DB result: {result}")
+    logger.debug("Loaded catalog", extra={"umkm_id": umkm_id, "products": len(result)})
 
+    return _rows_to_products(result)
+
+
+async def aget_product_list(umkm_id: int, db: AsyncSession):
+    try:
+        result = (await db.execute(_PRODUCT_LIST_QUERY, {"umkm_id": umkm_id})).fetchall()
+    except Exception as e:
+        logger.error("DB ERROR: %s", e)
+        raise
 
-    products = [{"product_id":row[0] ,"name": row[1], "price": float(row[2])} for row in result]
+    return _rows_to_products(result)
+
+
+def get_catalog(umkm_id: int, db: Session = None) -> List[Product]:
+    """
+    Active products of a UMKM, served from the catalog cache when possible.
+    Without `db` a short-lived session is opened only on a cache miss.
+    """
+    cached = catalog_cache.get(umkm_id)
+    if cached is not None:
+        return cached
+
+    version = catalog_cache.version(umkm_id)
+    if db is None:
+        with SessionLocal() as session:
+            rows = get_product_list(umkm_id, session)
+    else:
+        rows = get_product_list(umkm_id, db)
+    products = [Product(**row) for row in rows]
+    catalog_cache.put(umkm_id, products, version)
+    return products
+
+
+async def fetch_product_list(umkm_id: int) -> List[Product]:
+    """
+    Fetch the active product list without blocking the event loop: on the
+    async engine when it is enabled, otherwise on the bounded executor.
+    """
+    with stage_timer("catalog"):
+        if not settings.DB_ASYNC_ENABLED:
+            return await run_blocking(get_catalog, umkm_id)
+
+        version = await catalog_cache.aversion(umkm_id)
+        cached = catalog_cache.lookup(umkm_id, version)
+        if cached is not None:
+            return cached
+        async with AsyncSessionLocal() as db:
+            rows = await aget_product_list(umkm_id, db)
+        products = [Product(**row) for row in rows]
+        catalog_cache.put(umkm_id, products, version)
+        return products
+
+
+def prepare_transcript_service(data: PrepareTranscriptRequest, db: Session):
+    products = get_catalog(data.umkm_id, db)
 
     return {
         "umkm_id": data.umkm_id,
@@ -0,0 +1,121 @@
+"""
+Noisy neighbour benchmark for per-UMKM admission control.
+
+One UMKM bulk-imports a pile of voice notes while a few other UMKMs send
+interactive generate-draft requests. The upstream quota is simulated with
+a FIFO cap of --quota concurrent Speech calls. Runs with admission control
+off (everyone queues FIFO behind the bulk import) and on (fair queuing and
+per-UMKM rates, ADMISSION_*_CONCURRENCY set to the quota), and prints the
+latency the quiet UMKMs saw and how long the import took.
+
+    python benchmark/bench_admission.py --clips 400 --quiet-umkms 5 --quota 16
+"""
+import argparse
+import asyncio
+import time
+
+from fakes import Latency, install
+
+NOISY_UMKM_ID = 1
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args, enabled: bool, speech_to_text_async) -> dict:
+    import services.draft as draft
+    from core.admission import admission
+    from services.draft import generate_draft_from_audio, DraftPipelineError
+
+    # The provider's quota: calls beyond it wait in line, first come first served
+    quota = asyncio.Semaphore(args.quota)
+
+    async def capped_speech(audio_bytes):
+        async with quota:
+            return await speech_to_text_async(audio_bytes)
+
+    draft.speech_to_text_async = capped_speech
+    admission.enabled = enabled
+    limits = {"speech": asyncio.Semaphore(args.bulk_concurrency), "openai": asyncio.Semaphore(args.bulk_concurrency)}
+    done = asyncio.Event()
+
+    async def bulk_import():
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.bulk_concurrency)
+
+        async def one(i):
+            async with semaphore:
+                clip = b"noisy" + i.to_bytes(4, "big")
+                await generate_draft_from_audio(clip, NOISY_UMKM_ID, limits=limits)
+
+        await asyncio.gather(*(one(i) for i in range(args.clips)))
+        return time.perf_counter() - start
+
+    latencies, statuses = [], {}
+
+    async def quiet_umkm(umkm_id: int):
+        n = 0
+        while not done.is_set():
+            n += 1
+            clip = b"quiet" + umkm_id.to_bytes(4, "big") + n.to_bytes(4, "big")
+            start = time.perf_counter()
+            try:
+                await generate_draft_from_audio(clip, umkm_id)
+                status = 200
+            except DraftPipelineError as e:
+                status = e.status_code
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.quiet_interval_ms / 1000)
+
+    quiet = [asyncio.create_task(quiet_umkm(NOISY_UMKM_ID + 1 + n)) for n in range(args.quiet_umkms)]
+    bulk_seconds = await bulk_import()
+    done.set()
+    await asyncio.gather(*quiet)
+    return {"bulk_seconds": bulk_seconds, "latencies": latencies, "statuses": statuses}
+
+
+def main(args):
+    install(
+        speech_latency=Latency(args.speech_ms),
+        llm_latency=Latency(args.llm_ms),
+        db_latency=Latency(2),
+        env={
+            "ADMISSION_SPEECH_CONCURRENCY": str(args.quota),
+            "ADMISSION_LLM_CONCURRENCY": str(args.quota),
+            "ADMISSION_SPEECH_PER_MINUTE": str(args.speech_rpm),
+            "ADMISSION_SPEECH_BURST": str(args.bulk_concurrency),
+            "ADMISSION_LLM_PER_MINUTE": str(args.speech_rpm),
+            "ADMISSION_LLM_BURST": str(args.bulk_concurrency),
+        },
+    )
+    from services.speech import speech_to_text_async
+
+    print(f"{args.clips} clips bulk-imported by UMKM {NOISY_UMKM_ID}, {args.quiet_umkms} other UMKMs drafting, "
+          f"quota {args.quota} concurrent Speech calls\n")
+    print(f"{'admission':>10}{'import s':>10}{'quiet p50 ms':>14}{'quiet p99 ms':>14}{'quiet ok':>10}{'429':>6}")
+    for enabled in (False, True):
+        result = asyncio.run(run(args, enabled, speech_to_text_async))
+        statuses = result["statuses"]
+        print(f"{'on' if enabled else 'off':>10}{result['bulk_seconds']:>10.1f}"
+              f"{percentile(result['latencies'], 50) * 1000:>14.0f}{percentile(result['latencies'], 99) * 1000:>14.0f}"
+              f"{statuses.get(200, 0):>10}{statuses.get(429, 0):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=400)
+    parser.add_argument("--bulk-concurrency", type=int, default=64)
+    parser.add_argument("--quiet-umkms", type=int, default=5)
+    parser.add_argument("--quiet-interval-ms", type=float, default=200)
+    parser.add_argument("--quota", type=int, default=16)
+    parser.add_argument("--speech-rpm", type=float, default=3000, help="per-UMKM Speech and LLM rate when admission is on")
+    parser.add_argument("--speech-ms", type=float, default=300)
+    parser.add_argument("--llm-ms", type=float, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""
+Audio preprocessing benchmark.
+
+Synthesizes WAV clips the way phones tend to record them (48 kHz stereo,
+16-bit, with silence before and after the utterance and some background
+noise), runs them through services.audio.preprocess_audio and reports:
+  * bytes and seconds received vs sent to Speech-to-Text
+  * preprocessing latency per clip (p50/p95)
+
+Billing is per second of audio sent, so "seconds sent" is the cost figure.
+Pass real recordings with --file to measure those instead (WebM/Ogg need
+ffmpeg on PATH, otherwise they are passed through unchanged).
+
+    python benchmark/bench_audio.py --clips 50 --speech-seconds 4 --silence-seconds 1.5
+"""
+import argparse
+import io
+import statistics
+import time
+import wave
+
+import numpy as np
+
+from fakes import configure
+
+
+def synth_clip(rng, rate, speech_seconds, silence_seconds, channels=2):
+    """
+    Silence + a few hundred ms "syllables" of harmonics + silence, with
+    -60 dBFS noise throughout.
+    """
+    speech = np.zeros(int(speech_seconds * rate), dtype=np.float32)
+    t = np.arange(len(speech)) / rate
+    for start in np.arange(0, speech_seconds - 0.3, 0.35):
+        pitch = rng.uniform(110, 240)
+        mask = (t >= start) & (t < start + 0.25)
+        speech[mask] += 0.3 * np.sin(2 * np.pi * pitch * t[mask]) + 0.1 * np.sin(6 * np.pi * pitch * t[mask])
+    pad = np.zeros(int(silence_seconds * rate), dtype=np.float32)
+    mono = np.concatenate([pad, speech, pad])
+    mono += rng.normal(0, 0.001, len(mono)).astype(np.float32)
+    frames = np.repeat(mono[:, None], channels, axis=1)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes((np.clip(frames, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def main(args):
+    configure()
+    from services.audio import preprocess_audio
+
+    rng = np.random.default_rng(args.seed)
+    if args.file:
+        clips = [open(path, "rb").read() for path in args.file]
+    else:
+        clips = [
+            synth_clip(rng, args.rate, args.speech_seconds, args.silence_seconds)
+            for _ in range(args.clips)
+        ]
+
+    bytes_in = bytes_out = 0
+    seconds_in = seconds_out = 0.0
+    latencies = []
+    for clip in clips:
+        start = time.perf_counter()
+        prepared = preprocess_audio(clip)
+        latencies.append(time.perf_counter() - start)
+        bytes_in += len(clip)
+        bytes_out += len(prepared.content)
+        if prepared.duration_seconds is not None and not args.file:
+            seconds_in += args.speech_seconds + 2 * args.silence_seconds
+            seconds_out += prepared.duration_seconds
+
+    latencies.sort()
+    print(f"clips: {len(clips)}  encoding sent: {prepared.encoding} @ {prepared.sample_rate_hertz} Hz")
+    print(f"bytes: {bytes_in} -> {bytes_out} ({100 * (1 - bytes_out / bytes_in):.1f}% saved)")
+    if seconds_in:
+        print(f"seconds: {seconds_in:.1f} -> {seconds_out:.1f} ({100 * (1 - seconds_out / seconds_in):.1f}% saved)")
+    print(
+        f"latency ms: p50={1000 * statistics.median(latencies):.2f} "
+        f"p95={1000 * latencies[int(0.95 * (len(latencies) - 1))]:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=50)
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--speech-seconds", type=float, default=4.0)
+    parser.add_argument("--silence-seconds", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", nargs="*", help="real recordings to measure instead of synthetic clips")
+    main(parser.parse_args())
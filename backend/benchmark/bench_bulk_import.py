@@ -0,0 +1,70 @@
+"""
+Bulk import write path: N transactions confirmed one by one through
+create_transaction_from_llm (what an offline sync does today, one confirm
+per transaction) vs create_transactions_bulk in batches. Needs a Postgres
+(see pg.py).
+
+    python benchmark/bench_bulk_import.py --transactions 500 --items 3 --batch-size 200
+"""
+import argparse
+import random
+import time
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9003
+
+
+def main(args):
+    configure()
+    from db.db import get_engine, SessionLocal
+    from db.maintenance import ensure_schema
+    from schemas.schemas import TransactionFromLLM
+    from services.transaction import create_transaction_from_llm, create_transactions_bulk
+    from pg import QueryCounter, apply_schema, seed_products
+
+    engine = get_engine()
+
+    apply_schema(engine)
+    ensure_schema()
+    product_ids = seed_products(engine, BENCH_UMKM_ID, 50)
+    rng = random.Random(args.seed)
+    payloads = [
+        TransactionFromLLM(
+            umkm_id=BENCH_UMKM_ID,
+            transaction_type="sale",
+            transcript="bench",
+            items=[
+                {"product_id": pid, "quantity": rng.randint(1, 3), "unit_price": 1000}
+                for pid in rng.sample(product_ids, args.items)
+            ],
+        )
+        for _ in range(args.transactions)
+    ]
+
+    def sequential():
+        for payload in payloads:
+            with SessionLocal() as db:
+                create_transaction_from_llm(payload, db)
+
+    def bulk():
+        for start in range(0, len(payloads), args.batch_size):
+            with SessionLocal() as db:
+                create_transactions_bulk(BENCH_UMKM_ID, [(p, None) for p in payloads[start:start + args.batch_size]], db)
+
+    print(f"{'mode':>11}{'stmts':>8}{'total s':>9}{'tx/s':>9}")
+    for mode, run in (("sequential", sequential), ("bulk", bulk)):
+        with QueryCounter(engine) as counter:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        print(f"{mode:>11}{counter.count:>8}{elapsed:>9.2f}{len(payloads) / elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=500)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
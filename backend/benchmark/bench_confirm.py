@@ -0,0 +1,76 @@
+"""
+Confirm latency vs item count, old per-item statements vs the batched
+create_transaction_from_llm. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_confirm.py --items 1 5 20 50 --repeat 30
+"""
+import argparse
+import statistics
+import time
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9001
+
+
+def legacy_create_sale(payload, db):
+    from sqlalchemy import text
+
+    total_amount = sum(i.quantity * i.unit_price for i in payload.items)
+    sale_id = db.execute(text("""
+        INSERT INTO sales (umkm_id, customer_name, total_amount, transcript, status)
+        VALUES (:umkm_id, 'Auto (LLM)', :total_amount, :transcript, 'selesai')
+        RETURNING sale_id
+    """), {"umkm_id": payload.umkm_id, "total_amount": total_amount, "transcript": payload.transcript}).fetchone()[0]
+    for item in payload.items:
+        db.execute(text("""
+            INSERT INTO sales_items (sale_id, product_id, quantity, unit_price)
+            VALUES (:sale_id, :product_id, :quantity, :unit_price)
+        """), {"sale_id": sale_id, "product_id": item.product_id, "quantity": item.quantity, "unit_price": item.unit_price})
+        db.execute(text("""
+            UPDATE products SET stock = stock - :qty
+            WHERE product_id = :pid AND stock >= :qty
+        """), {"qty": item.quantity, "pid": item.product_id})
+    db.commit()
+    return sale_id
+
+
+def main(args):
+    configure()
+    from db.db import get_engine, SessionLocal
+    from schemas.schemas import TransactionFromLLM
+    from services.transaction import create_transaction_from_llm
+    from pg import QueryCounter, apply_schema, seed_products
+
+    engine = get_engine()
+
+    apply_schema(engine)
+    product_ids = seed_products(engine, BENCH_UMKM_ID, max(args.items))
+
+    print(f"{'items':>6}{'mode':>9}{'stmts':>7}{'p50 ms':>9}{'p99 ms':>9}")
+    for n in args.items:
+        payload = TransactionFromLLM(
+            umkm_id=BENCH_UMKM_ID,
+            transaction_type="sale",
+            transcript="bench",
+            items=[{"product_id": pid, "quantity": 1, "unit_price": 1000} for pid in product_ids[:n]],
+        )
+        for mode, create in (("legacy", legacy_create_sale), ("batched", create_transaction_from_llm)):
+            latencies = []
+            with QueryCounter(engine) as counter:
+                for _ in range(args.repeat):
+                    with SessionLocal() as db:
+                        start = time.perf_counter()
+                        create(payload, db)
+                        latencies.append(time.perf_counter() - start)
+            statements = counter.count / args.repeat
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            print(f"{n:>6}{mode:>9}{statements:>7.0f}{statistics.median(latencies) * 1000:>9.2f}{p99 * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    parser.add_argument("--repeat", type=int, default=30)
+    main(parser.parse_args())
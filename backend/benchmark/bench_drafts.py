@@ -0,0 +1,82 @@
+"""
+Confirm by draft id (services/draft_store.py) vs posting the whole draft
+back to /confirm: request body size and confirm latency per item count.
+"edit" confirms with one quantity change and one product added from the
+catalog. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_drafts.py --items 1 5 20 --repeat 30
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9006
+TRANSCRIPT = "jual " + ", ".join(f"produk nomor {n} dua bungkus" for n in range(20))
+
+
+def main(args):
+    configure()
+    from db.db import get_engine, SessionLocal
+    from schemas.schemas import DraftConfirmRequest, DraftItemEdit, TransactionFromLLM
+    from services.transaction import create_transaction_from_llm
+    from services.transcript import get_catalog
+    from services.draft_store import draft_store
+    from pg import apply_schema, seed_products
+
+    engine = get_engine()
+    apply_schema(engine)
+    product_ids = seed_products(engine, BENCH_UMKM_ID, max(args.items) + 1)
+    catalog = get_catalog(BENCH_UMKM_ID)
+
+    print(f"{'items':>6}{'mode':>8}{'body B':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for n in args.items:
+        payload = TransactionFromLLM(
+            umkm_id=BENCH_UMKM_ID,
+            transaction_type="sale",
+            transcript=TRANSCRIPT,
+            items=[{"product_id": pid, "name": f"produk {pid}", "quantity": 1, "unit_price": 1000} for pid in product_ids[:n]],
+        )
+        result = {"draft_transaction": payload, "transcript": TRANSCRIPT, "parsed_by": "llm"}
+        edits = [
+            DraftItemEdit(product_id=product_ids[0], quantity=2),
+            DraftItemEdit(product_id=product_ids[n], quantity=1),
+        ]
+
+        def legacy(db):
+            create_transaction_from_llm(payload, db)
+
+        def by_id(db, edits):
+            draft = asyncio.run(draft_store.save(BENCH_UMKM_ID, result, catalog=catalog))
+            # Only the confirm itself is timed, not storing the draft
+            start = time.perf_counter()
+            draft_store.confirm(draft["draft_id"], BENCH_UMKM_ID, edits, db)
+            return time.perf_counter() - start
+
+        modes = (
+            ("legacy", len(payload.model_dump_json()), legacy),
+            ("draft", len(DraftConfirmRequest(umkm_id=BENCH_UMKM_ID).model_dump_json()), lambda db: by_id(db, [])),
+            ("edit", len(DraftConfirmRequest(umkm_id=BENCH_UMKM_ID, edits=edits).model_dump_json()),
+             lambda db: by_id(db, edits)),
+        )
+        for mode, body_bytes, run in modes:
+            latencies = []
+            for _ in range(args.repeat):
+                with SessionLocal() as db:
+                    start = time.perf_counter()
+                    elapsed = run(db)
+                    latencies.append(elapsed if elapsed is not None else time.perf_counter() - start)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            print(f"{n:>6}{mode:>8}{body_bytes:>9}{statistics.median(latencies) * 1000:>9.2f}{p99 * 1000:>9.2f}")
+
+    print(f"\ndraft store: {draft_store.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=30)
+    main(parser.parse_args())
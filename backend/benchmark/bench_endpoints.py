@@ -0,0 +1,476 @@
+"""
+Load test for every route in api/v1/endpoints.py, without paying Google or
+OpenAI.
+
+The whole app (main.py, middleware and lifespan included) runs under
+uvicorn in this process with the fake Speech clients from fakes.py and
+either the in-process FakeChain or, with --llm-url, the real OpenAI client
+pointed at fake_llm_server.py. Postgres is real (see pg.py) and seeded for
+one UMKM with products, sales and purchases at production-like volumes.
+
+Each scenario drives one route with --concurrency clients for --requests
+requests and reports throughput, latency percentiles, errors and DB
+queries per request (read from the app's own /metrics). --output writes the
+numbers as JSON tagged with the git commit; --compare diffs a run against
+such a file and exits 1 when a route regressed by more than --tolerance.
+
+    python benchmark/bench_endpoints.py --output before.json
+    git checkout my-branch
+    python benchmark/bench_endpoints.py --compare before.json
+    python benchmark/bench_endpoints.py --only confirm transactions export
+
+WebSocket scenarios need the `websockets` package and are skipped without it.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import socket
+import subprocess
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from fakes import FakeStreamingSpeechClient, Latency, install
+
+BENCH_UMKM_ID = 9003
+API = "/api/v1"
+AUDIO = b"\x1a\x45\xdf\xa3" + b"\0" * 16_000
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def clip(i: int) -> bytes:
+    # unique bytes per upload, otherwise drafts and jobs are deduplicated
+    return AUDIO + i.to_bytes(4, "big") + random.getrandbits(32).to_bytes(4, "big")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+# -- seeding ---------------------------------------------------------------
+
+def seed(args) -> list:
+    from db.db import get_engine
+    from db.maintenance import ensure_schema, rebuild_rollup
+    from pg import apply_schema, seed_products, seed_sales, seed_purchases, sales_count, purchases_count
+
+    engine = get_engine()
+    apply_schema(engine)
+    ensure_schema()
+    product_ids = seed_products(engine, BENCH_UMKM_ID, args.products)
+    sales = sales_count(engine, BENCH_UMKM_ID)
+    if sales < args.sales:
+        seed_sales(engine, BENCH_UMKM_ID, args.sales - sales, args.days, product_ids)
+        rebuild_rollup(BENCH_UMKM_ID)
+    purchases = purchases_count(engine, BENCH_UMKM_ID)
+    if purchases < args.purchases:
+        seed_purchases(engine, BENCH_UMKM_ID, args.purchases - purchases, args.days, product_ids)
+    return product_ids
+
+
+# -- server ----------------------------------------------------------------
+
+def start_server():
+    """
+    Serve main.app on a free local port from a background thread.
+    """
+    import uvicorn
+    from main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("uvicorn failed to start")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+METRIC_LINE = re.compile(r'^http_request_db_queries_(sum|count)\{route="([^"]*)"\} ([0-9.e+-]+)$')
+
+
+async def query_totals(client) -> dict:
+    """
+    {route: [queries, requests]} from the app's /metrics.
+    """
+    totals = {}
+    response = await client.get("/metrics")
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            kind, route, value = match.groups()
+            totals.setdefault(route, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+# -- scenarios -------------------------------------------------------------
+
+class Scenario:
+    """
+    `send(client, i)` performs one request (or one whole streaming
+    exchange) and returns the HTTP status, or 101 for a WebSocket that ran
+    to completion. `route` is the route template as labelled in /metrics.
+    """
+    def __init__(self, name, route, send, websocket=False):
+        self.name = name
+        self.route = route
+        self.send = send
+        self.websocket = websocket
+
+
+async def read_sse(response, until_event: str = None):
+    """
+    Consume a text/event-stream, stopping at the first `until_event` (or
+    at the end of the stream).
+    """
+    async for line in response.aiter_lines():
+        if until_event and line == f"event: {until_event}":
+            return
+
+
+def build_scenarios(args, product_ids, ws_base: str):
+    umkm = {"umkm_id": BENCH_UMKM_ID}
+    today = date.today()
+
+    def upload(i):
+        return {"audio": ("clip.webm", clip(i), "audio/webm")}
+
+    def confirm_payload():
+        items = [
+            {"product_id": pid, "quantity": random.randint(1, 3), "unit_price": 1000}
+            for pid in random.sample(product_ids, k=min(len(product_ids), random.randint(1, 3)))
+        ]
+        return {"umkm_id": BENCH_UMKM_ID, "transaction_type": "sale", "transcript": "bench", "items": items}
+
+    async def speech_to_text(client, i):
+        return (await client.post(f"{API}/speech/speech-to-text", files=upload(i))).status_code
+
+    async def generate_draft(client, i):
+        return (await client.post(f"{API}/transactions/generate-draft", params=umkm, files=upload(i))).status_code
+
+    async def submit_job(client, i):
+        response = await client.post(f"{API}/transactions/jobs", params=umkm, files=upload(i))
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    async def job_submit(client, i):
+        return (await client.post(f"{API}/transactions/jobs", params=umkm, files=upload(i))).status_code
+
+    async def job_status(client, i):
+        job_id = job_ids[i % len(job_ids)]
+        return (await client.get(f"{API}/transactions/jobs/{job_id}")).status_code
+
+    async def job_events(client, i):
+        # submit-to-finished latency as seen by an SSE client
+        job_id = await submit_job(client, i)
+        async with client.stream("GET", f"{API}/transactions/jobs/{job_id}/events") as response:
+            await read_sse(response)
+            return response.status_code
+
+    async def confirm(client, i):
+        return (await client.post(f"{API}/transactions/confirm", json=confirm_payload())).status_code
+
+    async def bulk_import(client, i):
+        rows = ["ref,transaction_type,product_id,product_name,quantity,unit_price,date"]
+        for n in range(args.bulk_rows):
+            rows.append(f"b{i}-{n},sale,{random.choice(product_ids)},,{random.randint(1, 3)},1000,{today}")
+        files = {"csv_file": ("sales.csv", "\n".join(rows).encode(), "text/csv")}
+        async with client.stream("POST", f"{API}/transactions/bulk-import", params=umkm, files=files) as response:
+            async for _ in response.aiter_lines():
+                pass
+            return response.status_code
+
+    async def monthly_transaction(client, i):
+        days_back = random.randint(0, args.days)
+        month = today - timedelta(days=days_back)
+        params = {**umkm, "year": month.year, "month": month.month}
+        return (await client.get(f"{API}/reports/monthly_transaction", params=params)).status_code
+
+    async def transaction_summary(client, i):
+        return (await client.get(f"{API}/reports/transaction_summary", params=umkm)).status_code
+
+    async def last_transaction(client, i):
+        return (await client.get(f"{API}/reports/last_transaction", params=umkm)).status_code
+
+    async def transactions(client, i):
+        # first page plus --history-depth pages followed by cursor, every
+        # other request filtered on a product
+        params = {**umkm, "limit": 20}
+        if i % 2:
+            params["product_id"] = random.choice(product_ids)
+        status = 200
+        for _ in range(1 + args.history_depth):
+            response = await client.get(f"{API}/reports/transactions", params=params)
+            status = response.status_code
+            cursor = response.json().get("next_cursor") if status == 200 else None
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        return status
+
+    async def export(client, i):
+        start = today - timedelta(days=random.randint(30, args.days))
+        params = {**umkm, "start_date": start, "end_date": today,
+                  "group_by": random.choice(("day", "product", "sale")), "gzip": bool(i % 2)}
+        async with client.stream("GET", f"{API}/reports/export", params=params) as response:
+            async for _ in response.aiter_bytes():
+                pass
+            return response.status_code
+
+    async def live(client, i):
+        # time to first snapshot for a dashboard opening
+        async with client.stream("GET", f"{API}/reports/live", params=umkm) as response:
+            await read_sse(response, until_event="snapshot")
+            return response.status_code
+
+    def system(path):
+        async def send(client, i):
+            return (await client.get(f"{API}/system/{path}")).status_code
+        return send
+
+    async def ws_speech(client, i):
+        import websockets
+
+        async with websockets.connect(f"{ws_base}{API}/speech/ws/speech-to-text") as ws:
+            for _ in range(args.ws_chunks):
+                await ws.send(b"\0" * 3200)
+            await ws.send("EOS")
+            async for _ in ws:
+                pass
+        return 101
+
+    async def ws_job(client, i):
+        import websockets
+
+        job_id = await submit_job(client, i)
+        async with websockets.connect(f"{ws_base}{API}/transactions/ws/jobs/{job_id}") as ws:
+            async for _ in ws:
+                pass
+        return 101
+
+    async def ws_live(client, i):
+        import websockets
+
+        async with websockets.connect(f"{ws_base}{API}/reports/ws/live?umkm_id={BENCH_UMKM_ID}") as ws:
+            await ws.recv()
+        return 101
+
+    job_ids = []
+
+    async def prepare_jobs(client):
+        job_ids.extend([await submit_job(client, 1_000_000 + n) for n in range(20)])
+
+    scenarios = [
+        Scenario("speech_to_text", "/api/v1/speech/speech-to-text", speech_to_text),
+        Scenario("ws_speech_to_text", None, ws_speech, websocket=True),
+        Scenario("generate_draft", "/api/v1/transactions/generate-draft", generate_draft),
+        Scenario("job_submit", "/api/v1/transactions/jobs", job_submit),
+        Scenario("job_status", "/api/v1/transactions/jobs/{job_id}", job_status),
+        Scenario("job_events", "/api/v1/transactions/jobs/{job_id}/events", job_events),
+        Scenario("ws_job", None, ws_job, websocket=True),
+        Scenario("confirm", "/api/v1/transactions/confirm", confirm),
+        Scenario("bulk_import", "/api/v1/transactions/bulk-import", bulk_import),
+        Scenario("monthly_transaction", "/api/v1/reports/monthly_transaction", monthly_transaction),
+        Scenario("transaction_summary", "/api/v1/reports/transaction_summary", transaction_summary),
+        Scenario("last_transaction", "/api/v1/reports/last_transaction", last_transaction),
+        Scenario("transactions", "/api/v1/reports/transactions", transactions),
+        Scenario("export", "/api/v1/reports/export", export),
+        Scenario("live", "/api/v1/reports/live", live),
+        Scenario("ws_live", None, ws_live, websocket=True),
+    ]
+    return scenarios, system, prepare_jobs
+
+
+async def run_scenario(client, scenario, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status = await scenario.send(client, i)
+            except Exception:
+                status = None
+            latencies.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                errors += 1
+
+    before = await query_totals(client)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    after = await query_totals(client)
+
+    queries = None
+    if scenario.route is not None:
+        sum_after, count_after = after.get(scenario.route, (0.0, 0.0))
+        sum_before, count_before = before.get(scenario.route, (0.0, 0.0))
+        if count_after > count_before:
+            queries = (sum_after - sum_before) / (count_after - count_before)
+
+    return {
+        "requests": requests,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "errors": errors,
+        "queries_per_request": queries,
+    }
+
+
+# -- reporting -------------------------------------------------------------
+
+def print_table(results: dict):
+    print(f"\n{'endpoint':<22}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'errors':>8}{'queries':>9}")
+    for name, r in results.items():
+        queries = "-" if r["queries_per_request"] is None else f"{r['queries_per_request']:.1f}"
+        print(f"{name:<22}{r['throughput']:>9.1f}{r['p50_ms']:>9.0f}{r['p90_ms']:>9.0f}{r['p99_ms']:>9.0f}"
+              f"{r['errors']:>8}{queries:>9}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print throughput/p99/query deltas against `baseline` and return True
+    if any endpoint got worse by more than `tolerance` (a fraction).
+    """
+    print(f"\nvs {baseline['commit']}  ({'endpoint':<20} throughput, p99, queries/request)")
+    regressed = False
+    for name, r in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        notes = []
+        if r["throughput"] < old["throughput"] * (1 - tolerance):
+            notes.append("throughput")
+        if r["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            notes.append("p99")
+        if (r["queries_per_request"] or 0) > (old["queries_per_request"] or 0) + 0.5:
+            notes.append("queries")
+        regressed |= bool(notes)
+
+        def delta(new, before):
+            return f"{(new - before) / before * 100:+6.1f}%" if before else "     -"
+
+        old_q, new_q = old["queries_per_request"], r["queries_per_request"]
+        queries = "-" if old_q is None or new_q is None else f"{old_q:.1f} -> {new_q:.1f}"
+        print(f"{name:<22}{delta(r['throughput'], old['throughput']):>9}{delta(r['p99_ms'], old['p99_ms']):>9}"
+              f"  {queries:<14}{'REGRESSED: ' + ', '.join(notes) if notes else ''}")
+    return regressed
+
+
+async def main(args):
+    install(
+        speech_latency=Latency(args.stt_ms, tail_ms=args.stt_tail_ms, tail_ratio=args.tail_ratio),
+        llm_latency=None if args.llm_url else Latency(args.llm_ms, tail_ms=args.llm_tail_ms, tail_ratio=args.tail_ratio),
+        # products come from the seeded database
+        db_latency=None,
+        env={
+            "OPENAI_BASE_URL": args.llm_url or "",
+            # uploads are not real audio, hand them to the fake client as-is
+            "AUDIO_PREPROCESS_ENABLED": "false",
+            # every clip yields the same transcript; measure the LLM path, not the cache
+            "TRANSCRIPT_CACHE_TTL_SECONDS": "0",
+        },
+    )
+    import httpx
+    from helper.gcp import get_speech_async_client
+
+    random.seed(args.seed)
+    product_ids = seed(args)
+    streaming = FakeStreamingSpeechClient(Latency(args.stt_chunk_ms))
+    get_speech_async_client().streaming_recognize = streaming.streaming_recognize
+
+    server, thread, base_url = start_server()
+    try:
+        import websockets  # noqa: F401
+        has_websockets = True
+    except ImportError:
+        has_websockets = False
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        scenarios, system, prepare_jobs = build_scenarios(args, product_ids, base_url.replace("http", "ws", 1))
+        for path in ("cache", "db-pool", "upstreams"):
+            scenarios.append(Scenario(f"system_{path.replace('-', '_')}", f"/api/v1/system/{path}", system(path)))
+        for scenario in scenarios:
+            if args.only and scenario.name not in args.only:
+                continue
+            if scenario.websocket and not has_websockets:
+                print(f"skipping {scenario.name}: `websockets` is not installed")
+                continue
+            if scenario.name == "job_status":
+                await prepare_jobs(client)
+            requests = args.requests if not scenario.name.startswith(("live", "ws_live")) else min(args.requests, 50)
+            print(f"running {scenario.name} ...", flush=True)
+            results[scenario.name] = await run_scenario(client, scenario, requests, args.concurrency)
+
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    print_table(results)
+    report = {
+        "commit": git_commit(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nwrote {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="scenario names to run (default: all)")
+    # upstream latency distributions, in ms
+    parser.add_argument("--stt-ms", type=float, default=400)
+    parser.add_argument("--stt-tail-ms", type=float, default=1500)
+    parser.add_argument("--stt-chunk-ms", type=float, default=20, help="per streamed chunk")
+    parser.add_argument("--llm-ms", type=float, default=800)
+    parser.add_argument("--llm-tail-ms", type=float, default=3000)
+    parser.add_argument("--tail-ratio", type=float, default=0.02, help="share of upstream calls hitting the tail")
+    parser.add_argument("--llm-url", help="OpenAI-compatible base URL, e.g. fake_llm_server.py's http://127.0.0.1:8100/v1")
+    # seeded data
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--sales", type=int, default=300_000)
+    parser.add_argument("--purchases", type=int, default=30_000)
+    parser.add_argument("--days", type=int, default=730)
+    # scenario shape
+    parser.add_argument("--bulk-rows", type=int, default=200, help="CSV rows per bulk import")
+    parser.add_argument("--history-depth", type=int, default=5, help="extra pages followed per history request")
+    parser.add_argument("--ws-chunks", type=int, default=25, help="audio chunks per streaming session")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    # comparison across commits
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier --output run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+"""
+Report export memory and throughput: fetchall() + one in-memory CSV (what a
+naive export does) vs the streamed export_stream, then the same export again
+from cache. Peak Python memory is measured with tracemalloc. Reuses the
+sales seeded by bench_reports.py. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_export.py --group-by sale --days 365
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9002
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main(args):
+    configure()
+    from sqlalchemy import text
+    from db.db import get_engine
+    from db.maintenance import ensure_schema
+    from services.export import EXPORTS, export_stream
+
+    engine = get_engine()
+
+    ensure_schema()
+    end_date = date.today()
+    start_date = end_date - timedelta(days=args.days)
+    columns, query = EXPORTS[args.group_by]
+
+    def buffered():
+        with engine.connect() as conn:
+            rows = conn.execute(text(query), {
+                "umkm_id": BENCH_UMKM_ID, "start_date": start_date, "end_date": end_date + timedelta(days=1),
+            }).fetchall()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        return len(buffer.getvalue().encode())
+
+    def streamed():
+        return sum(len(chunk) for chunk in export_stream(
+            BENCH_UMKM_ID, args.group_by, start_date, end_date, args.format, args.gzip, data_version="bench"))
+
+    print(f"{'mode':>10}{'bytes':>12}{'seconds':>9}{'peak MB':>9}")
+    for mode, run in (("buffered", buffered), ("streamed", streamed), ("cached", streamed)):
+        size, elapsed, peak = measure(run)
+        print(f"{mode:>10}{size:>12}{elapsed:>9.2f}{peak / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--group-by", default="sale")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--format", default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    main(parser.parse_args())
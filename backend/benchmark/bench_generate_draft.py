@@ -0,0 +1,133 @@
+"""
+Load benchmark for POST /transactions/generate-draft.
+
+Runs the same burst of concurrent uploads against:
+  * legacy: the old handler, which called STT, the products query and the
+    LLM synchronously on the event loop, one after another
+  * async:  the current handler (async STT + LLM, products fetched on the
+    bounded executor concurrently with STT)
+
+While the burst is in flight a cheap probe endpoint is polled, standing in
+for the dashboard report routes that share the worker.
+
+    python benchmark/bench_generate_draft.py --concurrency 50 --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fakes import Latency, install
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_app():
+    from fastapi import FastAPI, File, UploadFile
+    from api.v1 import transactions
+    from schemas.schemas import PrepareTranscriptRequest, ParseTranscriptRequest
+    from services.speech import speech_to_text
+    from services.transcript import prepare_transcript_service
+    from services.llm import parse_transcript_with_llm
+
+    app = FastAPI()
+    app.include_router(transactions.router, prefix="/transactions")
+
+    @app.post("/legacy/generate-draft")
+    async def legacy_generate_draft(audio: UploadFile = File(...), umkm_id: int = 1):
+        audio_bytes = await audio.read()
+        transcript = speech_to_text(audio_bytes)
+        prep = prepare_transcript_service(PrepareTranscriptRequest(umkm_id=umkm_id, transcript=transcript), None)
+        parsed = parse_transcript_with_llm(ParseTranscriptRequest(**prep))
+        return {"draft_transaction": parsed, "transcript": transcript}
+
+    @app.get("/probe")
+    async def probe():
+        return {"ok": True}
+
+    return app
+
+
+async def run_load(client, path, total, concurrency, audio):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        # unique bytes per upload, otherwise generate-draft deduplicates them
+        clip = audio + i.to_bytes(4, "big")
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, files={"audio": ("clip.webm", clip, "audio/webm")})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/probe")
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.05)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+
+    return {
+        "throughput": total / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.mean(latencies),
+        "probe_p99": percentile(probe_latencies, 99),
+        "errors": errors,
+    }
+
+
+async def main(args):
+    install(
+        speech_latency=Latency(args.stt_ms),
+        llm_latency=Latency(args.llm_ms),
+        db_latency=Latency(args.db_ms),
+        # measure the full STT + LLM path: no matcher shortcut, no result cache
+        env={"MATCHER_BYPASS_LLM": "false", "TRANSCRIPT_CACHE_TTL_SECONDS": "0",
+             # the uploads are not real audio, send them to the fake client as-is
+             "AUDIO_PREPROCESS_ENABLED": "false"},
+    )
+    import httpx
+
+    app = build_app()
+    audio = b"\x1a\x45\xdf\xa3" + b"\0" * args.audio_bytes
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'probe p99':>12}{'errors':>8}")
+        for mode, path in (("legacy", "/legacy/generate-draft"), ("async", "/transactions/generate-draft")):
+            stats = await run_load(client, path, args.requests, args.concurrency, audio)
+            print(
+                f"{mode:<8}{stats['throughput']:>10.1f}{stats['p50'] * 1000:>10.0f}"
+                f"{stats['p99'] * 1000:>10.0f}{stats['probe_p99'] * 1000:>12.0f}{stats['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stt-ms", type=float, default=400)
+    parser.add_argument("--llm-ms", type=float, default=800)
+    parser.add_argument("--db-ms", type=float, default=5)
+    parser.add_argument("--audio-bytes", type=int, default=64_000)
+    asyncio.run(main(parser.parse_args()))
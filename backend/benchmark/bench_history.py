@@ -0,0 +1,61 @@
+"""
+Transaction history page latency by scroll depth: keyset cursor (what
+/reports/transactions does) vs the equivalent OFFSET query. Reuses the
+sales seeded by bench_reports.py. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_history.py --pages 1 10 100 1000 --page-size 20
+"""
+import argparse
+import time
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9002
+
+OFFSET_QUERY = """
+    SELECT s.sale_id, s.sale_date, s.status, s.total_amount,
+           (SELECT json_agg(si.*) FROM sales_items si WHERE si.sale_id = s.sale_id) AS items
+    FROM sales s
+    WHERE s.umkm_id = :umkm_id
+    ORDER BY s.sale_date DESC, s.sale_id DESC
+    OFFSET :offset LIMIT :limit
+"""
+
+
+def main(args):
+    configure()
+    from sqlalchemy import text
+    from db.db import SessionLocal
+    from db.maintenance import ensure_schema
+    from api.v1.reports import _fetch_sales_page
+
+    ensure_schema()
+    print(f"{'page':>6}{'keyset ms':>12}{'offset ms':>12}")
+    with SessionLocal() as db:
+        cursor = None
+        page = 0
+        for target in sorted(args.pages):
+            # walk the cursor forward to the target page
+            while page < target - 1:
+                _, cursor = _fetch_sales_page(db, BENCH_UMKM_ID, args.page_size, cursor)
+                page += 1
+                if cursor is None:
+                    print("ran out of seeded sales")
+                    return
+            start = time.perf_counter()
+            _fetch_sales_page(db, BENCH_UMKM_ID, args.page_size, cursor)
+            keyset_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            db.execute(text(OFFSET_QUERY), {
+                "umkm_id": BENCH_UMKM_ID, "offset": (target - 1) * args.page_size, "limit": args.page_size,
+            }).fetchall()
+            offset_ms = (time.perf_counter() - start) * 1000
+            print(f"{target:>6}{keyset_ms:>12.2f}{offset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--page-size", type=int, default=20)
+    main(parser.parse_args())
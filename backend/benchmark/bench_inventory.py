@@ -0,0 +1,224 @@
+"""
+Concurrent confirms of sales on a few hot products, row mode (UPDATE
+products.stock) vs ledger mode (services/inventory.py). Reports throughput,
+confirm latency and how many backends were waiting on a lock, sampled from
+pg_stat_activity. Then checks that neither mode oversells: many threads
+race for a small stock and the applied sales must add up to at most that
+stock, with nothing left negative after compaction. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_inventory.py --threads 16 --products 3 --seconds 10
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9004
+
+
+def reset_ledger(engine):
+    from sqlalchemy import text
+    from services.inventory import init_inventory
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM inventory_ledger WHERE umkm_id = :umkm_id"), {"umkm_id": BENCH_UMKM_ID})
+        conn.execute(text("DELETE FROM inventory_buckets WHERE umkm_id = :umkm_id"), {"umkm_id": BENCH_UMKM_ID})
+    init_inventory(BENCH_UMKM_ID)
+
+
+def spread_hot_products(engine, product_ids: list, buckets: int):
+    # The load would make them hot at the first compaction anyway; skip the warm-up
+    from services.inventory import _compact_product
+
+    for product_id in product_ids:
+        with engine.begin() as conn:
+            _compact_product(conn, product_id, hot_movements=0, hot_buckets=buckets)
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Samples the number of backends of this database waiting on a lock.
+    """
+    def __init__(self, engine, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            while not self.stopped.is_set():
+                self.samples.append(conn.execute(text("""
+                    SELECT COUNT(*) FROM pg_stat_activity
+                    WHERE datname = current_database() AND wait_event_type = 'Lock'
+                """)).scalar())
+                conn.commit()
+                time.sleep(self.interval)
+
+
+def sale(product_ids: list, items: int, quantity: int):
+    from schemas.schemas import TransactionFromLLM
+
+    return TransactionFromLLM(
+        umkm_id=BENCH_UMKM_ID,
+        transaction_type="sale",
+        transcript="bench",
+        items=[{"product_id": pid, "quantity": quantity, "unit_price": 1000}
+               for pid in random.sample(product_ids, min(items, len(product_ids)))],
+    )
+
+
+def run_load(args, product_ids: list):
+    from db.db import get_engine, SessionLocal
+    from services.transaction import create_transaction_from_llm
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.seconds
+
+    def worker():
+        while time.perf_counter() < deadline:
+            payload = sale(product_ids, args.items, 1)
+            with SessionLocal() as db:
+                start = time.perf_counter()
+                try:
+                    create_transaction_from_llm(payload, db)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    sampler = LockWaitSampler(get_engine())
+    sampler.start()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sampler.stopped.set()
+    sampler.join()
+    return latencies, errors, sampler.samples
+
+
+def check_oversell(args, engine, mode: str, product_id: int) -> tuple:
+    """
+    Every thread tries to sell until the stock is gone. Returns (units
+    sold, stock left, problems found).
+    """
+    from sqlalchemy import text
+    from db.db import SessionLocal
+    from services.inventory import compact_inventory
+    from services.transaction import create_transaction_from_llm
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE products SET stock = :stock WHERE product_id = :pid"),
+                     {"stock": args.oversell_stock, "pid": product_id})
+    if mode == "ledger":
+        reset_ledger(engine)
+        spread_hot_products(engine, [product_id], args.buckets)
+
+    sold, lock = [], threading.Lock()
+
+    def worker():
+        while True:
+            quantity = random.randint(1, 3)
+            with SessionLocal() as db:
+                result = create_transaction_from_llm(sale([product_id], 1, quantity), db)
+            outcome = result["stock"][0]
+            if outcome["status"] != "ok":
+                return
+            with lock:
+                sold.append(quantity)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    problems = []
+    if mode == "ledger":
+        with engine.connect() as conn:
+            negative = conn.execute(text("""
+                SELECT COUNT(*) FROM inventory_buckets b
+                WHERE b.product_id = :pid AND b.balance + COALESCE((
+                    SELECT SUM(l.delta) FROM inventory_ledger l
+                    WHERE l.product_id = b.product_id AND l.bucket = b.bucket AND l.movement_id > b.last_movement_id
+                ), 0) < 0
+            """), {"pid": product_id}).scalar()
+        if negative:
+            problems.append(f"{negative} buckets below zero")
+        compact_inventory(BENCH_UMKM_ID)
+    with engine.connect() as conn:
+        left = conn.execute(text("SELECT stock FROM products WHERE product_id = :pid"), {"pid": product_id}).scalar()
+    if sum(sold) > args.oversell_stock:
+        problems.append(f"sold {sum(sold)} of {args.oversell_stock}")
+    if left != args.oversell_stock - sum(sold):
+        problems.append(f"stock {left}, expected {args.oversell_stock - sum(sold)}")
+    if left < 0:
+        problems.append("negative stock")
+    return sum(sold), left, problems
+
+
+def main(args):
+    configure()
+    from core.config import settings
+    from db.db import get_engine
+    from db.maintenance import ensure_schema
+    from services.inventory import compact_inventory
+    from pg import apply_schema, seed_products
+
+    engine = get_engine()
+    apply_schema(engine)
+    ensure_schema()
+    settings.INVENTORY_HOT_BUCKETS = args.buckets
+
+    print(f"{args.threads} threads, {args.products} hot products, {args.items} items per sale, {args.seconds:g}s per mode\n")
+    print(f"{'mode':>7}{'confirms/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'lock waits':>12}{'max':>5}{'errors':>8}")
+    failed = False
+    for mode in args.modes:
+        settings.INVENTORY_MODE = mode
+        product_ids = seed_products(engine, BENCH_UMKM_ID, args.products)
+        if mode == "ledger":
+            reset_ledger(engine)
+            spread_hot_products(engine, product_ids, args.buckets)
+        latencies, errors, waits = run_load(args, product_ids)
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else 0
+        print(f"{mode:>7}{len(latencies) / args.seconds:>12.0f}"
+              f"{statistics.median(latencies or [0]) * 1000:>9.2f}{p99 * 1000:>9.2f}"
+              f"{statistics.mean(waits or [0]):>12.1f}{max(waits or [0]):>5}{len(errors):>8}")
+        if errors:
+            print(f"        first error: {errors[0]!r}")
+            failed = True
+
+        if mode == "ledger":
+            stats = compact_inventory(BENCH_UMKM_ID)
+            print(f"        compaction: {stats['movements']} movements of {stats['products']} products in {stats['seconds'] * 1000:.0f} ms")
+
+    print(f"\noversell check: {args.threads} threads selling {args.oversell_stock} units of one product")
+    for mode in args.modes:
+        settings.INVENTORY_MODE = mode
+        product_id = seed_products(engine, BENCH_UMKM_ID, 1)[0]
+        sold, left, problems = check_oversell(args, engine, mode, product_id)
+        print(f"{mode:>7}: sold {sold}, {left} left  {'FAIL: ' + '; '.join(problems) if problems else 'ok'}")
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["row", "ledger"], choices=["row", "ledger"])
+    parser.add_argument("--threads", type=int, default=16, help="keep within DB_POOL_SIZE + DB_MAX_OVERFLOW")
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--items", type=int, default=1)
+    parser.add_argument("--buckets", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--oversell-stock", type=int, default=500)
+    main(parser.parse_args())
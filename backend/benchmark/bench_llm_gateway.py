@@ -0,0 +1,92 @@
+"""
+LLM gateway throughput vs added latency, against fake_llm_server.py on a
+local port (started in-process).
+
+Fires --requests parse calls with --concurrency in flight, once straight
+through llm_chain.ainvoke and once through the batching gateway, and
+reports throughput, latency percentiles, how many were shed or failed, how
+many requests the provider saw / throttled and the prompt tokens it could
+serve from its prefix cache.
+
+    python benchmark/bench_llm_gateway.py --requests 400 --concurrency 100 --rpm 600 --latency-ms 400
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+from fakes import Latency, configure
+from fake_llm_server import create_app
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(parse, requests, concurrency, product_list):
+    from schemas.schemas import ParseTranscriptRequest
+    from services.llm_gateway import LLMOverloaded
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, shed, failed = [], 0, 0
+
+    async def one(i):
+        nonlocal shed, failed
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await parse(ParseTranscriptRequest(umkm_id=1 + i % 50, transcript=f"es teh dua {i}", product_list=product_list))
+                latencies.append(time.perf_counter() - start)
+            except LLMOverloaded:
+                shed += 1
+            except Exception:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, sorted(latencies), shed, failed
+
+
+async def main(args):
+    os.environ.setdefault("OPENAI_BASE_URL", f"http://127.0.0.1:{args.port}/v1")
+    configure({"LLM_RATE_LIMIT_RPM": str(args.gateway_rpm or args.rpm)})
+    app = create_app(Latency(args.latency_ms), args.rpm)
+    start_server(app, args.port)
+
+    from core.config import settings
+    from schemas.schemas import Product
+    from services.llm import aparse_transcript_with_llm
+
+    product_list = [Product(product_id=i, name=f"Produk {i}", price=1000 + 500 * i) for i in range(1, 31)]
+    print(f"{'mode':>8}{'ok':>6}{'shed':>6}{'fail':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'upstream':>10}{'429s':>6}{'cached%':>9}")
+    for mode, enabled in (("direct", False), ("gateway", True)):
+        settings.LLM_GATEWAY_ENABLED = enabled
+        app.state.stats = {"requests": 0, "throttled": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        elapsed, latencies, shed, failed = await run_load(aparse_transcript_with_llm, args.requests, args.concurrency, product_list)
+        stats = app.state.stats
+        p50 = statistics.median(latencies) * 1000 if latencies else 0
+        p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0
+        cached = 100 * stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+        print(f"{mode:>8}{len(latencies):>6}{shed:>6}{failed:>6}{len(latencies) / elapsed:>8.1f}{p50:>9.0f}{p95:>9.0f}"
+              f"{stats['requests']:>10}{stats['throttled']:>6}{cached:>8.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--rpm", type=float, default=600, help="provider rate limit")
+    parser.add_argument("--gateway-rpm", type=float, default=None, help="gateway budget, default = --rpm")
+    parser.add_argument("--port", type=int, default=8100)
+    asyncio.run(main(parser.parse_args()))
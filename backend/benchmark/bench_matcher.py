@@ -0,0 +1,115 @@
+"""
+Local product matcher benchmark on the transcript corpus in data/.
+
+Reports, per transcript and in total:
+  * whether the matcher was confident enough to skip the LLM, and whether
+    its items were right when it was
+  * whether the top-k candidate list still contains every expected product
+  * matcher latency
+  * prompt tokens with the full catalog vs with the top-k candidates
+
+With --llm the real chain is also called (needs OPENAI_API_KEY) on both the
+full and the top-k prompt to compare accuracy and latency.
+
+    python benchmark/bench_matcher.py --top-k 10
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from fakes import configure
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+def load_corpus():
+    catalog = json.loads((DATA_DIR / "catalog.json").read_text())
+    with open(DATA_DIR / "transcripts.jsonl") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return catalog, cases
+
+
+def item_set(items):
+    return sorted((i["product_id"], i["quantity"]) for i in items)
+
+
+def main(args):
+    configure()
+    import tiktoken
+    from schemas.schemas import Product, ParseTranscriptRequest
+    from services.matcher import ProductMatcher
+    from services.llm import get_prompt, parse_transcript_with_llm
+
+    catalog_rows, cases = load_corpus()
+    catalog = [Product(**row) for row in catalog_rows]
+    matcher = ProductMatcher(catalog)
+    encoding = tiktoken.get_encoding("o200k_base")
+    prompt = get_prompt()
+
+    def prompt_tokens(transcript, products):
+        rendered = prompt.format(
+            input_text=transcript,
+            product_list="\n".join(f"- {p.name} (Rp {p.price})" for p in products),
+        )
+        return len(encoding.encode(rendered))
+
+    bypassed = bypass_correct = recall_hits = 0
+    latencies, full_tokens, topk_tokens = [], [], []
+    llm_full_correct = llm_topk_correct = 0
+    llm_full_ms, llm_topk_ms = [], []
+
+    for case in cases:
+        transcript = case["transcript"]
+        expected = item_set(case["items"])
+
+        start = time.perf_counter()
+        match = matcher.match(transcript)
+        candidates = matcher.candidates(transcript, args.top_k)
+        latencies.append(time.perf_counter() - start)
+
+        if match.confident:
+            bypassed += 1
+            got = sorted((p.product_id, q) for p, q, _, _ in match.items)
+            bypass_correct += got == expected
+        candidate_ids = {p.product_id for p in candidates}
+        recall_hits += all(pid in candidate_ids for pid, _ in expected)
+        full_tokens.append(prompt_tokens(transcript, catalog))
+        topk_tokens.append(prompt_tokens(transcript, candidates))
+
+        if args.llm:
+            for products, correct_list, ms_list in (
+                (catalog, "full", llm_full_ms),
+                (candidates, "topk", llm_topk_ms),
+            ):
+                start = time.perf_counter()
+                parsed = parse_transcript_with_llm(ParseTranscriptRequest(umkm_id=1, transcript=transcript, product_list=products))
+                ms_list.append(time.perf_counter() - start)
+                ok = item_set([i.model_dump() for i in parsed.items]) == expected
+                if correct_list == "full":
+                    llm_full_correct += ok
+                else:
+                    llm_topk_correct += ok
+
+    n = len(cases)
+    print(f"transcripts                 {n}")
+    print(f"catalog size                {len(catalog)}")
+    print(f"matcher bypassed LLM        {bypassed} ({bypassed / n:.0%})")
+    print(f"bypass accuracy             {bypass_correct}/{bypassed}")
+    print(f"top-{args.top_k} candidate recall      {recall_hits}/{n}")
+    print(f"matcher latency p50 / max   {statistics.median(latencies) * 1000:.3f} / {max(latencies) * 1000:.3f} ms")
+    print(f"prompt tokens full catalog  {statistics.mean(full_tokens):.0f} avg")
+    print(f"prompt tokens top-{args.top_k}        {statistics.mean(topk_tokens):.0f} avg")
+    remaining = n - bypassed
+    print(f"LLM calls after bypass      {remaining}, est. prompt tokens {remaining * statistics.mean(topk_tokens):.0f} vs {n * statistics.mean(full_tokens):.0f}")
+    if args.llm:
+        print(f"LLM accuracy full / top-k   {llm_full_correct}/{n} / {llm_topk_correct}/{n}")
+        print(f"LLM latency p50 full/top-k  {statistics.median(llm_full_ms) * 1000:.0f} / {statistics.median(llm_topk_ms) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--llm", action="store_true", help="also call the real LLM (costs money)")
+    main(parser.parse_args())
@@ -0,0 +1,151 @@
+"""
+Sales table size and report query latency before and after
+`partition-tables` + `archive-transcripts` (db/partitions.py,
+services/archive.py). Seeds --sales sales spread over --days days, measures
+on the plain table, converts and archives, then measures again. The
+conversion is permanent, so point it at a scratch database; on one that is
+already partitioned only the "after" column is filled in. Needs a Postgres
+(see pg.py).
+
+    python benchmark/bench_partitions.py --sales 1000000 --days 730 --repeat 20
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9005
+
+
+def table_bytes(conn, table: str) -> int:
+    from sqlalchemy import text
+
+    return conn.execute(text("""
+        SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree(to_regclass(:table))
+    """), {"table": table}).scalar()
+
+
+def hot_bytes(conn) -> int:
+    """
+    What this month's dashboards and confirms work against: the current
+    partition, or the whole table when it is not partitioned.
+    """
+    from db.partitions import is_partitioned, month_start, partition_name
+
+    if not is_partitioned(conn, "sales"):
+        return table_bytes(conn, "sales")
+    return table_bytes(conn, partition_name("sales", month_start(date.today())))
+
+
+def scanned_relations(conn, sql: str, params: dict) -> int:
+    from sqlalchemy import text
+
+    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return len(relations)
+
+
+def timed(repeat: int, func) -> float:
+    func()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def measure(args, engine, old_sale_id: int, recent_sale_id: int) -> dict:
+    from sqlalchemy import text
+    from db.db import SessionLocal
+    from api.v1.reports import _fetch_sales_page
+    from services.archive import lookup_transcript
+    from services.export import EXPORTS
+
+    today = date.today()
+    month = {"umkm_id": BENCH_UMKM_ID, "start_date": today.replace(day=1), "end_date": today + timedelta(days=1)}
+    _, sale_query = EXPORTS["sale"]
+    _, product_query = EXPORTS["product"]
+
+    results = {}
+    with engine.connect() as conn:
+        results["sales table MB"] = table_bytes(conn, "sales") / 2**20
+        results["hot partition MB"] = hot_bytes(conn) / 2**20
+        results["archive MB"] = table_bytes(conn, "transcript_archive") / 2**20
+        results["relations scanned, month export"] = scanned_relations(conn, sale_query, month)
+
+    with SessionLocal() as db:
+        results["history page 1 ms"] = timed(args.repeat, lambda: _fetch_sales_page(db, BENCH_UMKM_ID, 20))
+        results["history this month ms"] = timed(args.repeat, lambda: _fetch_sales_page(
+            db, BENCH_UMKM_ID, 20, start_date=month["start_date"]))
+        results["export sales this month ms"] = timed(
+            args.repeat, lambda: db.execute(text(sale_query), month).fetchall())
+        results["export products this month ms"] = timed(
+            args.repeat, lambda: db.execute(text(product_query), month).fetchall())
+        results["recent transcript ms"] = timed(
+            args.repeat, lambda: lookup_transcript(db, "sale", BENCH_UMKM_ID, recent_sale_id))
+        results["old transcript ms"] = timed(
+            args.repeat, lambda: lookup_transcript(db, "sale", BENCH_UMKM_ID, old_sale_id))
+    return results
+
+
+def main(args):
+    configure()
+    from sqlalchemy import text
+    from db.db import get_engine
+    from db.maintenance import ensure_schema, partition_tables, archive_transcripts
+    from db.partitions import is_partitioned
+    from pg import apply_schema, seed_products, seed_sales, sales_count
+
+    engine = get_engine()
+    apply_schema(engine)
+    ensure_schema()
+    existing = sales_count(engine, BENCH_UMKM_ID)
+    if existing < args.sales:
+        product_ids = seed_products(engine, BENCH_UMKM_ID, 50)
+        print(f"Seeding {args.sales - existing} sales over {args.days} days...")
+        seed_sales(engine, BENCH_UMKM_ID, args.sales - existing, args.days, product_ids)
+
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn, "sales")
+        old_sale_id, recent_sale_id = (conn.execute(text(f"""
+            SELECT sale_id FROM sales WHERE umkm_id = :umkm_id
+            ORDER BY sale_date {order} LIMIT 1
+        """), {"umkm_id": BENCH_UMKM_ID}).scalar() for order in ("ASC", "DESC"))
+
+    before = None
+    if partitioned:
+        print("sales is already partitioned, measuring the current state only")
+    else:
+        before = measure(args, engine, old_sale_id, recent_sale_id)
+        start = time.perf_counter()
+        partition_tables(args.months_ahead)
+        print(f"partition-tables took {time.perf_counter() - start:.1f}s")
+    archive_transcripts(args.archive_after_days)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE sales"))
+    after = measure(args, engine, old_sale_id, recent_sale_id)
+
+    print(f"\n{'':<34}{'before':>10}{'after':>10}")
+    for name, value in after.items():
+        print(f"{name:<34}{before[name] if before else float('nan'):>10.2f}{value:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--months-ahead", type=int, default=3)
+    parser.add_argument("--archive-after-days", type=int, default=90)
+    main(parser.parse_args())
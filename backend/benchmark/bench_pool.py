@@ -0,0 +1,104 @@
+"""
+Connection pool load test against a local Postgres (see pg.py).
+
+Simulates a burst of requests that each hold a connection for a short
+query, comparing SQLAlchemy's default pool (5 + 10 overflow) with the
+settings-driven pool, and optionally the asyncpg engine driven by plain
+asyncio tasks instead of one thread per request.
+
+    python benchmark/bench_pool.py --workers 60 --requests 2000 --query-ms 5 --async
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import configure
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def report(name, latencies, elapsed, stats):
+    print(
+        f"{name:<10}{len(latencies) / elapsed:>9.0f}{statistics.median(latencies) * 1000:>9.1f}"
+        f"{percentile(latencies, 99) * 1000:>9.1f}{stats['wait_seconds_avg'] * 1000:>11.2f}"
+        f"{stats['wait_seconds_max'] * 1000:>11.1f}{stats['timeouts']:>9}"
+    )
+
+
+def run_sync(engine, args):
+    from sqlalchemy import text
+
+    query = text("SELECT pg_sleep(:s)")
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(query, {"s": args.query_ms / 1000})
+        except Exception:
+            pass
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(one, range(args.requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def run_async(engine, args):
+    from sqlalchemy import text
+
+    query = text("SELECT pg_sleep(:s)")
+    latencies = []
+    semaphore = asyncio.Semaphore(args.workers)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(query, {"s": args.query_ms / 1000})
+            except Exception:
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return latencies, time.perf_counter() - start
+
+
+def main(args):
+    configure({"DB_ASYNC_ENABLED": "true" if args.use_async else "false"})
+    from db.db import PoolStats, build_engine, get_async_engine, get_engine, async_pool_stats, pool_stats
+
+    engine, async_engine = get_engine(), get_async_engine()
+
+    print(f"{'pool':<10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'wait avg':>11}{'wait max':>11}{'timeouts':>9}")
+
+    default_stats = PoolStats()
+    default_engine = build_engine(stats=default_stats, pool_size=5, max_overflow=10, pool_timeout=30,
+                                  pool_pre_ping=False, pool_recycle=-1)
+    latencies, elapsed = run_sync(default_engine, args)
+    report("default", latencies, elapsed, default_stats.snapshot(default_engine.pool))
+
+    latencies, elapsed = run_sync(engine, args)
+    report("settings", latencies, elapsed, pool_stats.snapshot(engine.pool))
+
+    if args.use_async:
+        latencies, elapsed = asyncio.run(run_async(async_engine, args))
+        report("asyncpg", latencies, elapsed, async_pool_stats.snapshot(async_engine.sync_engine.pool))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=50, help="concurrent requests")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--query-ms", type=float, default=5)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    main(parser.parse_args())
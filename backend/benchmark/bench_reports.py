@@ -0,0 +1,102 @@
+"""
+Dashboard report latency on a seeded history, legacy scans of `sales`
+(EXTRACT/CAST predicates) vs the daily_sales_rollup queries the endpoints
+use now. Needs a Postgres (see pg.py).
+
+    python benchmark/bench_reports.py --sales 1000000 --days 1095
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+
+from fakes import configure
+
+BENCH_UMKM_ID = 9002
+
+LEGACY_MONTHLY = """
+    SELECT CAST(sale_date AS DATE) AS day, SUM(total_amount) AS total_amount
+    FROM sales
+    WHERE umkm_id = :umkm_id
+    AND EXTRACT(YEAR FROM sale_date) = :year
+    AND EXTRACT(MONTH FROM sale_date) = :month
+    GROUP BY day
+    ORDER BY day DESC
+"""
+
+LEGACY_SUMMARY = [
+    """
+    SELECT COALESCE(SUM(total_amount), 0), COUNT(*) FROM sales
+    WHERE umkm_id = :umkm_id AND CAST(sale_date AS DATE) = :current_date
+    """,
+    """
+    SELECT COALESCE(SUM(total_amount), 0), COUNT(*) FROM sales
+    WHERE umkm_id = :umkm_id
+    AND EXTRACT(YEAR FROM sale_date) = :year
+    AND EXTRACT(MONTH FROM sale_date) = :month
+    """,
+]
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def main(args):
+    configure()
+    from sqlalchemy import text
+    from db.db import get_engine, SessionLocal
+    from db.maintenance import ensure_schema, rebuild_rollup
+    from api.v1.reports import _monthly_transaction, _dashboard_summary
+    from pg import apply_schema, seed_products, seed_sales, sales_count
+
+    engine = get_engine()
+
+    apply_schema(engine)
+    ensure_schema()
+    existing = sales_count(engine, BENCH_UMKM_ID)
+    if existing < args.sales:
+        product_ids = seed_products(engine, BENCH_UMKM_ID, 50)
+        print(f"Seeding {args.sales - existing} sales over {args.days} days...")
+        seed_sales(engine, BENCH_UMKM_ID, args.sales - existing, args.days, product_ids)
+    start = time.perf_counter()
+    rebuild_rollup(BENCH_UMKM_ID)
+    print(f"rollup rebuild took {time.perf_counter() - start:.1f} s")
+
+    now = datetime.utcnow()
+    params = {"umkm_id": BENCH_UMKM_ID, "year": now.year, "month": now.month, "current_date": now.date()}
+
+    def legacy_monthly():
+        with engine.connect() as conn:
+            conn.execute(text(LEGACY_MONTHLY), params).fetchall()
+
+    def legacy_summary():
+        with engine.connect() as conn:
+            for query in LEGACY_SUMMARY:
+                conn.execute(text(query), params).fetchone()
+
+    def rollup_monthly():
+        with SessionLocal() as db:
+            _monthly_transaction(db, str(BENCH_UMKM_ID))
+
+    def rollup_summary():
+        with SessionLocal() as db:
+            _dashboard_summary(db, str(BENCH_UMKM_ID))
+
+    print(f"sales rows for umkm {BENCH_UMKM_ID}: {sales_count(engine, BENCH_UMKM_ID)}")
+    print(f"{'report':<22}{'legacy ms':>12}{'rollup ms':>12}")
+    print(f"{'monthly_transaction':<22}{timed(legacy_monthly, args.repeat):>12.2f}{timed(rollup_monthly, args.repeat):>12.2f}")
+    print(f"{'transaction_summary':<22}{timed(legacy_summary, args.repeat):>12.2f}{timed(rollup_summary, args.repeat):>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""
+Draft pipeline under injected upstream faults, without and with the
+resilience policies (deadlines, retries, circuit breaker, optional hedging).
+
+"bare" gives every call a single attempt, no deadline to speak of and a
+breaker that never opens, i.e. the behaviour before core/resilience.py.
+Reports per mode: outcomes by HTTP status, latency percentiles of all
+requests (fast failures included), breaker openings and hedges sent.
+
+    # Speech hangs for 10 s starting 2 s in
+    python benchmark/bench_resilience.py --speech-outage 2 10 --hang --requests 400 --concurrency 40
+    # 5% LLM errors and a 2 s tail on 2% of calls, hedging after 1 s
+    python benchmark/bench_resilience.py --llm-error-rate 0.05 --llm-spike 0.02 2000 --hedge-after 1
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+from fakes import Faults, Latency, install
+
+
+async def run_load(requests, concurrency, rate):
+    from services.draft import generate_draft_from_audio, DraftPipelineError
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+
+    async def one(i):
+        # open-loop arrivals, so a stalled upstream shows up as pile-up
+        await asyncio.sleep(i / rate)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await generate_draft_from_audio(b"\x1a\x45\xdf\xa3" + i.to_bytes(4, "big"), 1)
+                statuses[200] += 1
+            except DraftPipelineError as e:
+                statuses[e.status_code] += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return sorted(latencies), statuses
+
+
+async def main(args):
+    speech_faults = Faults(args.speech_error_rate, *args.speech_spike, outages=[args.speech_outage] if args.speech_outage else (), hang=args.hang)
+    llm_faults = Faults(args.llm_error_rate, *args.llm_spike, outages=[args.llm_outage] if args.llm_outage else (), hang=args.hang)
+    install(
+        speech_latency=Latency(args.stt_ms),
+        llm_latency=Latency(args.llm_ms),
+        db_latency=Latency(1),
+        env={"MATCHER_BYPASS_LLM": "false", "TRANSCRIPT_CACHE_TTL_SECONDS": "0",
+             "AUDIO_PREPROCESS_ENABLED": "false", "LLM_GATEWAY_ENABLED": "false"},
+        speech_faults=speech_faults,
+        llm_faults=llm_faults,
+    )
+    from core.resilience import breakers
+    from services.speech import speech_policy
+    from services.llm import llm_policy
+
+    resilient = {
+        policy: (args.timeout, policy.attempts, policy.breaker.failure_threshold, args.hedge_after)
+        for policy in (speech_policy, llm_policy)
+    }
+    bare = {policy: (3600, 1, 10 ** 9, 0) for policy in (speech_policy, llm_policy)}
+
+    print(f"{'mode':>10}{'ok':>6}{'503':>6}{'504':>6}{'500':>6}{'p50 ms':>9}{'p99 ms':>9}{'opened':>8}")
+    for mode, config in (("bare", bare), ("resilient", resilient)):
+        for policy, (timeout, attempts, threshold, hedge_after) in config.items():
+            policy.timeout, policy.attempts, policy.hedge_after = timeout, attempts, hedge_after
+            policy.breaker.failure_threshold = threshold
+            policy.breaker.record_success()
+            policy.breaker.opened_total = 0
+        speech_faults.started = llm_faults.started = None
+
+        latencies, statuses = await run_load(args.requests, args.concurrency, args.rate)
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(0.99 * (len(latencies) - 1))] * 1000
+        opened = sum(b.opened_total for b in breakers.values())
+        print(f"{mode:>10}{statuses[200]:>6}{statuses[503]:>6}{statuses[504]:>6}{statuses[500]:>6}"
+              f"{p50:>9.0f}{p99:>9.0f}{opened:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--rate", type=float, default=50, help="arrivals per second")
+    parser.add_argument("--stt-ms", type=float, default=800)
+    parser.add_argument("--llm-ms", type=float, default=600)
+    parser.add_argument("--speech-error-rate", type=float, default=0.0)
+    parser.add_argument("--speech-spike", type=float, nargs=2, default=(0.0, 0.0), metavar=("RATIO", "MS"))
+    parser.add_argument("--speech-outage", type=float, nargs=2, default=None, metavar=("START_S", "SECONDS"))
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-spike", type=float, nargs=2, default=(0.0, 0.0), metavar=("RATIO", "MS"))
+    parser.add_argument("--llm-outage", type=float, nargs=2, default=None, metavar=("START_S", "SECONDS"))
+    parser.add_argument("--hang", action="store_true", help="outages hang instead of failing fast")
+    parser.add_argument("--hedge-after", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=5.0, help="per attempt deadline in resilient mode")
+    asyncio.run(main(parser.parse_args()))
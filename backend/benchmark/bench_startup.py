@@ -0,0 +1,102 @@
+"""
+Cold import time of the app (`import main`, what every uvicorn worker and
+test process pays before serving anything), measured with
+`python -X importtime` in a fresh interpreter with no credentials or
+database settings at all.
+
+Fails (exit code 1) when the median import exceeds --budget-ms or when any
+module that should only load on first use (gRPC, langchain, the OpenAI
+client, DB drivers) was imported, so it can gate CI:
+
+    python benchmark/bench_startup.py --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+# Loaded lazily by helper/gcp.py, services/llm.py and db/db.py
+DEFERRED_MODULES = (
+    "grpc",
+    "google.cloud.speech_v1p1beta1",
+    "langchain",
+    "langchain_openai",
+    "openai",
+    "psycopg2",
+    "asyncpg",
+)
+
+PROBE = (
+    "import sys, main; "
+    "print(','.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,)
+)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    {module: (self_us, cumulative_us)} from -X importtime output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(python: str):
+    # Only what the interpreter needs: the import must not depend on settings
+    env = {key: os.environ[key] for key in ("PATH", "HOME", "VIRTUAL_ENV") if key in os.environ}
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", PROBE],
+        cwd=APP_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f"`import main` failed with exit code {result.returncode}")
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return parse_importtime(result.stderr), loaded
+
+
+def main(args):
+    # First run warms the bytecode cache and is not counted
+    run_once(args.python)
+    totals, modules, loaded = [], {}, []
+    for _ in range(args.runs):
+        modules, loaded = run_once(args.python)
+        totals.append(modules["main"][1] / 1000)
+
+    median = statistics.median(totals)
+    print(f"import main: median {median:.0f} ms, min {min(totals):.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'cumulative ms':>14}{'self ms':>9}  top-level imports")
+    top = sorted(
+        ((name, times) for name, times in modules.items() if "." not in name and name != "main"),
+        key=lambda item: item[1][1], reverse=True,
+    )
+    for name, (self_us, cumulative_us) in top[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>9.1f}  {name}")
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL: imported at startup, should be lazy: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: import time {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--python", default=sys.executable)
+    main(parser.parse_args())
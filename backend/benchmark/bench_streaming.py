@@ -0,0 +1,74 @@
+"""
+Streaming speech recognition benchmark against the local fake recognizer.
+
+Feeds a clip as fixed-size chunks at real-time pace into
+`services.speech.stream_speech_to_text` and reports latency to the first
+interim result, how long the producer was blocked by the bounded queue
+(backpressure), the number of sessions opened, and whether every word made
+it into the final results across reconnects.
+
+    python benchmark/bench_streaming.py --chunks 200 --chunk-ms 100 --session-chunks 60
+"""
+import argparse
+import asyncio
+import time
+
+from fakes import FakeStreamingSpeechClient, Latency, install
+
+
+async def main(args):
+    install(Latency(1), Latency(1), Latency(1))
+    from services.speech import stream_speech_to_text
+
+    client = FakeStreamingSpeechClient(
+        Latency(args.recognize_ms),
+        final_every=args.final_every,
+        session_chunks=args.session_chunks,
+    )
+    queue = asyncio.Queue(maxsize=args.queue_size)
+    blocked = 0.0
+    start = time.perf_counter()
+
+    async def produce():
+        nonlocal blocked
+        for _ in range(args.chunks):
+            put_start = time.perf_counter()
+            await queue.put(b"\0" * args.chunk_bytes)
+            blocked += time.perf_counter() - put_start
+            await asyncio.sleep(args.chunk_ms / 1000)
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    first_interim = None
+    finals = []
+    results = 0
+    async for result in stream_speech_to_text(queue, streaming_config=None, client=client, session_limit=args.session_seconds):
+        results += 1
+        if first_interim is None:
+            first_interim = time.perf_counter() - start
+        if result["type"] == "final":
+            finals.append(result["transcript"])
+    await producer
+    elapsed = time.perf_counter() - start
+
+    words = " ".join(finals).split()
+    print(f"chunks sent            {args.chunks}")
+    print(f"results received       {results}")
+    print(f"first interim          {first_interim * 1000:.0f} ms")
+    print(f"producer blocked       {blocked * 1000:.0f} ms")
+    print(f"sessions opened        {client.sessions}")
+    print(f"words in finals        {len(words)} / {args.chunks}")
+    print(f"total                  {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--chunk-ms", type=float, default=100)
+    parser.add_argument("--chunk-bytes", type=int, default=3200)
+    parser.add_argument("--recognize-ms", type=float, default=30)
+    parser.add_argument("--final-every", type=int, default=5)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--session-chunks", type=int, default=None)
+    parser.add_argument("--session-seconds", type=float, default=280)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+OpenAI-compatible fake chat completions server for LLM load tests.
+
+  * latency: lognormal-ish around --latency-ms (same Latency as fakes.py)
+  * rate limit: more than --rpm requests in any minute-long sliding window
+    gets HTTP 429 with Retry-After, like the real API
+  * prompt caching: the system message of a request is reported back as
+    cached tokens when an identical prefix was seen before
+
+    python benchmark/fake_llm_server.py --port 8100 --latency-ms 400 --rpm 600
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import deque
+
+from fakes import Latency
+
+
+def create_app(latency: Latency, rpm: float):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "throttled": 0, "prompt_tokens": 0, "cached_tokens": 0}
+    recent = deque()
+    seen_prefixes = set()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+
+        now = time.monotonic()
+        while recent and recent[0] < now - 60:
+            recent.popleft()
+        if len(recent) >= rpm:
+            stats["throttled"] += 1
+            retry_after = max(0.1, recent[0] + 60 - now)
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after": f"{retry_after:.2f}"},
+            )
+        recent.append(now)
+
+        messages = body.get("messages", [])
+        system = "".join(m["content"] for m in messages if m.get("role") == "system")
+        user = "".join(m["content"] for m in messages if m.get("role") != "system")
+        prompt_tokens = (len(system) + len(user)) // 4
+        prefix = hashlib.sha256(system.encode()).hexdigest()
+        cached_tokens = len(system) // 4 if prefix in seen_prefixes else 0
+        seen_prefixes.add(prefix)
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached_tokens
+
+        await asyncio.sleep(latency.sample())
+
+        transcript = re.search(r'transkrip dari penjual: "(.*)"', user)
+        product = re.search(r"- (.+) \(Rp ([\d.]+)\)", user)
+        content = json.dumps({
+            "umkm_id": 1,
+            "transaction_type": "sale",
+            "transcript": transcript.group(1) if transcript else "",
+            "items": [{
+                "product_id": 1,
+                "name": product.group(1) if product else "Es Teh Manis",
+                "quantity": 1,
+                "unit_price": float(product.group(2)) if product else 5000,
+            }],
+        })
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-fake-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return app.state.stats
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--rpm", type=float, default=600)
+    args = parser.parse_args()
+    uvicorn.run(create_app(Latency(args.latency_ms), args.rpm), host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,316 @@
+"""
+Local stand-ins for the paid upstreams (Google Speech, OpenAI) and the
+products query, so benchmarks can run without credentials or a database.
+
+Import this module *before* anything from the app: `install()` puts the app
+directory on sys.path, fills in dummy settings and swaps `helper.gcp` for a
+fake module.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import types
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+DEFAULT_PRODUCTS = [
+    {"product_id": 1, "name": "Es Teh Manis", "price": 5000.0},
+    {"product_id": 2, "name": "Nasi Goreng", "price": 15000.0},
+    {"product_id": 3, "name": "Kopi Susu", "price": 12000.0},
+    {"product_id": 4, "name": "Mie Ayam", "price": 13000.0},
+    {"product_id": 5, "name": "Gorengan", "price": 1000.0},
+]
+
+
+class Latency:
+    """
+    Latency distribution in milliseconds: lognormal-ish around `median_ms`
+    with a `tail_ms` spike hit `tail_ratio` of the time.
+    """
+    def __init__(self, median_ms: float, jitter: float = 0.2, tail_ms: float = 0.0, tail_ratio: float = 0.0):
+        self.median_ms = median_ms
+        self.jitter = jitter
+        self.tail_ms = tail_ms
+        self.tail_ratio = tail_ratio
+
+    def sample(self) -> float:
+        if self.tail_ratio and random.random() < self.tail_ratio:
+            return self.tail_ms / 1000
+        return self.median_ms * random.lognormvariate(0, self.jitter) / 1000
+
+
+class ServiceUnavailable(Exception):
+    """
+    What a fault looks like to the app: same class name and status code as
+    google.api_core / openai 503s, so it is treated as retryable.
+    """
+    status_code = 503
+
+
+class DeadlineExceeded(Exception):
+    status_code = 504
+
+
+class Faults:
+    """
+    Fault injection for the fake upstreams:
+      * `error_rate` of calls fail with ServiceUnavailable
+      * `spike_ratio` of calls take an extra `spike_ms`
+      * during each (start_s, duration_s) in `outages`, counted from the
+        first call, every call fails, or hangs until cancelled if `hang`
+    """
+    def __init__(self, error_rate: float = 0.0, spike_ratio: float = 0.0, spike_ms: float = 0.0,
+                 outages=(), hang: bool = False):
+        self.error_rate = error_rate
+        self.spike_ratio = spike_ratio
+        self.spike_ms = spike_ms
+        self.outages = list(outages)
+        self.hang = hang
+        self.started = None
+        self.injected = 0
+
+    def _in_outage(self) -> bool:
+        if self.started is None:
+            self.started = time.monotonic()
+        elapsed = time.monotonic() - self.started
+        return any(start <= elapsed < start + duration for start, duration in self.outages)
+
+    def plan(self):
+        """
+        (extra delay in seconds, error to raise or None) for the next call.
+        A hanging outage is an hour of delay, i.e. until the caller's timeout.
+        """
+        if self._in_outage():
+            self.injected += 1
+            return (3600.0, None) if self.hang else (0.0, ServiceUnavailable("injected outage"))
+        if self.error_rate and random.random() < self.error_rate:
+            self.injected += 1
+            return 0.0, ServiceUnavailable("injected error")
+        if self.spike_ratio and random.random() < self.spike_ratio:
+            self.injected += 1
+            return self.spike_ms / 1000, None
+        return 0.0, None
+
+    def apply(self, timeout: float = None):
+        # Blocking clients can't be cancelled, they honour their timeout= instead
+        delay, error = self.plan()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded("injected hang hit the deadline")
+        time.sleep(delay)
+        if error is not None:
+            raise error
+
+    async def aapply(self):
+        delay, error = self.plan()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+
+
+class _Alternative:
+    def __init__(self, transcript):
+        self.transcript = transcript
+
+
+class _Result:
+    def __init__(self, transcript):
+        self.alternatives = [_Alternative(transcript)]
+
+
+class _Response:
+    def __init__(self, transcript):
+        self.results = [_Result(transcript)]
+
+
+class FakeSpeechClient:
+    def __init__(self, latency: Latency, transcript: str = "es teh manis dua sama nasi goreng satu", faults: Faults = None):
+        self.latency = latency
+        self.transcript = transcript
+        self.faults = faults or Faults()
+        self.calls = 0
+
+    def recognize(self, config=None, audio=None, **kwargs):
+        self.calls += 1
+        self.faults.apply(kwargs.get("timeout"))
+        time.sleep(self.latency.sample())
+        return _Response(self.transcript)
+
+
+class FakeSpeechAsyncClient(FakeSpeechClient):
+    async def recognize(self, config=None, audio=None, **kwargs):
+        self.calls += 1
+        await self.faults.aapply()
+        await asyncio.sleep(self.latency.sample())
+        return _Response(self.transcript)
+
+
+class _StreamingResult:
+    def __init__(self, transcript, is_final, stability):
+        self.alternatives = [_Alternative(transcript)]
+        self.is_final = is_final
+        self.stability = stability
+
+
+class _StreamingResponse:
+    def __init__(self, results):
+        self.results = results
+
+
+class FakeStreamingSpeechClient:
+    """
+    Local stand-in for `SpeechAsyncClient.streaming_recognize`.
+
+    Every audio chunk is "recognized" as the next word of `script` after
+    `latency`; an interim result with the words heard so far is emitted per
+    chunk and a final result every `final_every` chunks and at the end of the
+    request stream. A session that receives more than `session_chunks`
+    chunks raises OutOfRange, like Google's streaming duration cap.
+    """
+    def __init__(self, latency: Latency, script=None, final_every: int = 5, session_chunks: int = None):
+        self.latency = latency
+        self.script = (script or "es teh manis dua nasi goreng satu kopi susu tiga").split()
+        self.final_every = final_every
+        self.session_chunks = session_chunks
+        self.sessions = 0
+        self.chunks = 0
+
+    async def streaming_recognize(self, requests, **kwargs):
+        self.sessions += 1
+        return self._responses(requests)
+
+    def _word(self):
+        word = self.script[self.chunks % len(self.script)]
+        self.chunks += 1
+        return word
+
+    async def _responses(self, requests):
+        from google.api_core.exceptions import OutOfRange
+
+        pending = []
+        received = 0
+        async for request in requests:
+            if not request.audio_content:
+                continue
+            received += 1
+            if self.session_chunks and received > self.session_chunks:
+                raise OutOfRange("Exceeded maximum allowed stream duration")
+            await asyncio.sleep(self.latency.sample())
+            pending.append(self._word())
+            if len(pending) >= self.final_every:
+                yield _StreamingResponse([_StreamingResult(" ".join(pending), True, 1.0)])
+                pending = []
+            else:
+                yield _StreamingResponse([_StreamingResult(" ".join(pending), False, 0.5)])
+        if pending:
+            yield _StreamingResponse([_StreamingResult(" ".join(pending), True, 1.0)])
+
+
+class FakeChain:
+    """
+    Stands in for `prompt | llm` (services.llm.llm_chain): returns an
+    AIMessage with a JSON TransactionFromLLM and token usage after a
+    simulated provider round trip. The real output parser still runs.
+    """
+    def __init__(self, latency: Latency, faults: Faults = None):
+        self.latency = latency
+        self.faults = faults or Faults()
+        self.calls = 0
+
+    def _result(self, inputs):
+        import json
+        from langchain_core.messages import AIMessage
+
+        content = json.dumps({
+            "umkm_id": 1,
+            "transaction_type": "sale",
+            "transcript": inputs.get("input_text", ""),
+            "items": [
+                {"product_id": 1, "name": "Es Teh Manis", "quantity": 2, "unit_price": 5000},
+                {"product_id": 2, "name": "Nasi Goreng", "quantity": 1, "unit_price": 15000},
+            ],
+        })
+        prompt_tokens = sum(len(str(v)) for v in inputs.values()) // 4
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": len(content) // 4,
+                            "total_tokens": prompt_tokens + len(content) // 4},
+        )
+
+    def invoke(self, inputs, config=None, **kwargs):
+        self.calls += 1
+        self.faults.apply()
+        time.sleep(self.latency.sample())
+        return self._result(inputs)
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        self.calls += 1
+        await self.faults.aapply()
+        await asyncio.sleep(self.latency.sample())
+        return self._result(inputs)
+
+    async def abatch(self, inputs, config=None, return_exceptions=False, **kwargs):
+        return await asyncio.gather(*(self.ainvoke(i) for i in inputs), return_exceptions=return_exceptions)
+
+
+def fake_product_list(latency: Latency, products=None):
+    def get_product_list(umkm_id, db=None):
+        time.sleep(latency.sample())
+        return list(products or DEFAULT_PRODUCTS)
+    return get_product_list
+
+
+def configure(env: dict = None):
+    """
+    Put the app on sys.path and fill in dummy settings, without replacing
+    any upstream. Real environment variables win over the dummies.
+    """
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+
+    defaults = {
+        "POSTGRES_USER": "bench",
+        "POSTGRES_PASSWORD": "bench",
+        "POSTGRES_DB": "bench",
+        "GOOGLE_APPLICATION_CREDENTIALS": "/dev/null",
+        "OPENAI_API_KEY": "sk-bench",
+        # Per-UMKM rate limits would throttle single-tenant load runs;
+        # bench_admission.py turns them on
+        "ADMISSION_ENABLED": "false",
+    }
+    defaults.update(env or {})
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def install(speech_latency: Latency, llm_latency: Latency, db_latency: Latency, env: dict = None,
+            speech_faults: Faults = None, llm_faults: Faults = None):
+    """
+    Wire the fakes into the app modules. Returns the fake objects so a
+    benchmark can read call counts afterwards. A `llm_latency` or
+    `db_latency` of None keeps the real LLM client (e.g. pointed at
+    fake_llm_server.py) or the real products query.
+    """
+    configure(env)
+
+    speech_client = FakeSpeechClient(speech_latency, faults=speech_faults)
+    speech_async_client = FakeSpeechAsyncClient(speech_latency, faults=speech_faults)
+    gcp = types.ModuleType("helper.gcp")
+    gcp.get_speech_client = lambda: speech_client
+    gcp.get_speech_async_client = lambda: speech_async_client
+    sys.modules["helper.gcp"] = gcp
+
+    import services.llm as llm
+    import services.transcript as transcript
+
+    chain = None
+    if llm_latency is not None:
+        chain = FakeChain(llm_latency, faults=llm_faults)
+        llm.llm_chain = chain
+    if db_latency is not None:
+        transcript.get_product_list = fake_product_list(db_latency)
+
+    return {"speech": speech_client, "speech_async": speech_async_client, "chain": chain}
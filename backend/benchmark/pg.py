@@ -0,0 +1,129 @@
+"""
+Helpers for the benchmarks that need a real Postgres. Connection settings
+come from the usual POSTGRES_* variables (see docker-compose.yaml), e.g.
+
+    POSTGRES_USER=root POSTGRES_PASSWORD=root POSTGRES_DB=umkm python benchmark/bench_confirm.py
+"""
+from pathlib import Path
+
+from sqlalchemy import event, text
+
+SCHEMA_SQL = Path(__file__).resolve().parent / "schema.sql"
+
+
+def apply_schema(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(SCHEMA_SQL.read_text())
+
+
+def seed_products(engine, umkm_id: int, count: int, stock: int = 1_000_000_000) -> list:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM products WHERE umkm_id = :umkm_id AND NOT EXISTS ("
+                          "SELECT 1 FROM sales_items si WHERE si.product_id = products.product_id) AND NOT EXISTS ("
+                          "SELECT 1 FROM purchase_items pi WHERE pi.product_id = products.product_id)"),
+                     {"umkm_id": umkm_id})
+        existing = conn.execute(text("SELECT product_id FROM products WHERE umkm_id = :umkm_id ORDER BY product_id"),
+                                {"umkm_id": umkm_id}).scalars().all()
+        missing = count - len(existing)
+        if missing > 0:
+            conn.execute(text("""
+                INSERT INTO products (umkm_id, name, category, price, stock, is_active)
+                SELECT :umkm_id, 'Produk ' || g, 'bench', 1000 + (g % 50) * 500, :stock, TRUE
+                FROM generate_series(:start, :stop) AS g
+            """), {"umkm_id": umkm_id, "stock": stock, "start": len(existing) + 1, "stop": count})
+        conn.execute(text("UPDATE products SET stock = :stock WHERE umkm_id = :umkm_id"),
+                     {"umkm_id": umkm_id, "stock": stock})
+        return conn.execute(text("SELECT product_id FROM products WHERE umkm_id = :umkm_id ORDER BY product_id LIMIT :n"),
+                            {"umkm_id": umkm_id, "n": count}).scalars().all()
+
+
+class QueryCounter:
+    """
+    Counts statements sent on `engine` while active.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def seed_sales(engine, umkm_id: int, count: int, days: int, product_ids: list, chunk: int = 200_000):
+    """
+    Insert `count` sales spread uniformly over the last `days` days, with
+    1-3 items each drawn from `product_ids`. Inserted in chunks so a 1M+
+    seed doesn't build one huge transaction.
+    """
+    pids = list(product_ids)
+    done = 0
+    while done < count:
+        n = min(chunk, count - done)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                WITH new_sales AS (
+                    INSERT INTO sales (umkm_id, customer_name, sale_date, total_amount, transcript, status)
+                    SELECT :umkm_id, 'Seed', NOW() - random() * make_interval(days => :days),
+                           (1 + floor(random() * 20)) * 1000, 'seed transcript', 'selesai'
+                    FROM generate_series(1, :n)
+                    RETURNING sale_id
+                )
+                INSERT INTO sales_items (sale_id, product_id, quantity, unit_price)
+                SELECT s.sale_id,
+                       (CAST(:pids AS integer[]))[1 + floor(random() * :npids)],
+                       1 + floor(random() * 3), 1000
+                FROM new_sales s, generate_series(1, 1 + floor(random() * 3)::int)
+            """), {"umkm_id": umkm_id, "days": days, "n": n, "pids": pids, "npids": len(pids)})
+        done += n
+        print(f"  seeded {done}/{count} sales")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE sales"))
+        conn.execute(text("ANALYZE sales_items"))
+
+
+def seed_purchases(engine, umkm_id: int, count: int, days: int, product_ids: list, chunk: int = 200_000):
+    """
+    Same as seed_sales for purchases: 1-3 restocking items each.
+    """
+    pids = list(product_ids)
+    done = 0
+    while done < count:
+        n = min(chunk, count - done)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                WITH new_purchases AS (
+                    INSERT INTO purchases (umkm_id, supplier_id, purchase_date, total_amount, transcript)
+                    SELECT :umkm_id, 1 + floor(random() * 10), NOW() - random() * make_interval(days => :days),
+                           (1 + floor(random() * 50)) * 10000, 'seed transcript'
+                    FROM generate_series(1, :n)
+                    RETURNING purchase_id
+                )
+                INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price)
+                SELECT p.purchase_id,
+                       (CAST(:pids AS integer[]))[1 + floor(random() * :npids)],
+                       10 + floor(random() * 90), 800
+                FROM new_purchases p, generate_series(1, 1 + floor(random() * 3)::int)
+            """), {"umkm_id": umkm_id, "days": days, "n": n, "pids": pids, "npids": len(pids)})
+        done += n
+        print(f"  seeded {done}/{count} purchases")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE purchases"))
+        conn.execute(text("ANALYZE purchase_items"))
+
+
+def purchases_count(engine, umkm_id: int) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM purchases WHERE umkm_id = :umkm_id"), {"umkm_id": umkm_id}).scalar()
+
+
+def sales_count(engine, umkm_id: int) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM sales WHERE umkm_id = :umkm_id"), {"umkm_id": umkm_id}).scalar()
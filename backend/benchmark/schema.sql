@@ -0,0 +1,46 @@
+-- Minimal schema matching the tables the API reads and writes, for the
+-- benchmarks only. Safe to run repeatedly.
+CREATE TABLE IF NOT EXISTS products (
+    product_id   SERIAL PRIMARY KEY,
+    umkm_id      INTEGER NOT NULL,
+    name         VARCHAR(255) NOT NULL,
+    category     VARCHAR(100),
+    price        NUMERIC(12, 2) NOT NULL,
+    stock        INTEGER NOT NULL DEFAULT 0,
+    is_active    BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS sales (
+    sale_id       SERIAL PRIMARY KEY,
+    umkm_id       INTEGER NOT NULL,
+    customer_name VARCHAR(255),
+    sale_date     TIMESTAMP NOT NULL DEFAULT NOW(),
+    total_amount  NUMERIC(14, 2) NOT NULL,
+    transcript    TEXT,
+    status        VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS sales_items (
+    sale_item_id SERIAL PRIMARY KEY,
+    sale_id      INTEGER NOT NULL REFERENCES sales (sale_id),
+    product_id   INTEGER NOT NULL REFERENCES products (product_id),
+    quantity     INTEGER NOT NULL,
+    unit_price   NUMERIC(12, 2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS purchases (
+    purchase_id   SERIAL PRIMARY KEY,
+    umkm_id       INTEGER NOT NULL,
+    supplier_id   INTEGER,
+    purchase_date TIMESTAMP NOT NULL DEFAULT NOW(),
+    total_amount  NUMERIC(14, 2) NOT NULL,
+    transcript    TEXT
+);
+
+CREATE TABLE IF NOT EXISTS purchase_items (
+    purchase_item_id SERIAL PRIMARY KEY,
+    purchase_id      INTEGER NOT NULL REFERENCES purchases (purchase_id),
+    product_id       INTEGER NOT NULL REFERENCES products (product_id),
+    quantity         INTEGER NOT NULL,
+    unit_price       NUMERIC(12, 2) NOT NULL
+);
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The app is run from backend/app (`uvicorn main:app`), so its modules are
+# imported as top-level packages: core, services, api, ...
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from core.admission import AdmissionRejected, FairLimiter
+
+
+def test_free_slots_are_taken_without_queueing():
+    async def scenario():
+        limiter = FairLimiter("test", capacity=2, max_queue_per_tenant=1, max_wait=1, weights={})
+        await limiter.acquire(1)
+        await limiter.acquire(2)
+        return limiter.stats()
+
+    assert asyncio.run(scenario()) == {"capacity": 2, "active": 2, "queued": 0, "queued_tenants": 0}
+
+
+def test_slots_are_shared_by_weight():
+    async def scenario():
+        limiter = FairLimiter("test", capacity=1, max_queue_per_tenant=10, max_wait=5, weights={"2": 2})
+        await limiter.acquire(0)
+        granted = []
+
+        async def wait(umkm_id):
+            await limiter.acquire(umkm_id)
+            granted.append(umkm_id)
+
+        # Tenant 1 queues first, and more than its share
+        waiters = [asyncio.create_task(wait(1)) for _ in range(6)]
+        await asyncio.sleep(0)
+        waiters += [asyncio.create_task(wait(2)) for _ in range(6)]
+        await asyncio.sleep(0)
+        for _ in range(6):
+            limiter.release()
+            await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return granted
+
+    granted = asyncio.run(scenario())
+    assert granted.count(2) == 4
+    assert granted.count(1) == 2
+
+
+def test_interactive_callers_are_turned_away():
+    async def scenario():
+        limiter = FairLimiter("test", capacity=1, max_queue_per_tenant=1, max_wait=0.05, weights={})
+        await limiter.acquire(1)
+        first = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await limiter.acquire(1)
+        with pytest.raises(AdmissionRejected) as timeout:
+            await first
+        return full.value.reason, timeout.value.reason, limiter.stats()
+
+    full, timeout, stats = asyncio.run(scenario())
+    assert (full, timeout) == ("queue full", "queue timeout")
+    assert stats["active"] == 1
+
+
+def test_patient_callers_wait_past_max_wait():
+    async def scenario():
+        limiter = FairLimiter("test", capacity=1, max_queue_per_tenant=1, max_wait=0.01, weights={})
+        await limiter.acquire(1)
+        batch = asyncio.create_task(limiter.acquire(1, patient=True))
+        await asyncio.sleep(0.05)
+        limiter.release()
+        await batch
+        return limiter.stats()
+
+    assert asyncio.run(scenario())["active"] == 1
@@ -0,0 +1,136 @@
+import struct
+import subprocess
+
+import numpy as np
+import pytest
+
+import services.audio as audio
+from core.config import settings
+from services.audio import AudioRejected, parse_wav, preprocess_audio, resample, sniff_container, trim_silence
+
+
+def wav(samples: np.ndarray, rate: int, bits: int = 16, tag: int = 1, data_size: int = None) -> bytes:
+    """
+    RIFF/WAVE bytes for `samples` shaped (frames, channels) in [-1, 1].
+    """
+    channels = samples.shape[1]
+    if tag == 3:
+        raw = samples.astype("<f4").tobytes()
+    elif bits == 16:
+        raw = (samples * 32767).astype("<i2").tobytes()
+    else:
+        values = (samples * 8388607).astype("<i4").reshape(-1)
+        raw = b"".join(int(v & 0xFFFFFF).to_bytes(3, "little") for v in values)
+    fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * channels * bits // 8, channels * bits // 8, bits)
+    data_size = len(raw) if data_size is None else data_size
+    return (b"RIFF" + struct.pack("<I", 36 + len(raw)) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"data" + struct.pack("<I", data_size) + raw)
+
+
+def tone(seconds: float, rate: int, frequency: float = 440, channels: int = 1) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    return np.repeat((0.5 * np.sin(2 * np.pi * frequency * t))[:, None], channels, axis=1).astype(np.float32)
+
+
+def test_sniff_container():
+    assert sniff_container(wav(tone(0.01, 8000), 8000)) == "wav"
+    assert sniff_container(b"OggS" + bytes(40)) == "ogg"
+    assert sniff_container(b"\x1a\x45\xdf\xa3" + bytes(40)) == "webm"
+    assert sniff_container(b"hello") == "unknown"
+
+
+@pytest.mark.parametrize("bits, tag", [(16, 1), (24, 1), (32, 3)])
+def test_parse_wav_round_trips_samples(bits, tag):
+    samples = tone(0.1, 16000, channels=2)
+    decoded, rate = parse_wav(wav(samples, 16000, bits=bits, tag=tag))
+    assert rate == 16000
+    assert decoded.shape == samples.shape
+    assert np.allclose(decoded, samples, atol=1e-3)
+
+
+def test_parse_wav_reads_a_streamed_data_size():
+    samples = tone(0.1, 8000)
+    decoded, _ = parse_wav(wav(samples, 8000, data_size=0xFFFFFFFF))
+    assert decoded.shape == samples.shape
+
+
+def test_parse_wav_without_data_is_rejected():
+    with pytest.raises(AudioRejected):
+        parse_wav(wav(tone(0.01, 8000), 8000)[:36])
+
+
+def test_resample_keeps_duration_and_pitch():
+    out = resample(tone(1.0, 48000)[:, 0], 48000, 16000)
+    assert len(out) == 16000
+    spectrum = np.abs(np.fft.rfft(out))
+    assert abs(np.argmax(spectrum) * 16000 / len(out) - 440) < 2
+
+
+def test_resample_filters_what_the_target_rate_cannot_hold():
+    out = resample(tone(1.0, 48000, frequency=12000)[:, 0], 48000, 16000)
+    # Edges excluded: the filter only sees half its window there
+    assert np.sqrt(np.mean(out[100:-100] ** 2)) < 0.01
+
+
+def test_trim_silence_keeps_the_voiced_part_with_padding():
+    rate = 16000
+    silence = np.zeros(rate, dtype=np.float32)
+    clip = np.concatenate([silence, tone(0.5, rate)[:, 0], silence])
+    trimmed = trim_silence(clip, rate, threshold_db=-45, padding=0.1)
+    assert 0.6 <= len(trimmed) / rate <= 0.75
+
+
+def test_preprocess_rejects_long_audio(monkeypatch):
+    monkeypatch.setattr(settings, "AUDIO_MAX_SECONDS", 0.5)
+    with pytest.raises(AudioRejected):
+        preprocess_audio(wav(tone(1.0, 8000), 8000))
+
+
+def test_undecoded_upload_is_capped_by_size(monkeypatch):
+    monkeypatch.setattr(audio, "_decode_with_ffmpeg", lambda data: None)
+    monkeypatch.setattr(settings, "AUDIO_PASSTHROUGH_MAX_BYTES", 1000)
+    webm = b"\x1a\x45\xdf\xa3" + bytes(500)
+
+    prepared = preprocess_audio(webm)
+    assert (prepared.encoding, prepared.content) == ("WEBM_OPUS", webm)
+    with pytest.raises(AudioRejected):
+        preprocess_audio(webm + bytes(1000))
+
+
+def test_constant_level_clip_is_not_trimmed_away():
+    clip = tone(2.0, 16000)[:, 0]
+    assert len(trim_silence(clip, 16000, threshold_db=-45, padding=0.2)) == len(clip)
+
+
+def test_speech_just_above_steady_noise_is_kept():
+    rate = 16000
+    noise = 0.03 * np.random.default_rng(0).standard_normal(3 * rate).astype(np.float32)
+    clip = noise.copy()
+    # About 4 dB over the noise, which is itself over the threshold
+    clip[rate:2 * rate] += 0.05 * np.sin(2 * np.pi * 300 * np.arange(rate) / rate).astype(np.float32)
+    assert len(trim_silence(clip, rate, threshold_db=-45, padding=0.2)) == len(clip)
+
+
+def test_ffmpeg_decodes_only_up_to_the_limit(monkeypatch):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, stdout=wav(tone(0.1, 8000), 8000), stderr=b"")
+
+    monkeypatch.setattr(audio.shutil, "which", lambda path: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(audio.subprocess, "run", run)
+    monkeypatch.setattr(settings, "AUDIO_MAX_SECONDS", 60)
+    audio._decode_with_ffmpeg(b"OggS")
+    assert calls[0][calls[0].index("-t") + 1] == "61"
+
+
+def test_ffmpeg_timeout_is_rejected(monkeypatch):
+    def run(args, **kwargs):
+        raise subprocess.TimeoutExpired(args, kwargs["timeout"])
+
+    monkeypatch.setattr(audio.shutil, "which", lambda path: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(audio.subprocess, "run", run)
+    with pytest.raises(AudioRejected):
+        audio._decode_with_ffmpeg(b"OggS")
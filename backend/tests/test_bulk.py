@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import services.bulk as bulk
+from schemas.schemas import Product, TransactionFromLLM, TransactionItem
+from services.bulk import import_audio, parse_transactions_csv
+
+CATALOG = [
+    Product(product_id=1, name="Nasi Goreng", price=15000),
+    Product(product_id=2, name="Es Teh", price=5000),
+]
+
+
+def parse(rows: str):
+    data = ("ref,transaction_type,product_id,product_name,quantity,unit_price,date\n" + rows).encode()
+    return parse_transactions_csv(data, 7, CATALOG)
+
+
+def test_csv_rows_are_grouped_and_priced_from_the_catalog():
+    entries, errors = parse("a,sale,1,,2,,\na,sale,,es teh,1,,\n")
+    assert errors == []
+    [(ref, payload, occurred_at)] = entries
+    assert ref == "a" and occurred_at is None
+    assert [(i.product_id, i.quantity, i.unit_price) for i in payload.items] == [(1, 2, 15000), (2, 1, 5000)]
+
+
+@pytest.mark.parametrize("row", [
+    "a,sale,1,,-5,,",
+    "a,sale,1,,0,-100,",
+    "a,purchase,1,,1,-100,",
+    "a,sale,9,,1,,",
+])
+def test_invalid_csv_lines_are_validate_errors(row):
+    entries, errors = parse(row + "\n")
+    assert entries == []
+    assert [(e["ref"], e["stage"]) for e in errors] == [("a", "validate")]
+
+
+class Upload:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+def test_confirmed_audio_drafts_are_resolved_against_the_catalog(monkeypatch):
+    said = {
+        b"ok": [TransactionItem(product_id=1, name="nasgor", quantity=2, unit_price=1)],
+        b"unknown": [TransactionItem(product_id=99, name="sate", quantity=1, unit_price=1)],
+    }
+    written = []
+
+    async def fetch_product_list(umkm_id):
+        return CATALOG
+
+    async def generate(audio_bytes, umkm_id, limits=None, catalog=None):
+        transaction = TransactionFromLLM(umkm_id=umkm_id, transaction_type="sale", transcript="", items=said[audio_bytes])
+        return {"draft_transaction": transaction, "transcript": "", "parsed_by": "llm"}
+
+    async def save(umkm_id, result, catalog=None):
+        return {"draft_id": "stored"}
+
+    def write_batch(umkm_id, entries):
+        written.extend(payload for payload, _ in entries)
+        return {"results": [{"sale_id": n} for n, _ in enumerate(entries)], "stock": {}}
+
+    monkeypatch.setattr(bulk, "fetch_product_list", fetch_product_list)
+    monkeypatch.setattr(bulk, "generate_draft_from_audio", generate)
+    monkeypatch.setattr(bulk.draft_store, "save", save)
+    monkeypatch.setattr(bulk, "_write_batch", write_batch)
+
+    async def scenario():
+        clips = [("ok", Upload(b"ok")), ("unknown", Upload(b"unknown"))]
+        return [event async for event in import_audio(7, clips, confirm=True)]
+
+    events = asyncio.run(scenario())
+    errors = [e for e in events if e["type"] == "error"]
+    assert [(e["ref"], e["draft_id"]) for e in errors] == [("unknown", "stored")]
+    assert [(i.product_id, i.unit_price) for payload in written for i in payload.items] == [(1, 15000)]
+    assert events[-1] == {"type": "summary", "drafted": 2, "confirmed": 1, "failed": 1}
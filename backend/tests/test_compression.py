@@ -0,0 +1,64 @@
+import asyncio
+import gzip
+import zlib
+
+from core.compression import CompressionMiddleware
+
+
+def call(app, accept_encoding="gzip"):
+    """
+    Run one GET through CompressionMiddleware(app) and return
+    (response headers, body messages).
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    start, *bodies = messages
+    headers = {k.decode().lower(): v.decode() for k, v in start["headers"]}
+    return headers, bodies
+
+
+def responding(content_type, chunks):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type.encode())]})
+        for n, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": n < len(chunks) - 1})
+    return app
+
+
+def test_streaming_response_is_compressed_chunk_by_chunk():
+    chunks = [b"date,total\n" + b"2024-01-01,1000\n" * 50 for _ in range(3)]
+    headers, bodies = call(responding("text/csv", chunks))
+    assert headers["content-encoding"] == "gzip"
+    assert len(bodies) == 3
+    # Every chunk is flushed, so the client can decode what it has so far
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(bodies[0]["body"]) == chunks[0]
+    assert gzip.decompress(b"".join(b["body"] for b in bodies)) == b"".join(chunks)
+
+
+def test_small_body_is_not_compressed():
+    headers, bodies = call(responding("application/json", [b'{"ok": true}']))
+    assert "content-encoding" not in headers
+    assert bodies[0]["body"] == b'{"ok": true}'
+
+
+def test_gzipped_export_is_not_compressed_again():
+    payload = gzip.compress(b"date,total\n" * 500)
+    headers, bodies = call(responding("application/gzip", [payload]))
+    assert "content-encoding" not in headers
+    assert b"".join(b["body"] for b in bodies) == payload
+
+
+def test_without_accept_encoding_nothing_changes():
+    body = b"x" * 5000
+    headers, bodies = call(responding("text/plain", [body]), accept_encoding="")
+    assert "content-encoding" not in headers
+    assert bodies[0]["body"] == body
@@ -0,0 +1,99 @@
+import pytest
+
+import services.draft_store as draft_store
+from schemas.schemas import DraftItemEdit, Product, TransactionItem
+from services.draft_store import DraftInvalid, _apply_edits, resolve_items
+
+CATALOG = [
+    Product(product_id=1, name="Nasi Goreng", price=15000),
+    Product(product_id=2, name="Es Teh", price=5000),
+    Product(product_id=3, name="Kerupuk", price=2000),
+]
+
+
+def item(product_id, quantity, unit_price=1, name="said"):
+    return TransactionItem(product_id=product_id, name=name, quantity=quantity, unit_price=unit_price)
+
+
+def draft(transaction_type="sale"):
+    items, _ = resolve_items(transaction_type, [item(1, 2), item(2, 1)], CATALOG)
+    return {"umkm_id": 7, "transaction_type": transaction_type, "items": items}
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    lookups = []
+
+    def get_catalog(umkm_id, db):
+        lookups.append(umkm_id)
+        return CATALOG
+
+    monkeypatch.setattr(draft_store, "get_catalog", get_catalog)
+    return lookups
+
+
+def lines(items):
+    return [(i.product_id, i.name, i.quantity, i.unit_price) for i in items]
+
+
+def test_resolve_merges_and_prices_sales_from_the_catalog():
+    items, unresolved = resolve_items("sale", [item(1, 2), item(2, 1), item(1, 1, 99999)], CATALOG)
+    assert items == [
+        {"product_id": 1, "name": "Nasi Goreng", "quantity": 3, "unit_price": 15000},
+        {"product_id": 2, "name": "Es Teh", "quantity": 1, "unit_price": 5000},
+    ]
+    assert unresolved == []
+
+
+def test_resolve_keeps_the_said_price_on_purchases():
+    items, _ = resolve_items("purchase", [item(1, 2, 12000), item(2, 1, 0)], CATALOG)
+    assert [line["unit_price"] for line in items] == [12000, 5000]
+
+
+def test_resolve_sets_aside_unknown_products_and_bad_quantities():
+    items, unresolved = resolve_items("sale", [item(1, 1), item(9, 1), item(2, 0)], CATALOG)
+    assert [line["product_id"] for line in items] == [1]
+    assert [(u["product_id"], u["reason"]) for u in unresolved] == [
+        (9, "unknown_product"), (2, "invalid_quantity"),
+    ]
+
+
+def test_no_edits_keep_the_draft_without_reading_the_catalog(catalog):
+    assert lines(_apply_edits(draft(), [], db=None)) == [
+        (1, "Nasi Goreng", 2, 15000), (2, "Es Teh", 1, 5000),
+    ]
+    assert catalog == []
+
+
+def test_edits_change_remove_and_add_products(catalog):
+    edits = [
+        DraftItemEdit(product_id=1, quantity=5),
+        DraftItemEdit(product_id=2, quantity=0),
+        DraftItemEdit(product_id=3, quantity=4),
+    ]
+    assert lines(_apply_edits(draft(), edits, db=None)) == [
+        (1, "Nasi Goreng", 5, 15000), (3, "Kerupuk", 4, 2000),
+    ]
+    assert catalog == [7]
+
+
+def test_stored_draft_is_not_modified(catalog):
+    stored = draft()
+    _apply_edits(stored, [DraftItemEdit(product_id=1, quantity=5)], db=None)
+    assert stored["items"][0]["quantity"] == 2
+
+
+def test_unit_price_edits_only_on_purchases(catalog):
+    edit = [DraftItemEdit(product_id=1, quantity=1, unit_price=14000)]
+    assert lines(_apply_edits(draft("purchase"), edit, db=None))[0] == (1, "Nasi Goreng", 1, 14000)
+    with pytest.raises(DraftInvalid):
+        _apply_edits(draft("sale"), edit, db=None)
+
+
+@pytest.mark.parametrize("edit", [
+    DraftItemEdit(product_id=1, quantity=-1),
+    DraftItemEdit(product_id=9, quantity=1),
+])
+def test_invalid_edits_are_rejected(catalog, edit):
+    with pytest.raises(DraftInvalid):
+        _apply_edits(draft(), [edit], db=None)
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import services.jobs as jobs
+from services.jobs import DraftJobRunner, InMemoryJobBackend, JobQueueFull, FAILED, QUEUED
+
+
+def make_runner(**kwargs) -> DraftJobRunner:
+    options = dict(workers=1, limits={}, max_attempts=3, retry_base=0.01, max_queued=2, stale_after=60)
+    options.update(kwargs)
+    return DraftJobRunner(InMemoryJobBackend(ttl=60, max_jobs=1), **options)
+
+
+def test_submit_past_max_queued_is_rejected():
+    async def scenario():
+        runner = make_runner()
+        await runner.submit(1, b"a")
+        await runner.submit(1, b"b")
+        with pytest.raises(JobQueueFull) as raised:
+            await runner.submit(1, b"c")
+        return raised.value
+
+    assert asyncio.run(scenario()).retry_after > 0
+
+
+def test_queued_jobs_are_not_evicted():
+    async def scenario():
+        backend = InMemoryJobBackend(ttl=60, max_jobs=1)
+        submitted = [jobs.new_job(1, bytes([n])) for n in range(3)]
+        for job in submitted:
+            await backend.enqueue(job)
+        return [await backend.dequeue() for _ in submitted]
+
+    dequeued = asyncio.run(scenario())
+    assert [job["audio"] for job in dequeued] == [b"\x00", b"\x01", b"\x02"]
+    assert all(job["status"] == QUEUED for job in dequeued)
+
+
+def test_job_fails_when_storing_the_draft_fails(monkeypatch):
+    async def generate(audio_bytes, umkm_id, limits=None, pace=True):
+        return {"draft_transaction": None, "transcript": "jual", "parsed_by": "llm"}
+
+    async def save(umkm_id, result):
+        raise RuntimeError("draft store is down")
+
+    monkeypatch.setattr(jobs, "generate_draft_from_audio", generate)
+    monkeypatch.setattr(jobs.draft_store, "save", save)
+
+    async def scenario():
+        runner = make_runner()
+        await runner.start()
+        job = await runner.submit(1, b"audio")
+        try:
+            async for update in runner.watch(job["job_id"], poll_interval=0.05):
+                last = update
+        finally:
+            await runner.stop()
+        return last
+
+    job = asyncio.run(scenario())
+    assert job["status"] == FAILED
+    assert "draft store is down" in job["error"]
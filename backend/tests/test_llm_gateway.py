@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from services.llm_gateway import LLMGateway
+
+
+def run_gateway(requests_per_minute, tokens_per_minute, tokens_per_request, requests=200, seconds=3.0, max_batch=16):
+    """
+    Queue `requests` parses at once, let the gateway dispatch for `seconds`
+    and return (requests sent, tokens sent, elapsed seconds).
+    """
+    sent = []
+
+    async def batch_call(inputs):
+        sent.extend(inputs)
+        return inputs
+
+    async def main():
+        gateway = LLMGateway(
+            batch_call,
+            lambda inputs: tokens_per_request,
+            window=0.001,
+            max_batch=max_batch,
+            max_queue=10_000,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_wait=3600,
+            max_attempts=1,
+        )
+        start = time.monotonic()
+        tasks = [asyncio.create_task(gateway.submit({"n": n})) for n in range(requests)]
+        await asyncio.sleep(seconds)
+        elapsed = time.monotonic() - start
+        await gateway.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    return len(sent), len(sent) * tokens_per_request, elapsed
+
+
+def test_request_budget_smaller_than_a_batch():
+    # 5 requests per second, batches of up to 16
+    sent, _, elapsed = run_gateway(requests_per_minute=300, tokens_per_minute=10**9, tokens_per_request=1)
+    assert 0 < sent <= 5 + 5 * elapsed
+
+
+def test_token_budget():
+    # 100 tokens per second, 50 per request
+    _, tokens, elapsed = run_gateway(requests_per_minute=10**6, tokens_per_minute=6000, tokens_per_request=50)
+    assert 0 < tokens <= 100 + 100 * elapsed
+
+
+def test_request_larger_than_the_token_bucket_is_sent_once():
+    # 1000 tokens is ten seconds of budget: the first request goes out, the
+    # second has to wait for the debt to be paid off
+    sent, _, _ = run_gateway(requests_per_minute=10**6, tokens_per_minute=6000, tokens_per_request=1000, seconds=1.0)
+    assert sent == 1
@@ -0,0 +1,60 @@
+from schemas.schemas import Product
+from services.matcher import MatcherRegistry, ProductMatcher, _parse_number, normalize_tokens, split_segments
+
+CATALOG = [
+    Product(product_id=1, name="Nasi Goreng", price=15000),
+    Product(product_id=2, name="Es Teh", price=5000),
+    Product(product_id=3, name="Teh Botol", price=6000),
+    Product(product_id=4, name="Mie Ayam", price=12000),
+]
+
+
+def matched(result):
+    return [(product.product_id, quantity) for product, quantity, _, _ in result.items]
+
+
+def test_normalize_expands_slang_and_strips_nya():
+    assert normalize_tokens("Nasgor, tehnya!") == ["nasi", "goreng", "teh"]
+
+
+def test_parse_indonesian_numbers():
+    assert _parse_number(["dua", "puluh", "lima"], 0) == (25, 3)
+    assert _parse_number(["tiga", "belas"], 0) == (13, 2)
+    assert _parse_number(["sebungkus"], 0) == (1, 1)
+    assert _parse_number(["3x"], 0) == (3, 1)
+    assert _parse_number(["nasi"], 0) == (None, 0)
+
+
+def test_split_segments_on_separators_and_numbers():
+    segments = split_segments(normalize_tokens("es teh dua sama dua bungkus nasi goreng"))
+    assert [(s.phrase, s.quantity) for s in segments] == [("es teh", 2), ("nasi goreng", 2)]
+
+
+def test_classifier_in_a_product_name_is_kept():
+    matcher = ProductMatcher(CATALOG)
+    assert matched(matcher.match("dua teh botol")) == [(3, 2)]
+
+
+def test_match_is_confident_on_a_clear_sale():
+    result = ProductMatcher(CATALOG).match("nasgor dua sama es teh tiga")
+    assert matched(result) == [(1, 2), (2, 3)]
+    assert result.confident
+
+
+def test_purchase_hints_are_left_to_the_llm():
+    assert not ProductMatcher(CATALOG).match("kulakan es teh sepuluh").confident
+
+
+def test_unknown_product_is_not_confident():
+    assert not ProductMatcher(CATALOG).match("dua sate kambing").confident
+
+
+def test_candidates_rank_the_matching_product_first():
+    assert ProductMatcher(CATALOG).candidates("mie ayam", 2)[0].product_id == 4
+
+
+def test_registry_rebuilds_only_for_a_new_product_list():
+    registry = MatcherRegistry(max_entries=1)
+    matcher = registry.get(1, CATALOG)
+    assert registry.get(1, CATALOG) is matcher
+    assert registry.get(1, list(CATALOG)) is not matcher
@@ -0,0 +1,39 @@
+import pytest
+
+from core.ratelimit import TokenBucket
+
+
+def elapse(bucket: TokenBucket, seconds: float):
+    bucket.updated -= seconds
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=4)
+    assert bucket.try_acquire(4) == 0
+    assert bucket.try_acquire(1) == pytest.approx(0.5, abs=0.01)
+    elapse(bucket, 0.5)
+    assert bucket.try_acquire(1) == 0
+
+
+def test_waiting_takes_nothing():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.try_acquire(2)
+    bucket.try_acquire(1)
+    bucket.try_acquire(1)
+    elapse(bucket, 1)
+    assert bucket.try_acquire(1) == 0
+
+
+def test_refill_stops_at_capacity():
+    bucket = TokenBucket(rate=10, capacity=3)
+    elapse(bucket, 60)
+    assert bucket.try_acquire(3) == 0
+    assert bucket.wait_time(1) == pytest.approx(0.1, abs=0.01)
+
+
+def test_oversized_request_goes_through_once_full_and_leaves_debt():
+    bucket = TokenBucket(rate=2, capacity=4)
+    assert bucket.try_acquire(10) == 0
+    # 6 tokens of debt plus the 1 asked for
+    assert bucket.wait_time(1) == pytest.approx(3.5, abs=0.01)
+    assert bucket.try_acquire(10) == pytest.approx(5.0, abs=0.01)
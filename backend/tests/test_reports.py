@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from api.v1.reports import _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trips():
+    sale_date = datetime(2025, 3, 1, 14, 30, 5, 123456)
+    cursor = _encode_cursor(sale_date, 42)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == (sale_date, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", _encode_cursor(datetime(2025, 1, 1), 1)[:-3]])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as rejected:
+        _decode_cursor(cursor)
+    assert rejected.value.status_code == 400
+
+
+def report(monkeypatch, model, body, if_none_match=None):
+    from starlette.requests import Request
+
+    import api.v1.reports as reports
+
+    monkeypatch.setattr(reports, "_report_etag", lambda request, db, umkm_id: 'W/"1.abc"')
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+    return reports._report_response(request, None, "7", model, lambda: body)
+
+
+def test_report_body_is_validated_against_the_response_model(monkeypatch):
+    from pydantic import ValidationError
+
+    from schemas.schemas import TransactionSummaryResponse
+
+    body = {"umkm_id": "7", "daily": {"total_sales": 1500, "total_transactions": 1},
+            "monthly": {"total_sales": 9000, "total_transactions": 4}, "extra": "dropped"}
+    response = report(monkeypatch, TransactionSummaryResponse, body)
+    assert json.loads(response.body) == {
+        "umkm_id": "7",
+        "daily": {"total_sales": 1500.0, "total_transactions": 1},
+        "monthly": {"total_sales": 9000.0, "total_transactions": 4},
+    }
+    with pytest.raises(ValidationError):
+        report(monkeypatch, TransactionSummaryResponse, {"umkm_id": "7"})
+
+
+def test_matching_etag_skips_the_body(monkeypatch):
+    from schemas.schemas import TransactionSummaryResponse
+
+    # An invalid body would fail validation: a 304 never builds it
+    assert report(monkeypatch, TransactionSummaryResponse, None, if_none_match='W/"1.abc"').status_code == 304
@@ -0,0 +1,75 @@
+import pytest
+
+from core.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, is_retryable
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def reset_elapsed(breaker: CircuitBreaker):
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.before_call()
+    assert 0 < rejected.value.retry_after <= 30
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = open_breaker()
+    reset_elapsed(breaker)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_opens_again():
+    breaker = open_breaker()
+    reset_elapsed(breaker)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened_total"] == 2
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = open_breaker()
+    reset_elapsed(breaker)
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_retryable_errors():
+    class ServiceUnavailable(Exception):
+        pass
+
+    class HTTPError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    assert is_retryable(ServiceUnavailable())
+    assert is_retryable(TimeoutError())
+    assert is_retryable(HTTPError(429))
+    assert is_retryable(HTTPError(503))
+    assert not is_retryable(HTTPError(400))
+    assert not is_retryable(ValueError())
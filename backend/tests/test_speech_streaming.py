@@ -0,0 +1,66 @@
+import asyncio
+
+from google.api_core.exceptions import OutOfRange
+
+from services.speech import build_streaming_config, stream_speech_to_text
+
+CLUSTER = b"\x1f\x43\xb6\x75"
+WEBM_HEADER = b"\x1a\x45\xdf\xa3" + b"segment+tracks"
+
+
+class FakeSpeechClient:
+    """
+    Records the audio of every streaming session; session 0 can be closed
+    by the "server" after `fail_after` audio chunks.
+    """
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+        self.sessions = []
+
+    async def streaming_recognize(self, requests):
+        audio = []
+        self.sessions.append(audio)
+        fail_after = self.fail_after if len(self.sessions) == 1 else None
+
+        async def responses():
+            async for request in requests:
+                if request.audio_content:
+                    audio.append(request.audio_content)
+                if fail_after is not None and len(audio) == fail_after:
+                    raise OutOfRange("Exceeded maximum allowed stream duration")
+            return
+            yield
+
+        return responses()
+
+
+def run_stream(client, chunks, encoding, session_limit):
+    async def scenario():
+        queue = asyncio.Queue()
+        for chunk in [*chunks, None]:
+            queue.put_nowait(chunk)
+        config = build_streaming_config(encoding, 48000 if encoding != "LINEAR16" else 16000)
+        async for _ in stream_speech_to_text(queue, config, client=client, session_limit=session_limit):
+            pass
+
+    asyncio.run(scenario())
+    return client.sessions
+
+
+def test_webm_sessions_restart_with_the_header_at_a_cluster():
+    chunks = [WEBM_HEADER + CLUSTER + b"a1", b"a2", b"a3" + CLUSTER + b"a4", b"a5"]
+    sessions = run_stream(FakeSpeechClient(), chunks, "WEBM_OPUS", session_limit=1e-9)
+
+    assert sessions[0] == [WEBM_HEADER]
+    for audio in sessions[1:]:
+        assert audio[0] == WEBM_HEADER
+        assert audio[1].startswith(CLUSTER)
+    # Without the repeated headers, every byte was sent exactly once
+    assert b"".join(sessions[0] + [b"".join(audio[1:]) for audio in sessions[1:]]) == b"".join(chunks)
+
+
+def test_chunk_in_flight_is_replayed_after_out_of_range():
+    chunks = [b"c1", b"c2", b"c3"]
+    sessions = run_stream(FakeSpeechClient(fail_after=2), chunks, "LINEAR16", session_limit=60)
+
+    assert sessions == [[b"c1", b"c2"], [b"c2", b"c3"]]
@@ -31,10 +31,88 @@ export default function Dashboard() {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
 
+  // Penjualan baru didorong server (SSE), jadi dashboard tidak perlu polling.
+  // State diisi dari event "snapshot"; event "sale" hanya diterapkan setelahnya
   useEffect(() => {
-    fetchDashboardData()
+    const umkm_id = '1' //dummy
+    const source = new EventSource(`${API_BASE_URL}/reports/live?umkm_id=${umkm_id}`)
+    let seeded = false
+    let fellBack = false
+
+    source.addEventListener('snapshot', (message) => {
+      const snapshot = JSON.parse((message as MessageEvent).data)
+      setData(toDashboardData(snapshot.summary, snapshot.daily_sales, snapshot.last_transactions))
+      setError('')
+      setLoading(false)
+      seeded = true
+    })
+
+    source.addEventListener('sale', (message) => {
+      // Sebelum snapshot belum ada state; server tetap mengirim snapshot lebih dulu
+      if (!seeded) return
+      const event = JSON.parse((message as MessageEvent).data)
+      const now = new Date()
+      const saleDay = new Date(event.delta.day)
+      const isToday = saleDay.toDateString() === now.toDateString()
+      const isThisMonth = saleDay.getMonth() === now.getMonth() && saleDay.getFullYear() === now.getFullYear()
+      const trx = event.transaction
+
+      setData((current) => {
+        if (!current) return current
+        const day = saleDay.getDate().toString()
+        const dailySales = isThisMonth
+          ? current.dailySales.some((d) => d.day === day)
+            ? current.dailySales.map((d) => d.day === day ? { ...d, amount: d.amount + event.delta.total_sales } : d)
+            : [{ day, amount: event.delta.total_sales }, ...current.dailySales]
+          : current.dailySales
+        return {
+          ...current,
+          todayRevenue: current.todayRevenue + (isToday ? event.delta.total_sales : 0),
+          todayOrders: current.todayOrders + (isToday ? event.delta.total_transactions : 0),
+          monthlyRevenue: current.monthlyRevenue + (isThisMonth ? event.delta.total_sales : 0),
+          monthlyOrders: current.monthlyOrders + (isThisMonth ? event.delta.total_transactions : 0),
+          dailySales,
+          recentOrders: [toRecentOrder(trx), ...current.recentOrders].slice(0, 5)
+        }
+      })
+    })
+
+    source.onerror = () => {
+      // SSE belum tersambung sama sekali: muat sekali lewat REST; EventSource tetap mencoba lagi
+      if (!seeded && !fellBack) fetchDashboardData()
+      fellBack = true
+    }
+
+    return () => source.close()
   }, [])
 
+  const toRecentOrder = (trx: any) => ({
+    id: trx.sale_id?.toString() || '',
+    timestamp: trx.sale_date,
+    status: trx.status,
+    total: trx.total_amount,
+    items: Array.isArray(trx.items)
+      ? trx.items.map((item: any) => ({
+          name: item.name,
+          price: item.unit_price
+        }))
+      : []
+  })
+
+  const toDashboardData = (summaryData: any, dailySalesData: any, recentOrdersData: any): DashboardData => ({
+    todayRevenue: summaryData?.daily?.total_sales || 0,
+    todayOrders: summaryData?.daily?.total_transactions || 0,
+    monthlyRevenue: summaryData?.monthly?.total_sales || 0,
+    monthlyOrders: summaryData?.monthly?.total_transactions || 0,
+    dailySales: Array.isArray(dailySalesData)
+      ? dailySalesData.map((item: any) => ({
+          day: new Date(item.date).getDate().toString(), // hanya hari (1-31)
+          amount: item.total_amount
+        }))
+      : [],
+    recentOrders: Array.isArray(recentOrdersData) ? recentOrdersData.map(toRecentOrder) : []
+  })
+
   const fetchDashboardData = async () => {
     setLoading(true)
     setError('')
@@ -57,34 +135,7 @@ export default function Dashboard() {
 
       console.log('Recent Orders:', recentOrdersData)
 
-      const dashboardData: DashboardData = {
-        todayRevenue: summaryData?.daily?.total_sales || 0,
-        todayOrders: summaryData?.daily?.total_transactions || 0,
-        monthlyRevenue: summaryData?.monthly?.total_sales || 0,
-        monthlyOrders: summaryData?.monthly?.total_transactions || 0,
-        dailySales: Array.isArray(dailySalesData?.data)
-          ? dailySalesData.data.map((item: any) => ({
-              day: new Date(item.date).getDate().toString(), // hanya hari (1-31)
-              amount: item.total_amount
-            }))
-          : [],
-      recentOrders: Array.isArray(recentOrdersData)
-        ? recentOrdersData.map((trx: any) => ({
-            id: trx.sale_id?.toString() || '',
-            timestamp: trx.sale_date,
-            status: trx.status,
-            total: trx.total_amount,
-            items: Array.isArray(trx.items)
-              ? trx.items.map((item: any) => ({
-                  name: item.name,
-                  price: item.unit_price
-                }))
-              : []
-          }))
-        : []
-      }
-
-      setData(dashboardData)
+      setData(toDashboardData(summaryData, dailySalesData?.data, recentOrdersData))
     } catch (err) {
       console.error('Error loading dashboard data:', err)
       setError(err instanceof Error ? err.message : 'Terjadi kesalahan')
@@ -10,9 +10,11 @@ interface OrderItem {
 }
 
 interface OrderConfirmation {
+  draft_id: string;
   umkm_id: number;
   transaction_type: string;
-  supplier_id: number | null;
+  // Items as the server resolved them, to send only what the user changed
+  draftItems: OrderItem[];
   items: OrderItem[];
   total: number;
   transcript: string;
@@ -131,36 +133,36 @@ export default function OrderPage() {
       }
 
       const orderData = await response.json();
-      const { transcript,  draft_transaction } = orderData;
+      const { transcript, draft } = orderData;
       // Validate transcript and items
       if (!transcript || transcript.trim() === '') {
         setError('Could not understand your voice. Please speak clearly and try again.');
         return;
       }
-      console.log('Draft transaction:', draft_transaction.items);
-      if (!draft_transaction.items || draft_transaction.items.length === 0) {
+      // The server already checked the items against the product list and
+      // priced them; unknown products come back separately
+      if (!draft.items || draft.items.length === 0) {
         setError('No items were detected in your order. Please try again and mention specific products.');
         return;
       }
-
-      // Validate that items have required fields
-      const invalidItems = draft_transaction.items.filter((item: any) => 
-        !item.name || item.name.trim() === '' || 
-        !item.product_id || 
-        item.quantity <= 0 || 
-        item.unit_price <= 0
-      );
-
-      if (invalidItems.length > 0) {
-        setError('Some items in your order are invalid. Please try again with clear product names and quantities.');
-        return;
+      if (draft.unresolved && draft.unresolved.length > 0) {
+        showToast('info', `${draft.unresolved.length} item(s) were not found in your product list and were left out.`);
       }
 
-      const totalAmount = draft_transaction.items.reduce((sum: any, item: any) => sum + (item.unit_price * item.quantity), 0);
+      const items: OrderItem[] = draft.items.map((item: any) => ({
+        product_id: item.product_id,
+        name: item.name,
+        quantity: item.quantity,
+        unit_price: item.unit_price,
+      }));
 
       setOrderConfirmation({
-        ...draft_transaction,
-        total: totalAmount,
+        draft_id: draft.draft_id,
+        umkm_id: draft.umkm_id,
+        transaction_type: draft.transaction_type,
+        draftItems: items,
+        items,
+        total: draft.total_amount,
         transcript: transcript || 'No transcription available',
       });
 
@@ -215,22 +217,21 @@ export default function OrderPage() {
     try {
       setIsProcessing(true);
       
-      // Replace with your actual API endpoint for placing order
-      const response = await fetch(`${API_BASE_URL}/transactions/confirm`, {
+      // Only the changed quantities go back; removed items are sent as 0
+      const edits = orderConfirmation.draftItems.flatMap(original => {
+        const current = orderConfirmation.items.find(item => item.product_id === original.product_id);
+        const quantity = current ? current.quantity : 0;
+        return quantity === original.quantity ? [] : [{ product_id: original.product_id, quantity }];
+      });
+
+      const response = await fetch(`${API_BASE_URL}/transactions/drafts/${orderConfirmation.draft_id}/confirm`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
           umkm_id: orderConfirmation.umkm_id,
-          transaction_type: orderConfirmation.transaction_type,
-          supplier_id: orderConfirmation.supplier_id,
-          transcript: orderConfirmation.transcript,
-          items: orderConfirmation.items.map(item => ({
-            product_id: item.product_id,
-            quantity: item.quantity,
-            unit_price: item.unit_price,
-          })),
+          edits,
         }),
       });
 